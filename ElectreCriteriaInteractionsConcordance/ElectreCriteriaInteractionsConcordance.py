@@ -10,7 +10,10 @@ concordance for methods belonging to Electre TRI family (i.e. the ones where we
 have alternatives vs profiles comparisons).
 
 Usage:
-    ElectreCriteriaInteractionsConcordance.py -i DIR -o DIR
+    ElectreCriteriaInteractionsConcordance.py -i DIR -o DIR [--cache=DIR]
+        [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -22,6 +25,31 @@ Options:
                    performance_table.xml
                    weights.xml
     -o DIR     Specify output directory.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -41,11 +69,23 @@ from docopt import docopt
 import PyXMCDA as px
 
 from common import (
+    check_performance_table,
     comparisons_to_xmcda,
     create_messages_file,
+    get_cache_key,
+    get_criteria_params,
     get_dirs,
     get_error_message,
+    get_performance_rows,
+    get_performance_table,
     get_trees,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
@@ -102,6 +142,7 @@ def check_net_balance(interactions, weights):
             raise RuntimeError("Positive net balance condition not fulfilled for criterion '{}'.".format(criterion))
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -118,7 +159,9 @@ def get_input_data(input_dir):
     pref_directions = px.getCriteriaPreferenceDirections(trees['criteria'], criteria)
     thresholds = px.getConstantThresholds(trees['criteria'], criteria)
     weights = px.getCriterionValue(trees['weights'], criteria)
-    performances = px.getPerformanceTable(trees['performance_table'], 1, 1)
+    performances, missing = get_performance_table(trees['performance_table'], alternatives,
+                                                  criteria)
+    check_performance_table(missing, 'performance_table.xml')
     interactions = get_criteria_interactions(trees['interactions'], criteria)
 
     check_net_balance(interactions, weights)
@@ -147,31 +190,29 @@ def get_concordance(alternatives, performances, criteria, thresholds,
     else:
         raise RuntimeError("Invalid Z function: '{}'.".format(z_function))
 
-    def _omega(x, y):
+    criteria_params = get_criteria_params(criteria, pref_directions, thresholds).items()
+
+    def _get_partial_concordance(x, y, params):
         # 'x' and 'y' to keep it as general as possible
-        if pref_directions[criterion] == 'max':
-            return x - y
-        if pref_directions[criterion] == 'min':
-            return y - x
-
-    def _get_partial_concordance(x, y, criterion):
-        p = thresholds[criterion].get('preference')
-        q = thresholds[criterion].get('indifference')
-        if _omega(x, y) < -p:
+        omega = params.direction * (x - y)
+        p = params.preference
+        q = params.indifference
+        if omega < -p:
             return float(0)
-        elif _omega(x, y) >= -q:
+        elif omega >= -q:
             return float(1)
         else:
-            return (_omega(x, y) + p) / (p - q)
+            return (omega + p) / (p - q)
 
+    rows = dict(zip(alternatives, get_performance_rows(performances, alternatives, criteria)))
     partial_concordances = {}
     for a in alternatives:
         p_dict = {}
         for b in alternatives:
             c_dict = {}
-            for criterion in criteria:
-                c = _get_partial_concordance(performances[a][criterion],
-                                             performances[b][criterion], criterion)
+            for (criterion, params), performance_a, performance_b in zip(criteria_params,
+                                                                         rows[a], rows[b]):
+                c = _get_partial_concordance(performance_a, performance_b, params)
                 c_dict.update({criterion: c})
             p_dict.update({b: c_dict})
         partial_concordances.update({a: p_dict})
@@ -218,10 +259,19 @@ def get_concordance(alternatives, performances, criteria, thresholds,
     return aggregated_concordances
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -239,6 +289,8 @@ def main():
         xmcda = comparisons_to_xmcda(concordance)
         write_xmcda(xmcda, os.path.join(output_dir, 'concordance.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
@@ -12,7 +12,10 @@ circumstances.
 Please note that Electre IV is not the same method as Electre Iv.
 
 Usage:
-    ElectreIVCredibility.py -i DIR -o DIR
+    ElectreIVCredibility.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -21,6 +24,41 @@ Options:
                    criteria.xml
                    performanceTable.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed only
+               for the pairs involving new and changed alternatives.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -40,9 +78,27 @@ from lxml import etree
 import PyXMCDA as px
 
 from common import (
+    check_performance_table,
+    format_value,
+    get_cache_key,
+    get_changed_alternatives,
+    get_criteria_params,
     get_dirs,
     get_error_message,
+    get_performance_rows,
+    get_performance_table,
+    get_previous_dirs,
     get_trees,
+    getAlternativesComparisons,
+    inputs_unchanged,
+    merge_pairwise,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
     create_messages_file,
 )
@@ -50,13 +106,28 @@ from common import (
 __version__ = '0.1.0'
 
 
-def get_credibility(performances, criteria, thresholds, pref_directions):
+def get_credibility(performances, criteria, thresholds, pref_directions, changed=None):
     # XXX this function needs serious refactoring (cryptic variables, exceptions
     # used for function's flow steering)
     alt = performances.keys()
-    mtx_temp = {i: {j: 0 for j in alt} for i in alt}
-    mtx_final = {i: {j: 0 for j in alt} for i in alt}
-    pairs = [(i, j) for i in alt for j in alt]
+    criteria_params = get_criteria_params(criteria, pref_directions, thresholds).items()
+    for c, params in criteria_params:
+        if params.preference is None or params.indifference is None:
+            raise RuntimeError("Missing preference or indifference threshold for criterion "
+                               "'{}'.".format(c))
+    criteria_params = [params for _, params in criteria_params]
+    rows = dict(zip(alt, get_performance_rows(performances, alt, criteria)))
+    if changed is None:
+        pairs = [(i, j) for i in alt for j in alt]
+    else:
+        # only rows and columns of the changed alternatives (see: 'merge_pairwise')
+        changed = set(changed)
+        pairs = [(i, j) for i in alt for j in alt if i in changed or j in changed]
+    mtx_temp = {i: {} for i in alt}
+    mtx_final = {i: {} for i in alt}
+    for i, j in pairs:
+        mtx_temp[i][j] = 0
+        mtx_final[i][j] = 0
     for pair in pairs:
         # nq, nq, ni, no = number of p's, number of q's and so on
         np = nq = ni = no = 0
@@ -64,16 +135,14 @@ def get_credibility(performances, criteria, thresholds, pref_directions):
         if a == b:
             mtx_final[a][b] = 1.0
             continue
-        for c in criteria:
-            diff = performances[a][c] - performances[b][c]
-            if ((pref_directions[c] == 'max' and diff > 0) or
-                (pref_directions[c] == 'min' and diff < 0)):
-                diff = abs(diff)
-                if diff >= thresholds[c]['preference']:     #     diff >= p
+        for params, performance_a, performance_b in zip(criteria_params, rows[a], rows[b]):
+            diff = params.direction * (performance_a - performance_b)
+            if diff > 0:
+                if diff >= params.preference:     #     diff >= p
                     np += 1
-                elif diff > thresholds[c]['indifference']:  # q > diff < p
+                elif diff > params.indifference:  # q > diff < p
                     nq += 1
-                else:                                       #     diff <= q
+                else:                             #     diff <= q
                     ni += 1
             elif diff == 0:
                 no += 1
@@ -100,14 +169,12 @@ def get_credibility(performances, criteria, thresholds, pref_directions):
                     mtx_final[a][b] = 0.4
                     raise Exception
             if bSa['np'] <= 1 and aSb['np'] >= len(criteria) // 2:  # "at least half"
-                for c in criteria:
-                    diff = performances[b][c] - performances[a][c]
-                    if ((pref_directions[c] == 'max' and diff > 0) or
-                        (pref_directions[c] == 'min' and diff < 0)):
-                        diff = abs(diff)
-                        if diff > thresholds[c]['veto']:
-                            mtx_final[a][b] = 0.0
-                            raise Exception
+                for params, performance_a, performance_b in zip(criteria_params, rows[a],
+                                                                rows[b]):
+                    diff = params.direction * (performance_b - performance_a)
+                    if diff > 0 and diff > params.veto:
+                        mtx_final[a][b] = 0.0
+                        raise Exception
                 mtx_final[a][b] = 0.2
             else:
                 mtx_final[a][b] = 0.0
@@ -116,6 +183,7 @@ def get_credibility(performances, criteria, thresholds, pref_directions):
     return mtx_final
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -127,7 +195,8 @@ def get_input_data(input_dir):
     criteria = px.getCriteriaID(trees['criteria'])
     pref_directions = px.getCriteriaPreferenceDirections(trees['criteria'], criteria)
     thresholds = px.getConstantThresholds(trees['criteria'], criteria)
-    performances = px.getPerformanceTable(trees['performanceTable'], None, None)
+    performances, missing = get_performance_table(trees['performanceTable'], criteria=criteria)
+    check_performance_table(missing, 'performanceTable.xml')
 
     ret = {
         'criteria': criteria,
@@ -138,6 +207,7 @@ def get_input_data(input_dir):
     return ret
 
 
+@timed_phase('build')
 def credibility_to_xmcda(credibility):
     xmcda = etree.Element('alternativesComparisons')
     pairs = etree.SubElement(xmcda, 'pairs')
@@ -152,14 +222,23 @@ def credibility_to_xmcda(credibility):
             alt_id.text = alt2
             value = etree.SubElement(pair, 'value')
             v = etree.SubElement(value, 'real')
-            v.text = str(credibility[alt1][alt2])
+            v.text = format_value(credibility[alt1][alt2])
     return xmcda
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         performances = input_data['performances']
@@ -167,12 +246,32 @@ def main():
         thresholds = input_data['thresholds']
         pref_directions = input_data['pref_directions']
 
-        credibility = get_credibility(performances, criteria, thresholds,
-                                      pref_directions)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('criteria.xml',)
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            alternatives = performances.keys()
+            previous_trees = get_trees(previous_input_dir, ('performanceTable.xml',))
+            previous_performances, _ = get_performance_table(
+                previous_trees['performanceTable'], alternatives, criteria
+            )
+            previous_trees = get_trees(previous_output_dir, ('credibility.xml',))
+            previous_credibility = getAlternativesComparisons(previous_trees['credibility'],
+                                                              set(alternatives), (),
+                                                              keep_integers=True)
+            changed = get_changed_alternatives(alternatives, performances,
+                                               previous_performances, previous_credibility)
+            credibility = get_credibility(performances, criteria, thresholds,
+                                          pref_directions, changed=changed)
+            credibility = merge_pairwise(previous_credibility, credibility, alternatives)
+        else:
+            credibility = get_credibility(performances, criteria, thresholds,
+                                          pref_directions)
 
         xmcda = credibility_to_xmcda(credibility)
         write_xmcda(xmcda, os.path.join(output_dir, 'credibility.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
@@ -6,7 +6,11 @@ method. Resulting discordance indices are from range {0, 1}, hence "binary" in
 module's name.
 
 Usage:
-    ElectreIsDiscordanceBinary.py -i DIR -o DIR
+    ElectreIsDiscordanceBinary.py -i DIR -o DIR [--cache=DIR]
+        [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -15,6 +19,41 @@ Options:
                    criteria.xml
                    performanceTable.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed only
+               for the pairs involving new and changed alternatives.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -33,36 +72,60 @@ from lxml import etree
 import PyXMCDA as px
 
 from common import (
+    check_performance_table,
     create_messages_file,
+    get_cache_key,
+    get_changed_alternatives,
+    get_criteria_params,
     get_dirs,
     get_error_message,
+    get_performance_rows,
+    get_performance_table,
+    get_previous_dirs,
     get_trees,
+    getAlternativesComparisons,
+    inputs_unchanged,
+    merge_pairwise,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
-def get_discordances(alternatives, criteria, pref_directions, thresholds, performances):
+def get_discordances(alternatives, criteria, pref_directions, thresholds, performances,
+                     changed=None):
+    # if 'changed' is given, only the pairs involving the changed alternatives
+    # are computed (see: 'merge_pairwise')
+    changed = set(changed) if changed is not None else None
+    criteria_params = get_criteria_params(criteria, pref_directions, thresholds).items()
+    rows = dict(zip(alternatives, get_performance_rows(performances, alternatives, criteria)))
     discordances = {}
     for a in alternatives:
         b_dict = {}
         for b in alternatives:
+            if changed is not None and a not in changed and b not in changed:
+                continue
             d_dict = {}
-            for criterion in criteria:
-                if pref_directions[criterion] == 'max':  # 'gain' type criterion
-                    if (performances[b][criterion] < performances[a][criterion] +
-                            thresholds[criterion]['veto']):
+            for (criterion, params), performance_a, performance_b in zip(criteria_params,
+                                                                         rows[a], rows[b]):
+                if params.direction > 0:  # 'gain' type criterion
+                    if performance_b < performance_a + params.veto:
                         d = 0
                     else:
                         d = 1
-                else:                                    # 'cost' type criterion
-                    if (performances[b][criterion] > performances[a][criterion] -
-                            thresholds[criterion]['veto']):
+                else:                     # 'cost' type criterion
+                    if performance_b > performance_a - params.veto:
                         d = 0
                     else:
                         d = 1
-                d_dict.update({criterion: d})
+                d_dict[criterion] = d
             b_dict.update({b: d_dict})
         discordances.update({a: b_dict})
     return discordances  # 'partial' discordances (i.e. not aggregated)
@@ -83,6 +146,7 @@ def aggregate_discordances(discordances):
     return aggregated_discordances
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -95,7 +159,9 @@ def get_input_data(input_dir):
     criteria = px.getCriteriaID(trees['criteria'])
     pref_directions = px.getCriteriaPreferenceDirections(trees['criteria'], criteria)
     thresholds = px.getConstantThresholds(trees['criteria'], criteria)
-    performances = px.getPerformanceTable(trees['performanceTable'], None, None)
+    performances, missing = get_performance_table(trees['performanceTable'], alternatives,
+                                                  criteria)
+    check_performance_table(missing, 'performanceTable.xml')
 
     ret = {
         'alternatives': alternatives,
@@ -107,6 +173,7 @@ def get_input_data(input_dir):
     return ret
 
 
+@timed_phase('build')
 def aggregated_discordances_to_xmcda(aggregated_discordances):
     xmcda = etree.Element('alternativesComparisons')
     pairs = etree.SubElement(xmcda, 'pairs')
@@ -125,10 +192,19 @@ def aggregated_discordances_to_xmcda(aggregated_discordances):
     return xmcda
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -137,13 +213,36 @@ def main():
         thresholds = input_data['thresholds']
         performances = input_data['performances']
 
-        discordances = get_discordances(alternatives, criteria, pref_directions,
-                                        thresholds, performances)
-        aggregated_discordances = aggregate_discordances(discordances)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('criteria.xml',)
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir, ('performanceTable.xml',))
+            previous_performances, _ = get_performance_table(
+                previous_trees['performanceTable'], alternatives, criteria
+            )
+            previous_trees = get_trees(previous_output_dir, ('discordance_binary.xml',))
+            previous_aggregated_discordances = getAlternativesComparisons(
+                previous_trees['discordance_binary'], set(alternatives), (),
+                keep_integers=True
+            )
+            changed = get_changed_alternatives(alternatives, performances,
+                                               previous_performances,
+                                               previous_aggregated_discordances)
+            discordances = get_discordances(alternatives, criteria, pref_directions,
+                                            thresholds, performances, changed=changed)
+            aggregated_discordances = merge_pairwise(previous_aggregated_discordances,
+                                                     aggregate_discordances(discordances),
+                                                     alternatives)
+        else:
+            discordances = get_discordances(alternatives, criteria, pref_directions,
+                                            thresholds, performances)
+            aggregated_discordances = aggregate_discordances(discordances)
 
         xmcda = aggregated_discordances_to_xmcda(aggregated_discordances)
         write_xmcda(xmcda, os.path.join(output_dir, 'discordance_binary.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
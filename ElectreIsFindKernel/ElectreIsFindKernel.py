@@ -16,7 +16,10 @@ nodes, which is the default. Please note that these two methods may give
 different results.
 
 Usage:
-    ElectreIsFindKernel.py -i DIR -o DIR
+    ElectreIsFindKernel.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -25,6 +28,41 @@ Options:
                    method_parameters.xml
                    outranking.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If the graph built from the
+               outranking relation hasn't changed since then, the previous
+               kernel is reused.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -35,7 +73,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from copy import deepcopy
-import itertools as it
 import os
 import sys
 import traceback
@@ -47,12 +84,23 @@ from networkx.algorithms.cycles import simple_cycles
 import PyXMCDA as px
 
 from common import (
+    get_cache_key,
     get_dirs,
     get_error_message,
+    get_pairwise_comparisons,
+    get_previous_dirs,
     get_trees,
     get_intersection_distillation,
     check_cut_threshold,
     create_messages_file,
+    inputs_unchanged,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
@@ -72,13 +120,14 @@ def build_graph(alternatives, outranking, cut_threshold):
         graph.add_node(i)
         graph.graph.update({i: alternative})
     # creating edges...
+    indices = {alternative: i for i, alternative in enumerate(alternatives)}
     for i, alternative in enumerate(alternatives):
         relations = outranking.get(alternative)
         if not relations:  # if graph is built from intersectionDistillation
             continue
         for relation in relations.items():
             if relation[1] >= cut_threshold:
-                graph.add_edge(i, alternatives.index(relation[0]), weight=relation[1])
+                graph.add_edge(i, indices[relation[0]], weight=relation[1])
     return graph
 
 
@@ -90,6 +139,19 @@ def find_kernel(graph, eliminate_cycles_method):
                 g.remove_edge(*edge)  # '*' unpacks 'edge' tuple
         return g
 
+    def _get_first_cycle(g, C):
+        # the same as checking every combination of C's elements (starting
+        # from the shortest ones, in C's order) against all the simple cycles
+        # of the graph, but only the cycles within C are enumerated - checking
+        # them all would be exponential in the size of the graph
+        cycles = [set(c) for c in simple_cycles(g.subgraph(C))]
+        positions = {node: i for i, node in enumerate(C)}
+        combinations = [(len(c), sorted(positions[node] for node in c))
+                        for c in cycles if len(c) > 1]
+        if not combinations:
+            return []
+        return [C[i] for i in min(combinations)[1]]
+
     def _find_cycles(g):
         # XXX this function needs some serious refactoring
         # (duplicated fragments of code, cryptic variables' names etc.)
@@ -100,6 +162,9 @@ def find_kernel(graph, eliminate_cycles_method):
         for k, v in a.iteritems():
             if k in v:
                 v.remove(k)
+        # instead of traversing all the lists of successors, only the ones
+        # of node's predecessors are checked
+        predecessors = {node: g.predecessors(node) for node in g.nodes()}
         len_old = len(a)
         while len(a) > 0:
             empty_rows = []
@@ -107,8 +172,8 @@ def find_kernel(graph, eliminate_cycles_method):
             for node, succ in a.iteritems():
                 if len(succ) == 0:              # if there are no successors...
                     empty_rows.append(node)     # mark this node for removal...
-                    for i, j in a.iteritems():  # and traverse remaining lists of successors...
-                        if node in j:           # looking for previously marked node...
+                    for i in predecessors[node]:  # and traverse remaining lists of successors...
+                        if i in a and node in a[i]:   # looking for previously marked node...
                             nodes_to_remove.append((i, node))
             # actual nodes' removal (maybe dict's viewitems would simplify this?)
             for l in nodes_to_remove:  # 'l' == (row, index to remove)
@@ -120,34 +185,32 @@ def find_kernel(graph, eliminate_cycles_method):
             else:
                 len_old = len(a)
         if len(a) > 0:  # which means that there are cycles
-            # check if sequence of removed indices creates a cycle
-            cycles = filter(lambda x: len(x) > 1, [set(c) for c in simple_cycles(g)])
             # pick arbitrary row/element for removal (e.g. first one)
             len_old = len(a)
             while True:
                 # check if any combination of C's elements creates cycle
                 if len(C) > 1:
-                    c = []
-                    for m in range(2, len(C) + 1):
-                        c += [comb for comb in it.combinations(C, m)]
-                    for n in c:
-                        if set(n) in cycles:
-                            cycle = list(n)
-                            break
+                    cycle = _get_first_cycle(g, C)
                 if cycle:
                     break
                 empty_rows = []
                 nodes_to_remove = []
                 if len(a) == len_old:             # if we've just started or there are no changes...
                     if len(a) == 1:
-                        # this shouldn't happen
-                        return []
-                    a.items()[0][1].pop()         # take the first element and remove it
+                        # the last remaining node closes the cycle
+                        C.extend(a)
+                        return _get_first_cycle(g, C)
+                    # take the first element (of the first non-empty row) and
+                    # remove it - the rows emptied by the previous removal
+                    # are removed below anyway
+                    rows = [succ for succ in a.itervalues() if succ]
+                    if rows:
+                        rows[0].pop()
                 for node, succ in a.iteritems():  # check for empty rows and remove them
                     if len(succ) == 0:
                         empty_rows.append(node)
-                        for i, j in a.iteritems():
-                            if node in j:
+                        for i in predecessors[node]:
+                            if i in a and node in a[i]:
                                 nodes_to_remove.append((i, node))
                 for l in nodes_to_remove:
                     a[l[0]].remove(l[1])
@@ -170,11 +233,12 @@ def find_kernel(graph, eliminate_cycles_method):
     def _aggregate_nodes(graph, cycle):
         graph = deepcopy(graph)
         new_node = max(graph.nodes()) + 1
-        node_to_update = None
+        # aggregated nodes in the cycle are replaced with the nodes they aggregate
+        nodes_to_update = []
         for i in cycle:
             aggr = graph.node[i].get('aggr')
             if aggr:
-                node_to_update = (i, aggr)
+                nodes_to_update.append((i, aggr))
         graph.add_node(new_node, aggr=cycle)
         for node in cycle:
             for pred in graph.predecessors(node):
@@ -184,9 +248,10 @@ def find_kernel(graph, eliminate_cycles_method):
                 if succ not in cycle:
                     graph.add_edge(new_node, succ)
             graph.remove_node(node)
-        if node_to_update:
-            graph.node[new_node]['aggr'].remove(node_to_update[0])
-            graph.node[new_node]['aggr'] += node_to_update[1]
+        for node, aggr in nodes_to_update:
+            graph.node[new_node]['aggr'].remove(node)
+            graph.node[new_node]['aggr'] += aggr
+        if nodes_to_update:
             graph.node[new_node]['aggr'].sort()
         return graph
 
@@ -194,7 +259,8 @@ def find_kernel(graph, eliminate_cycles_method):
         if eliminate_cycles_method == 'cut_weakest':
             # since 'weights' can be either on all edges or on none of them,
             # we are checking just the first one
-            if not g.edges(data=True)[0][2].get('weight'):
+            edges = g.edges(data=True)
+            if edges and not edges[0][2].get('weight'):
                 raise RuntimeError("Can't use 'cut_weakest' method because input graph has no weights.")
                 # XXX maybe a fallback to 'aggregate' would be a good idea here?
             eliminate_fun = _cut_weakest
@@ -230,6 +296,14 @@ def find_kernel(graph, eliminate_cycles_method):
     return kernel, graph
 
 
+def get_outranking(xmltree, alternatives):
+    outranking = get_intersection_distillation(xmltree, alternatives)
+    if outranking == None:
+        outranking = get_pairwise_comparisons(xmltree, alternatives)
+    return outranking
+
+
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -240,9 +314,7 @@ def get_input_data(input_dir):
 
     alternatives = px.getAlternativesID(trees['alternatives'])
     alternatives.sort()
-    outranking = get_intersection_distillation(trees['outranking'], alternatives)
-    if outranking == None:
-        outranking = px.getAlternativesComparisons(trees['outranking'], alternatives)
+    outranking = get_outranking(trees['outranking'], alternatives)
     eliminate_cycles_method = px.getParameterByName(trees['method_parameters'],
                                                     'eliminate_cycles_method')
     if eliminate_cycles_method not in ['aggregate', 'cut_weakest']:
@@ -273,6 +345,7 @@ def get_kernel_as_labels(kernel, g):
     return kernel_as_labels
 
 
+@timed_phase('build')
 def kernel_to_xmcda(kernel_as_labels):
     xmcda = etree.Element('alternativesSet', mcdaConcept="kernel")
     for alternative in kernel_as_labels:
@@ -282,10 +355,19 @@ def kernel_to_xmcda(kernel_as_labels):
     return xmcda
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -294,14 +376,32 @@ def main():
         outranking = input_data['outranking']
 
         graph = build_graph(alternatives, outranking, cut_threshold)
-        # because of the 'eliminate_cycles' routine used by 'find_kernel, a graph
-        # is returned with the kernel which allows for further examination
-        kernel, graph = find_kernel(graph, eliminate_cycles_method)
 
-        kernel_as_labels = get_kernel_as_labels(kernel, graph)
+        # the kernel can't be repaired locally in general (elimination of cycles
+        # affects the whole graph), but it can be reused if the graph is the same
+        kernel_as_labels = None
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('alternatives.xml', 'method_parameters.xml')
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir, ('outranking.xml',))
+            previous_outranking = get_outranking(previous_trees['outranking'], alternatives)
+            previous_graph = build_graph(alternatives, previous_outranking, cut_threshold)
+            if sorted(graph.edges(data=True)) == sorted(previous_graph.edges(data=True)):
+                previous_trees = get_trees(previous_output_dir, ('kernel.xml',))
+                kernel_as_labels = previous_trees['kernel'].xpath(
+                    "//alternativesSet[@mcdaConcept='kernel']/element/alternativeID/text()"
+                )
+        if kernel_as_labels is None:
+            # because of the 'eliminate_cycles' routine used by 'find_kernel, a graph
+            # is returned with the kernel which allows for further examination
+            kernel, graph = find_kernel(graph, eliminate_cycles_method)
+            kernel_as_labels = get_kernel_as_labels(kernel, graph)
+
         xmcda = kernel_to_xmcda(kernel_as_labels)
         write_xmcda(xmcda, os.path.join(output_dir, 'kernel.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
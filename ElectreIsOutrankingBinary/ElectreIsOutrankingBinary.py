@@ -6,7 +6,10 @@ method. It takes discordances from range {0, 1} as an input, hence "binary" in
 its name.
 
 Usage:
-    ElectreIsOutrankingBinary.py -i DIR -o DIR
+    ElectreIsOutrankingBinary.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -16,6 +19,41 @@ Options:
                    discordance_binary.xml
                    method_parameters.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed only
+               for the pairs involving new and changed alternatives.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -36,20 +74,40 @@ import PyXMCDA as px
 from common import (
     check_cut_threshold,
     create_messages_file,
+    get_cache_key,
+    get_changed_alternatives_pairwise,
     get_dirs,
     get_error_message,
+    get_pairwise_comparisons,
+    get_previous_dirs,
     get_trees,
+    getAlternativesComparisons,
+    inputs_unchanged,
+    merge_pairwise,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
-def get_outranking_binary(alternatives, concordance, discordance_binary, cut_threshold):
+def get_outranking_binary(alternatives, concordance, discordance_binary, cut_threshold,
+                          changed=None):
+    # if 'changed' is given, only the pairs involving the changed alternatives
+    # are computed (see: 'merge_pairwise')
+    changed = set(changed) if changed is not None else None
     outranking_binary = {}
     for a in alternatives:
         b_dict = {}
         for b in alternatives:
+            if changed is not None and a not in changed and b not in changed:
+                continue
             if concordance[a][b] >= cut_threshold and discordance_binary[a][b] == 0:
                 outr = 1
             else:
@@ -59,6 +117,7 @@ def get_outranking_binary(alternatives, concordance, discordance_binary, cut_thr
     return outranking_binary
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -72,8 +131,8 @@ def get_input_data(input_dir):
     # we can also get alternatives from 'concordance.xml', therefore 'alternatives.xml'
     # can be optional - like here:
     # alternatives = list(set([i.text for i in trees['concordance'].findall(".//alternativeID")]))
-    concordance = px.getAlternativesComparisons(trees['concordance'], alternatives)
-    discordance_binary = px.getAlternativesComparisons(trees['discordance_binary'], alternatives)
+    concordance = get_pairwise_comparisons(trees['concordance'], alternatives)
+    discordance_binary = get_pairwise_comparisons(trees['discordance_binary'], alternatives)
     cut_threshold = px.getParameterByName(trees['method_parameters'], 'cut_threshold')
     check_cut_threshold(cut_threshold)
 
@@ -86,6 +145,7 @@ def get_input_data(input_dir):
     return ret
 
 
+@timed_phase('build')
 def outranking_binary_to_xmcda(outranking_binary):
     xmcda = etree.Element('alternativesComparisons')
     pairs = etree.SubElement(xmcda, 'pairs')
@@ -104,10 +164,19 @@ def outranking_binary_to_xmcda(outranking_binary):
     return xmcda
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -115,12 +184,41 @@ def main():
         discordance_binary = input_data['discordance_binary']
         cut_threshold = input_data['cut_threshold']
 
-        outranking_binary = get_outranking_binary(alternatives, concordance,
-                                                  discordance_binary, cut_threshold)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('method_parameters.xml',)
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir,
+                                       ('concordance.xml', 'discordance_binary.xml'))
+            previous_concordance = getAlternativesComparisons(previous_trees['concordance'],
+                                                              set(alternatives), ())
+            previous_discordance_binary = getAlternativesComparisons(
+                previous_trees['discordance_binary'], set(alternatives), ()
+            )
+            previous_trees = get_trees(previous_output_dir, ('outranking_binary.xml',))
+            previous_outranking_binary = getAlternativesComparisons(
+                previous_trees['outranking_binary'], set(alternatives), (),
+                keep_integers=True
+            )
+            changed = set(get_changed_alternatives_pairwise(alternatives, concordance,
+                                                            previous_concordance,
+                                                            previous_outranking_binary))
+            changed.update(get_changed_alternatives_pairwise(alternatives, discordance_binary,
+                                                             previous_discordance_binary,
+                                                             previous_outranking_binary))
+            outranking_binary = get_outranking_binary(alternatives, concordance,
+                                                      discordance_binary, cut_threshold,
+                                                      changed=changed)
+            outranking_binary = merge_pairwise(previous_outranking_binary, outranking_binary,
+                                               alternatives)
+        else:
+            outranking_binary = get_outranking_binary(alternatives, concordance,
+                                                      discordance_binary, cut_threshold)
 
         xmcda = outranking_binary_to_xmcda(outranking_binary)
         write_xmcda(xmcda, os.path.join(output_dir, 'outranking_binary.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
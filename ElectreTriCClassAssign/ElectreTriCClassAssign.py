@@ -7,8 +7,17 @@ Electre TRI-C method.
 This method uses central reference actions (profiles) instead of boundary
 actions known from Electre TRI.
 
+Instead of a single 'cut_threshold', 'method_parameters.xml' may also define
+many thresholds at once - either as a list ('cut_thresholds' parameters) or as a
+range ('cut_threshold_min', 'cut_threshold_max' and 'cut_threshold_step'). In
+such case, a separate block of affectations is written for every threshold.
+
 Usage:
-    ElectreTriCClassAssign.py -i DIR -o DIR
+    ElectreTriCClassAssign.py -i DIR -o DIR [--stability=FORMAT] [--cache=DIR]
+        [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -19,6 +28,47 @@ Options:
                    credibility.xml
                    method_parameters.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed
+               for the new and changed alternatives only (applies to a single
+               cut threshold, not to sweeps nor '--stability').
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --stability=FORMAT
+               Instead of affectations, compute the intervals of cut threshold
+               within which the assignment of each alternative doesn't change
+               and write them to 'stability.xml' (FORMAT: 'xmcda') or to
+               'stability.json' (FORMAT: 'json').
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -41,73 +91,140 @@ from common import (
     affectations_to_xmcda,
     check_cut_threshold,
     create_messages_file,
+    get_affectations,
+    get_cache_key,
     get_categories_profiles_central,
+    get_changed_alternatives,
+    get_comparisons_rows,
+    get_cut_thresholds,
     get_dirs,
     get_error_message,
+    get_previous_dirs,
+    get_stability_intervals,
     get_trees,
     getAlternativesComparisons,
-    unreverseAltComparisons,
+    inputs_unchanged,
+    merge_affectations,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    sweep_cut_thresholds,
+    timed_phase,
+    write_stability_intervals,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
-def assign_class(alternatives, categories_profiles, categories_rank, credibility, cut_threshold):
-    uc = unreverseAltComparisons( credibility, alternatives, categories_profiles,)
-    credibility_ap, credibility_pa = uc
-
+def get_ordering(categories_profiles, categories_rank):
+    """Gets profiles and categories ordered from the worst to the best."""
     # rank == 1 is the preferred category, hence 'reverse=True' below
-    categories = OrderedDict(sorted(categories_rank.items(), key=lambda t: t[1], reverse=True))
+    categories = [c for c, _ in sorted(categories_rank.items(), key=lambda t: t[1], reverse=True)]
     profiles_categories = {v: k for k, v in categories_profiles.items()}
-    profiles = [profiles_categories[key] for key in categories.keys()]
-    ass_des = []; ass_asc = []
-    for a in alternatives:
-        # direction: rank n <--- rank 1 (from the most preferred to the least preferred)
-        found_desc = False
-        for p in profiles[len(profiles) - 2:: -1]:
-            p_next = profiles[profiles.index(p) + 1]
-            if ((credibility_ap[a][p] >= cut_threshold and credibility_pa[a][p] < cut_threshold) and
-                    ((credibility_ap[a][p_next] > credibility_pa[a][p]) or
-                        # remove 2nd component of this 'or' to get 'e06_simplified_assign'
-                        (credibility_ap[a][p_next] >= credibility_pa[a][p] and
-                            (credibility_ap[a][p_next] < cut_threshold and credibility_pa[a][p_next] < cut_threshold)
-                        )
-                    )
-                ):
-                category = categories_profiles.get(p_next)
-                ass_des.append((a, category))
-                found_desc = True
-                break
-        if not found_desc:
-            # formally, here we make comparison with the 'worst' profile,
-            # but since that always returns True, we just assign to C_h+1
-            # (similar situation below - 'if not found_asc...')
-            ass_des.append((a, categories.keys()[0]))
-        # direction: rank n ---> rank 1 (from the least preferred to the most preferred profile)
-        found_asc = False
-        for p in profiles[1:]:
-            p_prev = profiles[profiles.index(p) - 1]
-            if ((credibility_pa[a][p] >= cut_threshold and credibility_ap[a][p] < cut_threshold) and
-                    ((credibility_pa[a][p_prev] > credibility_ap[a][p]) or
-                        # remove 2nd component of this 'or' to get 'e06_simplified_assign'
-                        (credibility_pa[a][p_prev] >= credibility_ap[a][p] and
-                            (credibility_ap[a][p_prev] < cut_threshold and credibility_pa[a][p_prev] < cut_threshold)
-                        )
-                    )
-                ):
-                category = categories_profiles.get(p_prev)
-                ass_asc.append((a, category))
-                found_asc = True
-                break
-        if not found_asc:
-            ass_asc.append((a, categories.keys()[-1]))
+    profiles = [profiles_categories[c] for c in categories]
+    return profiles, categories
+
+
+def _assign_alternative(c_ap, c_pa, cut_threshold, categories):
+    # 'c_ap' and 'c_pa' are alternative's rows of credibility, where
+    # categories[i] is the category of the i-th profile
+    last = len(categories) - 1
+    s_ap = [c >= cut_threshold for c in c_ap]  # aSb
+    s_pa = [c >= cut_threshold for c in c_pa]  # bSa
+    # direction: rank n <--- rank 1 (from the most preferred to the least preferred)
+    # formally, when nothing is found we make comparison with the 'worst'
+    # profile, but since that always returns True, we just assign to C_h+1
+    # (similar situation below - ascending direction)
+    descending = categories[0]
+    for i in xrange(last - 1, -1, -1):
+        if ((s_ap[i] and not s_pa[i]) and
+                ((c_ap[i + 1] > c_pa[i]) or
+                    # remove 2nd component of this 'or' to get 'e06_simplified_assign'
+                    (c_ap[i + 1] >= c_pa[i] and not s_ap[i + 1] and not s_pa[i + 1])
+                )
+            ):
+            descending = categories[i + 1]
+            break
+    # direction: rank n ---> rank 1 (from the least preferred to the most preferred profile)
+    ascending = categories[-1]
+    for i in xrange(1, last + 1):
+        if ((s_pa[i] and not s_ap[i]) and
+                ((c_pa[i - 1] > c_ap[i]) or
+                    # remove 2nd component of this 'or' to get 'e06_simplified_assign'
+                    (c_pa[i - 1] >= c_ap[i] and not s_ap[i - 1] and not s_pa[i - 1])
+                )
+            ):
+            ascending = categories[i - 1]
+            break
+    return descending, ascending
+
+
+def _get_scans(c_ap, c_pa, categories):
+    # the same rules as in '_assign_alternative', given as the intervals of cut
+    # threshold within which each of the conditions checked there holds (see:
+    # 'get_stability_intervals') - e.g. aSb_i holds for cut_threshold <= c_ap[i]
+    last = len(categories) - 1
+    descending = []
+    for i in xrange(last - 1, -1, -1):
+        lower, upper = c_pa[i], c_ap[i]  # aSb_i and not b_iSa
+        if c_ap[i + 1] > c_pa[i]:
+            pass
+        elif c_ap[i + 1] >= c_pa[i]:
+            # and neither aSb_i+1 nor b_i+1Sa
+            lower = max(lower, c_ap[i + 1], c_pa[i + 1])
+        else:
+            continue
+        descending.append((lower, upper, categories[i + 1]))
+    ascending = []
+    for i in xrange(1, last + 1):
+        lower, upper = c_ap[i], c_pa[i]  # b_iSa and not aSb_i
+        if c_pa[i - 1] > c_ap[i]:
+            pass
+        elif c_pa[i - 1] >= c_ap[i]:
+            # and neither aSb_i-1 nor b_i-1Sa
+            lower = max(lower, c_ap[i - 1], c_pa[i - 1])
+        else:
+            continue
+        ascending.append((lower, upper, categories[i - 1]))
+    return [(descending, categories[0]), (ascending, categories[-1])]
+
+
+def assign_class(alternatives, categories_profiles, categories_rank, credibility, cut_threshold):
+    profiles, categories = get_ordering(categories_profiles, categories_rank)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives, profiles)
     affectations = OrderedDict()
-    for i in zip(ass_des, ass_asc):
-        affectations[i[0][0]] = (i[0][1], i[1][1])  # (descending, ascending)
+    for a, c_ap, c_pa in zip(alternatives, credibility_ap, credibility_pa):
+        affectations[a] = _assign_alternative(c_ap, c_pa, cut_threshold, categories)
     return affectations
 
 
+def assign_class_sweep(alternatives, categories_profiles, categories_rank, credibility,
+                       cut_thresholds):
+    """Same as 'assign_class', but for many cut thresholds at once."""
+    profiles, categories = get_ordering(categories_profiles, categories_rank)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives, profiles)
+    assign = lambda c_ap, c_pa, cut_threshold: _assign_alternative(c_ap, c_pa, cut_threshold,
+                                                                   categories)
+    return sweep_cut_thresholds(alternatives, credibility_ap, credibility_pa, cut_thresholds,
+                                assign)
+
+
+def get_stability(alternatives, categories_profiles, categories_rank, credibility):
+    """
+    Computes the intervals of cut threshold within which the assignment of
+    each alternative doesn't change (see 'get_stability_intervals').
+    """
+    profiles, categories = get_ordering(categories_profiles, categories_rank)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives, profiles)
+    get_scans = lambda c_ap, c_pa: _get_scans(c_ap, c_pa, categories)
+    return get_stability_intervals(alternatives, credibility_ap, credibility_pa, get_scans)
+
+
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -124,8 +241,12 @@ def get_input_data(input_dir):
     categories_profiles = get_categories_profiles_central(trees['categoriesProfiles'])
     credibility = getAlternativesComparisons(trees['credibility'], alternatives,
                                              categories_profiles)
-    cut_threshold = px.getParameterByName(trees['method_parameters'], 'cut_threshold')
-    check_cut_threshold(cut_threshold)
+    cut_thresholds = get_cut_thresholds(trees['method_parameters'])
+    if cut_thresholds is None:
+        cut_threshold = px.getParameterByName(trees['method_parameters'], 'cut_threshold')
+        check_cut_threshold(cut_threshold)
+    else:
+        cut_threshold = None
 
     ret = {
         'alternatives': alternatives,
@@ -133,14 +254,24 @@ def get_input_data(input_dir):
         'categories_profiles': categories_profiles,
         'credibility': credibility,
         'cut_threshold': cut_threshold,
+        'cut_thresholds': cut_thresholds,
     }
     return ret
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -148,13 +279,46 @@ def main():
         categories_rank = input_data['categories_rank']
         credibility = input_data['credibility']
         cut_threshold = input_data['cut_threshold']
+        cut_thresholds = input_data['cut_thresholds']
 
-        affectations =  assign_class(alternatives, categories_profiles,
-                                     categories_rank, credibility, cut_threshold)
-
-        affectations_xmcda = affectations_to_xmcda(affectations)
-        write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
+        stability_format = args.get('--stability')
+        if stability_format:
+            intervals = get_stability(alternatives, categories_profiles,
+                                      categories_rank, credibility)
+            write_stability_intervals(intervals, output_dir, stability_format)
+        elif cut_thresholds is None:
+            previous_input_dir, previous_output_dir = get_previous_dirs(args)
+            shared_files = ('categories.xml', 'categoriesProfiles.xml',
+                            'method_parameters.xml')
+            if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir,
+                                                       shared_files):
+                previous_trees = get_trees(previous_input_dir, ('credibility.xml',))
+                previous_credibility = getAlternativesComparisons(
+                    previous_trees['credibility'], alternatives, categories_profiles
+                )
+                previous_trees = get_trees(previous_output_dir, ('affectations.xml',))
+                previous_affectations = get_affectations(previous_trees['affectations'])
+                changed = get_changed_alternatives(alternatives, credibility,
+                                                   previous_credibility, previous_affectations,
+                                                   categories_profiles)
+                affectations = assign_class(changed, categories_profiles, categories_rank,
+                                            credibility, cut_threshold)
+                affectations = merge_affectations(previous_affectations, affectations,
+                                                  alternatives)
+            else:
+                affectations = assign_class(alternatives, categories_profiles,
+                                            categories_rank, credibility, cut_threshold)
+            affectations_xmcda = affectations_to_xmcda(affectations)
+            write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
+        else:
+            affectations = assign_class_sweep(alternatives, categories_profiles,
+                                              categories_rank, credibility, cut_thresholds)
+            affectations_xmcda = [affectations_to_xmcda(a, name='cut_threshold={}'.format(t))
+                                  for t, a in affectations.items()]
+            write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
@@ -8,8 +8,17 @@ This module (along with ElectreTriConcordance, ElectreTriDiscordances and
 ElectreTriCredibility) is equal to ElectreTriExploitation module split into
 four separate parts for user's convenience.
 
+Instead of a single 'cut_threshold', 'method_parameters.xml' may also define
+many thresholds at once - either as a list ('cut_thresholds' parameters) or as a
+range ('cut_threshold_min', 'cut_threshold_max' and 'cut_threshold_step'). In
+such case, a separate block of affectations is written for every threshold.
+
 Usage:
-    ElectreTriClassAssign.py -i DIR -o DIR
+    ElectreTriClassAssign.py -i DIR -o DIR [--stability=FORMAT] [--cache=DIR]
+        [--timings=FORMAT]
+        [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -19,6 +28,47 @@ Options:
                    credibility.xml
                    method_parameters.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed
+               for the new and changed alternatives only (applies to a single
+               cut threshold, not to sweeps nor '--stability').
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --stability=FORMAT
+               Instead of affectations, compute the intervals of cut threshold
+               within which the assignment of each alternative doesn't change
+               and write them to 'stability.xml' (FORMAT: 'xmcda') or to
+               'stability.json' (FORMAT: 'json').
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -29,7 +79,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import OrderedDict
-from copy import deepcopy
 from itertools import chain
 import os
 import sys
@@ -43,83 +92,110 @@ from common import (
     affectations_to_xmcda,
     check_cut_threshold,
     create_messages_file,
+    get_affectations,
+    get_cache_key,
     get_categories_profiles_central,
+    get_changed_alternatives,
+    get_comparisons_rows,
+    get_cut_thresholds,
     get_dirs,
     get_error_message,
+    get_previous_dirs,
+    get_stability_intervals,
     get_trees,
     getAlternativesComparisons,
-    unreverseAltComparisons,
+    inputs_unchanged,
+    merge_affectations,
+    profiled,
+    restore_cached_results,
+    set_compression,
+    set_output_format,
+    start_timings,
+    store_results_in_cache,
+    sweep_cut_thresholds,
+    timed_phase,
+    write_stability_intervals,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
-def assign_class(alternatives, categories_profiles, credibility, cut_threshold):
+def get_ordering(categories_profiles):
+    """Gets profiles and categories ordered from the worst to the best."""
+    lower_profiles = {v.get('lower'): k for k, v in categories_profiles.items()}
+    categories = [lower_profiles[None]]
+    profiles = []
+    while categories_profiles[categories[-1]].get('upper') is not None:
+        profiles.append(categories_profiles[categories[-1]]['upper'])
+        categories.append(lower_profiles[profiles[-1]])
+    return profiles, categories
 
-    def _get_profiles_ordering(last_found, profiles):
-        """Gets the ordering of categories profiles."""
-        for i in categories_profiles.values():
-            if i.get('lower') == last_found:
-                if i.get('upper') is None:
-                    return
-                profiles.append(i.get('upper'))
-                last_found = profiles[-1]
-                break
-        _get_profiles_ordering(last_found, profiles)
-
-    def _get_categories_ordering():
-        categories_profiles_copy = deepcopy(categories_profiles)
-        for profile in profiles:
-            for category in categories_profiles_copy:
-                if categories_profiles_copy[category].get('upper') == profile:
-                    categories.append(category)
-                    categories_profiles_copy.pop(category)
-                    break
-            for category in categories_profiles_copy:
-                if categories_profiles_copy[category].get('lower') == profile:
-                    if category != categories[-1]:
-                        categories.append(category)
-                        categories_profiles_copy.pop(category)
-                    break
-
-    def _get_relation(alternative, profile):
-        c_ap = credibility[alternative][profile]
-        c_pa = credibility[profile][alternative]
-        if order == 'conjuctive':  # i.e. 'pessimistic'
-            if c_ap >= cut_threshold and c_pa < cut_threshold:
-                return 'preference'  # aPb
-            elif c_ap >= cut_threshold and c_pa >= cut_threshold:
-                return 'indifference'
-        elif order == 'disjunctive':  # i.e. 'optimistic'
-            if c_ap < cut_threshold and c_pa >= cut_threshold:
-                return 'preference'  # bPa
 
-    profiles = []
-    _get_profiles_ordering(None, profiles)
-    categories = []
-    _get_categories_ordering()
-
-    exploitation = OrderedDict.fromkeys(alternatives)
-    for alternative in alternatives:
-        order = 'conjuctive'  # (from 'best', i.e. b_n)
-        for p in list(enumerate(profiles))[::-1]:
-            relation = _get_relation(alternative, p[1])
-            if relation == 'indifference' or relation == 'preference':
-                conjuctive = p[0] + 1
-            else:
-                conjuctive = 0
-        order = 'disjunctive'  # (from 'worst', i.e. b_1)
-        for p in enumerate(profiles):
-            relation = _get_relation(alternative, p[1])
-            if relation == 'preference':
-                disjunctive = p[0]
-            else:
-                disjunctive = len(profiles)
-        exploitation[alternative] = (categories[conjuctive], categories[disjunctive])
+def _assign_alternative(c_ap, c_pa, cut_threshold, categories):
+    # 'c_ap' and 'c_pa' are alternative's rows of credibility against the
+    # 'worst' (b_1) and the 'best' (b_n) profile only
+    #
+    # conjuctive (i.e. 'pessimistic'), from 'best', i.e. b_n: the relation is
+    # checked against every profile and each of them overrides the result, so
+    # it's the last one visited (b_1) that decides
+    if c_ap[0] >= cut_threshold:  # aSb_1
+        conjuctive = 1
+    else:
+        conjuctive = 0
+    # disjunctive (i.e. 'optimistic'), from 'worst', i.e. b_1 - similarly, it's
+    # b_n that decides here
+    if c_ap[-1] < cut_threshold and c_pa[-1] >= cut_threshold:  # b_nPa
+        disjunctive = len(categories) - 2
+    else:
+        disjunctive = len(categories) - 1
+    return categories[conjuctive], categories[disjunctive]
+
+
+def _get_scans(c_ap, c_pa, categories):
+    # the same rules as in '_assign_alternative', given as the intervals of cut
+    # threshold within which each of the conditions checked there holds (see:
+    # 'get_stability_intervals')
+    return [
+        ([(float('-inf'), c_ap[0], categories[1])], categories[0]),  # aSb_1
+        ([(c_ap[-1], c_pa[-1], categories[-2])], categories[-1]),  # b_nPa
+    ]
+
+
+def assign_class(alternatives, categories_profiles, credibility, cut_threshold):
+    profiles, categories = get_ordering(categories_profiles)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives,
+                                                          [profiles[0], profiles[-1]])
+    exploitation = OrderedDict()
+    for alternative, c_ap, c_pa in zip(alternatives, credibility_ap, credibility_pa):
+        exploitation[alternative] = _assign_alternative(c_ap, c_pa, cut_threshold, categories)
     return exploitation
 
 
+def assign_class_sweep(alternatives, categories_profiles, credibility, cut_thresholds):
+    """Same as 'assign_class', but for many cut thresholds at once."""
+    profiles, categories = get_ordering(categories_profiles)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives,
+                                                          [profiles[0], profiles[-1]])
+    assign = lambda c_ap, c_pa, cut_threshold: _assign_alternative(c_ap, c_pa, cut_threshold,
+                                                                   categories)
+    return sweep_cut_thresholds(alternatives, credibility_ap, credibility_pa, cut_thresholds,
+                                assign)
+
+
+def get_stability(alternatives, categories_profiles, credibility):
+    """
+    Computes the intervals of cut threshold within which the assignment of
+    each alternative doesn't change (see 'get_stability_intervals').
+    """
+    profiles, categories = get_ordering(categories_profiles)
+    credibility_ap, credibility_pa = get_comparisons_rows(credibility, alternatives,
+                                                          [profiles[0], profiles[-1]])
+    get_scans = lambda c_ap, c_pa: _get_scans(c_ap, c_pa, categories)
+    return get_stability_intervals(alternatives, credibility_ap, credibility_pa, get_scans)
+
+
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -135,35 +211,82 @@ def get_input_data(input_dir):
     categories_profiles = px.getCategoriesProfiles(trees['categoriesProfiles'], categories)
     profiles_names = [p for p in cp_tree.xpath('//categoriesProfiles//alternativeID/text()')]
     credibility = getAlternativesComparisons(trees['credibility'], alternatives, profiles_names)
-    cut_threshold = px.getParameterByName(trees['method_parameters'], 'cut_threshold')
-    check_cut_threshold(cut_threshold)
+    cut_thresholds = get_cut_thresholds(trees['method_parameters'])
+    if cut_thresholds is None:
+        cut_threshold = px.getParameterByName(trees['method_parameters'], 'cut_threshold')
+        check_cut_threshold(cut_threshold)
+    else:
+        cut_threshold = None
 
     ret = {
         'alternatives': alternatives,
         'categories_profiles': categories_profiles,
         'credibility': credibility,
         'cut_threshold': cut_threshold,
+        'cut_thresholds': cut_thresholds,
+        'profiles_names': profiles_names,
     }
     return ret
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
         categories_profiles = input_data['categories_profiles']
         credibility = input_data['credibility']
         cut_threshold = input_data['cut_threshold']
+        cut_thresholds = input_data['cut_thresholds']
+        profiles_names = input_data['profiles_names']
 
-        affectations = assign_class(alternatives, categories_profiles, credibility,
-                                    cut_threshold)
-
-        affectations_xmcda = affectations_to_xmcda(affectations)
-        write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
+        stability_format = args.get('--stability')
+        if stability_format:
+            intervals = get_stability(alternatives, categories_profiles, credibility)
+            write_stability_intervals(intervals, output_dir, stability_format)
+        elif cut_thresholds is None:
+            previous_input_dir, previous_output_dir = get_previous_dirs(args)
+            shared_files = ('categoriesProfiles.xml', 'method_parameters.xml')
+            if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir,
+                                                       shared_files):
+                previous_trees = get_trees(previous_input_dir, ('credibility.xml',))
+                previous_credibility = getAlternativesComparisons(
+                    previous_trees['credibility'], alternatives, profiles_names
+                )
+                previous_trees = get_trees(previous_output_dir, ('affectations.xml',))
+                previous_affectations = get_affectations(previous_trees['affectations'])
+                changed = get_changed_alternatives(alternatives, credibility,
+                                                   previous_credibility, previous_affectations,
+                                                   profiles_names)
+                affectations = assign_class(changed, categories_profiles, credibility,
+                                            cut_threshold)
+                affectations = merge_affectations(previous_affectations, affectations,
+                                                  alternatives)
+            else:
+                affectations = assign_class(alternatives, categories_profiles,
+                                            credibility, cut_threshold)
+            affectations_xmcda = affectations_to_xmcda(affectations)
+            write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
+        else:
+            affectations = assign_class_sweep(alternatives, categories_profiles, credibility,
+                                              cut_thresholds)
+            affectations_xmcda = [affectations_to_xmcda(a, name='cut_threshold={}'.format(t))
+                                  for t, a in affectations.items()]
+            write_xmcda(affectations_xmcda, os.path.join(output_dir, 'affectations.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
@@ -11,7 +11,10 @@ ElectreTriCredibility) is equal to ElectreTriExploitation module split into
 four separate parts for user's convenience.
 
 Usage:
-    ElectreTriConcordance.py -i DIR -o DIR
+    ElectreTriConcordance.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--precision=PRECISION] [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -23,6 +26,48 @@ Options:
                    profilesPerformanceTable.xml
                    weights.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed
+               for the new and changed alternatives only.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --precision=PRECISION
+               Precision of the computed values: 'float64' (default), 'float32'
+               (relative error up to 6e-8) or 'uint16' (fixed-point, absolute
+               error up to 1.5e-5). The reduced ones take less memory and give
+               smaller output files; an assignment based on such values may
+               differ from the exact one only for alternatives whose
+               credibility is within that error from the cut threshold.
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -41,20 +86,37 @@ from docopt import docopt
 import PyXMCDA as px
 
 from common import (
+    check_performance_table,
     comparisons_to_xmcda,
     create_messages_file,
+    get_cache_key,
     get_categories_profiles_central,
+    get_changed_alternatives,
     get_concordance,
     get_dirs,
     get_error_message,
+    get_performance_table,
+    get_previous_dirs,
     get_trees,
+    getAlternativesComparisons,
+    inputs_unchanged,
+    merge_comparisons,
+    profiled,
+    restore_cached_results,
     reverseAltComparisons,
+    set_compression,
+    set_output_format,
+    set_precision,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -71,7 +133,9 @@ def get_input_data(input_dir):
     pref_directions = px.getCriteriaPreferenceDirections(trees['criteria'], criteria)
     thresholds = px.getConstantThresholds(trees['criteria'], criteria)
     weights = px.getCriterionValue(trees['weights'], criteria)
-    performances = px.getPerformanceTable(trees['performanceTable'], 1, 1)
+    performances, missing = get_performance_table(trees['performanceTable'], alternatives,
+                                                  criteria)
+    check_performance_table(missing, 'performanceTable.xml')
 
     # we can't assume that categories will be always available as a separate
     # input file, therefore it's better to extract them from categoriesProfiles
@@ -81,8 +145,10 @@ def get_input_data(input_dir):
     # - otherwise, to get 'full' categories profiles, we should use this:
     # categories_profiles = px.getCategoriesProfiles(trees['categoriesProfiles'], categories)
     categories_profiles = [p for p in cp_tree.xpath('//categoriesProfiles//alternativeID/text()')]
-    # last two args to getPerformanceTable are not used at all anyway...
-    profiles_performance_table = px.getPerformanceTable(trees['profilesPerformanceTable'], None, None)
+    profiles_performance_table, missing = get_performance_table(
+        trees['profilesPerformanceTable'], categories_profiles, criteria
+    )
+    check_performance_table(missing, 'profilesPerformanceTable.xml')
 
     ret = {
         'alternatives': alternatives,
@@ -97,10 +163,20 @@ def get_input_data(input_dir):
     return ret
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_precision(args.get('--precision'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -112,13 +188,36 @@ def main():
         thresholds = input_data['thresholds']
         weights = input_data['weights']
 
-        concordance = get_concordance(alternatives, categories_profiles, performances,
-                                      profiles_performance_table, criteria, thresholds,
-                                      pref_directions, weights)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('categoriesProfiles.xml', 'criteria.xml', 'profilesPerformanceTable.xml',
+                        'weights.xml')
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir, ('performanceTable.xml',))
+            previous_performances, _ = get_performance_table(
+                previous_trees['performanceTable'], alternatives, criteria
+            )
+            previous_trees = get_trees(previous_output_dir, ('concordance.xml',))
+            previous_concordance = getAlternativesComparisons(
+                previous_trees['concordance'], alternatives, categories_profiles,
+                keep_integers=True
+            )
+            changed = get_changed_alternatives(alternatives, performances,
+                                               previous_performances, previous_concordance)
+            concordance = get_concordance(changed, categories_profiles, performances,
+                                          profiles_performance_table, criteria, thresholds,
+                                          pref_directions, weights)
+            concordance = merge_comparisons(previous_concordance, concordance, alternatives,
+                                            categories_profiles)
+        else:
+            concordance = get_concordance(alternatives, categories_profiles, performances,
+                                          profiles_performance_table, criteria, thresholds,
+                                          pref_directions, weights)
 
         xmcda = comparisons_to_xmcda(concordance, mcdaConcept="alternativesProfilesComparisons")
         write_xmcda(xmcda, os.path.join(output_dir, 'concordance.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
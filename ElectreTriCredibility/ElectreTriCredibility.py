@@ -12,7 +12,10 @@ ElectreTriDiscordances) is equal to ElectreTriExploitation module split into
 four separate parts for user's convenience.
 
 Usage:
-    ElectreTriCredibility.py -i DIR -o DIR
+    ElectreTriCredibility.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--precision=PRECISION] [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -22,6 +25,48 @@ Options:
                    concordance.xml
                    discordances.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed
+               for the new and changed alternatives only.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --precision=PRECISION
+               Precision of the computed values: 'float64' (default), 'float32'
+               (relative error up to 6e-8) or 'uint16' (fixed-point, absolute
+               error up to 1.5e-5). The reduced ones take less memory and give
+               smaller output files; an assignment based on such values may
+               differ from the exact one only for alternatives whose
+               credibility is within that error from the cut threshold.
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -31,7 +76,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from collections import OrderedDict
+from collections import Mapping
 import os
 import sys
 import traceback
@@ -41,13 +86,27 @@ import PyXMCDA as px
 
 from common import (
     comparisons_to_xmcda,
+    ComparisonsMatrix,
     create_messages_file,
+    get_cache_key,
     get_categories_profiles_central,
+    get_changed_alternatives,
     get_dirs,
     get_error_message,
+    get_previous_dirs,
     get_trees,
     getAlternativesComparisons,
+    inputs_unchanged,
+    merge_comparisons,
+    profiled,
+    restore_cached_results,
     reverseAltComparisons,
+    set_compression,
+    set_output_format,
+    set_precision,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     unreverseAltComparisons,
     write_xmcda,
 )
@@ -55,12 +114,30 @@ from common import (
 __version__ = '0.1.0'
 
 
+def _iter_partials(discordances, alternatives, categories_profiles):
+    # partial discordances given as comparisons, in the form yielded by
+    # 'iter_discordances' from ElectreTriDiscordances
+    discordances_ap, discordances_pa = unreverseAltComparisons(discordances, alternatives,
+                                                               categories_profiles)
+    for a in alternatives:
+        discordances_ap_row = discordances_ap[a]
+        discordances_pa_row = discordances_pa[a]
+        for p in categories_profiles:
+            yield a, p, discordances_ap_row[p].values(), discordances_pa_row[p].values()
+
+
 def get_credibility(concordance, discordances, alternatives, categories_profiles):
+    # 'discordances' can be given either as comparisons (like 'concordance'), or
+    # as an iterable of (alternative, profile, d_ap, d_pa) tuples with partial
+    # discordances for each pair (e.g. 'iter_discordances' from
+    # ElectreTriDiscordances, which leaves out the ones that are 0)
 
     def _calculate_credibility_idx(concordance, discordances):
+        # 'discordances' - values of partial discordances
         index = concordance * reduce(
             lambda x, y: x * y,
-            [(1 - d) / (1 - concordance) for d in discordances.values() if d > concordance]
+            [(1 - d) / (1 - concordance) for d in discordances if d > concordance],
+            1.0,  # none of the discordances may be greater than concordance
         )
         return index
 
@@ -69,47 +146,44 @@ def get_credibility(concordance, discordances, alternatives, categories_profiles
         alternatives,
         categories_profiles,
     )
-    discordances_ap, discordances_pa = unreverseAltComparisons(
-        discordances,
-        alternatives,
-        categories_profiles,
-    )
+    if isinstance(discordances, Mapping):
+        discordances = _iter_partials(discordances, alternatives, categories_profiles)
 
-    credibility_ap = OrderedDict()
-    credibility_pa = OrderedDict()
-    for a in alternatives:
-        indices_ap = OrderedDict()
-        indices_pa = OrderedDict()
-        for p in categories_profiles:
+    credibility_ap = ComparisonsMatrix(alternatives, categories_profiles)
+    credibility_pa = ComparisonsMatrix(alternatives, categories_profiles)
+    previous_a = None
+    for a, p, d_ap, d_pa in discordances:
+        if a != previous_a:  # pairs of the same alternative usually come one after another
+            indices_ap = credibility_ap[a]
+            indices_pa = credibility_pa[a]
+            concordance_ap_row = concordance_ap[a]
+            concordance_pa_row = concordance_pa[a]
+            previous_a = a
+
+        # alternative-profile
+        if not any(d_ap):  # only zeros
+            index_ap = concordance_ap_row[p]
+        elif 1 in d_ap:  # at least one '1'
+            if not concordance_ap_row[p] < 1:
+                raise RuntimeError("When discordance == 1, concordance must be < 1.")
+            index_ap = 0
+        else:
+            C_ap = concordance_ap_row[p]
+            index_ap = _calculate_credibility_idx(C_ap, d_ap)
+
+        # profile-alternative
+        if not any(d_pa):
+            index_pa = concordance_pa_row[p]
+        elif 1 in d_pa:
+            if not concordance_pa_row[p] < 1:
+                raise RuntimeError("When discordance == 1, concordance must be < 1.")
+            index_pa = 0
+        else:
+            C_pa = concordance_pa_row[p]
+            index_pa = _calculate_credibility_idx(C_pa, d_pa)
 
-            # alternative-profile
-            if set(discordances_ap[a][p].values()) == set([0]):  # only zeros
-                index_ap = concordance_ap[a][p]
-            elif 1 in discordances_ap[a][p].values():  # at least one '1'
-                if not concordance_ap[a][p] < 1:
-                    raise RuntimeError("When discordance == 1, concordance must be < 1.")
-                index_ap = 0
-            else:
-                C_ap = concordance_ap[a][p]
-                d_ap = discordances_ap[a][p]
-                index_ap = _calculate_credibility_idx(C_ap, d_ap)
-
-            # profile-alternative
-            if set(discordances_pa[a][p].values()) == set([0]):
-                index_pa = concordance_pa[a][p]
-            elif 1 in discordances_pa[a][p].values():
-                if not concordance_pa[a][p] < 1:
-                    raise RuntimeError("When discordance == 1, concordance must be < 1.")
-                index_pa = 0
-            else:
-                C_pa = concordance_pa[a][p]
-                d_pa = discordances_pa[a][p]
-                index_pa = _calculate_credibility_idx(C_pa, d_pa)
-
-            indices_ap[p] = index_ap
-            indices_pa[p] = index_pa
-        credibility_ap[a] = indices_ap
-        credibility_pa[a] = indices_pa
+        indices_ap[p] = index_ap
+        indices_pa[p] = index_pa
 
     ret = reverseAltComparisons(
         credibility_ap,
@@ -120,6 +194,7 @@ def get_credibility(concordance, discordances, alternatives, categories_profiles
     return ret
 
 
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -145,10 +220,20 @@ def get_input_data(input_dir):
     return ret
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_precision(args.get('--precision'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         concordance = input_data['concordance']
@@ -156,13 +241,42 @@ def main():
         alternatives = input_data['alternatives']
         categories_profiles = input_data['categories_profiles']
 
-        credibility = get_credibility(concordance, discordances, alternatives,
-                                      categories_profiles)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('categoriesProfiles.xml',)
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir, ('concordance.xml', 'discordances.xml'))
+            previous_concordance = getAlternativesComparisons(
+                previous_trees['concordance'], alternatives, categories_profiles
+            )
+            previous_discordances = getAlternativesComparisons(
+                previous_trees['discordances'], alternatives, categories_profiles, partials=True
+            )
+            previous_trees = get_trees(previous_output_dir, ('credibility.xml',))
+            previous_credibility = getAlternativesComparisons(
+                previous_trees['credibility'], alternatives, categories_profiles,
+                keep_integers=True
+            )
+            changed = set(get_changed_alternatives(alternatives, concordance,
+                                                   previous_concordance, previous_credibility,
+                                                   categories_profiles))
+            changed.update(get_changed_alternatives(alternatives, discordances,
+                                                    previous_discordances, previous_credibility,
+                                                    categories_profiles))
+            changed = [a for a in alternatives if a in changed]
+            credibility = get_credibility(concordance, discordances, changed,
+                                          categories_profiles)
+            credibility = merge_comparisons(previous_credibility, credibility, alternatives,
+                                            categories_profiles)
+        else:
+            credibility = get_credibility(concordance, discordances, alternatives,
+                                          categories_profiles)
 
         xmcda = comparisons_to_xmcda(credibility,
                                      mcdaConcept="alternativesProfilesComparisons")
         write_xmcda(xmcda, os.path.join(output_dir, 'credibility.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
@@ -12,7 +12,10 @@ ElectreTriCredibility) is equal to ElectreTriExploitation module split into
 four separate parts for user's convenience.
 
 Usage:
-    ElectreTriDiscordances.py -i DIR -o DIR
+    ElectreTriDiscordances.py -i DIR -o DIR [--cache=DIR] [--timings=FORMAT]
+        [--precision=PRECISION] [--digits=N] [--layout=LAYOUT]
+        [--compression=FORMAT] [--compression-level=N]
+        [--previous-input=DIR --previous-output=DIR]
 
 Options:
     -i DIR     Specify input directory. It should contain following files
@@ -23,6 +26,48 @@ Options:
                    performanceTable.xml
                    profilesPerformanceTable.xml
     -o DIR     Specify output directory.
+    --previous-input=DIR
+               Directory with the inputs of a previous run (incremental mode,
+               requires '--previous-output' as well). If only alternatives and
+               their data have changed since then, the results are recomputed
+               for the new and changed alternatives only.
+               Note that only the computation is saved - all the current inputs,
+               as well as the previous ones needed for comparison and the
+               previous outputs, are still read and validated in full.
+    --previous-output=DIR
+               Directory with the outputs of that previous run.
+    --cache=DIR
+               Directory for caching the results. If the inputs and options
+               are the same as in some previous run, its results are reused
+               instead of being recomputed.
+    --timings=FORMAT
+               Add the times (wall and CPU) of every phase of the run (parsing,
+               validation, reading the input data, computing, building XMCDA
+               and writing) and the growth of the peak memory usage during each
+               of them, along with the peak for the whole run, to 'messages.xml'
+               as log messages (FORMAT: 'xmcda'), and to 'timings.json' as well
+               (FORMAT: 'json').
+    --precision=PRECISION
+               Precision of the computed values: 'float64' (default), 'float32'
+               (relative error up to 6e-8) or 'uint16' (fixed-point, absolute
+               error up to 1.5e-5). The reduced ones take less memory and give
+               smaller output files; an assignment based on such values may
+               differ from the exact one only for alternatives whose
+               credibility is within that error from the cut threshold.
+    --digits=N
+               Number of significant digits of the real values written (by
+               default, up to 12).
+    --layout=LAYOUT
+               Layout of the output files: 'indented' (default), 'compact'
+               (one element per line, without indentation) or 'none' (no
+               whitespace between the elements, which gives the smallest files).
+    --compression=FORMAT
+               Compress the output files with 'gzip' (which adds '.gz' to their
+               names) or 'zstd' ('.zst', requires 'zstandard' module). The
+               compressed input files are recognized automatically.
+    --compression-level=N
+               Level of the compression: 1-9 for 'gzip' (6 by default), 1-22
+               for 'zstd' (3 by default).
     --version  Show version.
     -h --help  Show this screen.
 """
@@ -32,7 +77,6 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from collections import OrderedDict
 import os
 import sys
 import traceback
@@ -41,67 +85,106 @@ from docopt import docopt
 import PyXMCDA as px
 
 from common import (
+    check_performance_table,
     comparisons_to_xmcda,
+    ComparisonsMatrix,
     create_messages_file,
+    get_cache_key,
     get_categories_profiles_central,
+    get_changed_alternatives,
+    get_criteria_params,
     get_dirs,
     get_error_message,
+    get_partial_lookup,
+    get_performance_rows,
+    get_performance_table,
+    get_previous_dirs,
     get_trees,
+    getAlternativesComparisons,
+    inputs_unchanged,
+    merge_comparisons,
+    PARTIALS_CACHE_SIZE,
+    profiled,
+    restore_cached_results,
     reverseAltComparisons,
+    set_compression,
+    set_output_format,
+    set_precision,
+    start_timings,
+    store_results_in_cache,
+    timed_phase,
     write_xmcda,
 )
 
 __version__ = '0.1.0'
 
 
-def get_discordances(alternatives, categories_profiles, criteria, thresholds,
-                     performances, pref_directions, profiles_performance_table):
+def _get_partials_lookup(categories_profiles, criteria, thresholds, pref_directions,
+                         profiles_performance_table, cache_size):
+    # parameters of the criteria and the lookup of partial discordances of
+    # given performance with all the profiles (see: 'get_partial_lookup')
+    criteria_params = get_criteria_params(criteria, pref_directions, thresholds)
+    profiles_rows = get_performance_rows(profiles_performance_table, categories_profiles,
+                                         criteria)
+    profiles_columns = {c: [row[i] for row in profiles_rows] for i, c in enumerate(criteria)}
 
-    def _omega(x, y):
-        # 'x' and 'y' to keep it as general as possible
-        if pref_directions[criterion] == 'max':
-            return x - y
-        if pref_directions[criterion] == 'min':
-            return y - x
-
-    def _get_partial_discordances(x, y, criterion):
-        p = thresholds[criterion].get('preference')
-        v = thresholds[criterion].get('veto')
+    def _get_partial_discordances(x, y, params):
+        p = params.preference
+        v = params.veto
         if not v:
             return 0
-        if _omega(x, y) >= -p:
+        # 'x' and 'y' to keep it as general as possible
+        omega = params.direction * (x - y)
+        if omega >= -p:
             return 0
-        elif _omega(x, y) < -v:
+        elif omega < -v:
             return 1
         else:
-            return (_omega(x, y) + p) / (p - v)
-
-    discordances_ap = OrderedDict()
-    discordances_pa = OrderedDict()
-    for a in alternatives:
-        p_dict_ap = OrderedDict()
-        p_dict_pa = OrderedDict()
-        for p in categories_profiles:
-            d_dict_ap = OrderedDict()
-            d_dict_pa = OrderedDict()
-            for criterion in criteria:
-
-                # compare alternatives with profiles
-                x = performances[a][criterion]
-                y = profiles_performance_table[p][criterion]
-                d_ap = _get_partial_discordances(x, y, criterion)
-
-                # compare profiles with alternatives
-                x = profiles_performance_table[p][criterion]
-                y = performances[a][criterion]
-                d_pa = _get_partial_discordances(x, y, criterion)
-
-                d_dict_ap.update({criterion: d_ap})
-                d_dict_pa.update({criterion: d_pa})
-            p_dict_ap.update({p: d_dict_ap})
-            p_dict_pa.update({p: d_dict_pa})
-        discordances_ap.update({a: p_dict_ap})
-        discordances_pa.update({a: p_dict_pa})
+            return (omega + p) / (p - v)
+
+    def _get_partial_discordances_with_profiles(criterion, performance):
+        # lists of partial discordances, in the order of the profiles
+        params = criteria_params[criterion]
+        d_ap = []
+        d_pa = []
+        for profile_performance in profiles_columns[criterion]:
+
+            # compare alternatives with profiles
+            x = performance
+            y = profile_performance
+            d_ap.append(_get_partial_discordances(x, y, params))
+
+            # compare profiles with alternatives
+            x = profile_performance
+            y = performance
+            d_pa.append(_get_partial_discordances(x, y, params))
+
+        return d_ap, d_pa
+
+    lookup = get_partial_lookup(_get_partial_discordances_with_profiles, cache_size)
+    return criteria_params, lookup
+
+
+def get_discordances(alternatives, categories_profiles, criteria, thresholds,
+                     performances, pref_directions, profiles_performance_table,
+                     cache_size=PARTIALS_CACHE_SIZE):
+
+    criteria_params, lookup = _get_partials_lookup(categories_profiles, criteria, thresholds,
+                                                   pref_directions, profiles_performance_table,
+                                                   cache_size)
+    discordances_ap = ComparisonsMatrix(alternatives, categories_profiles, criteria)
+    discordances_pa = ComparisonsMatrix(alternatives, categories_profiles, criteria)
+    rows = get_performance_rows(performances, alternatives, criteria)
+    # one criterion at a time, for all the alternatives - only the criteria
+    # with veto have to be computed, for the rest discordances are all 0
+    for i, criterion in enumerate(criteria):
+        if not criteria_params[criterion].veto:
+            discordances_ap.fill_layer(criterion, 0)
+            discordances_pa.fill_layer(criterion, 0)
+            continue
+        partials = [lookup(criterion, row[i]) for row in rows]
+        discordances_ap.set_layer(criterion, [d_ap for d_ap, _ in partials])
+        discordances_pa.set_layer(criterion, [d_pa for _, d_pa in partials])
 
     ret = reverseAltComparisons(
         discordances_ap,
@@ -112,6 +195,30 @@ def get_discordances(alternatives, categories_profiles, criteria, thresholds,
     return ret
 
 
+def iter_discordances(alternatives, categories_profiles, criteria, thresholds,
+                      performances, pref_directions, profiles_performance_table,
+                      cache_size=PARTIALS_CACHE_SIZE):
+    """
+    Lazy version of 'get_discordances' - yields (alternative, profile, d_ap,
+    d_pa) tuples, one pair at a time, where 'd_ap' and 'd_pa' are the lists of
+    partial discordances for the criteria with veto (for the rest they're all
+    0, so they're left out).
+
+    It can be given to 'get_credibility' (ElectreTriCredibility) instead of
+    the discordances, so they're never kept in memory all at once.
+    """
+    criteria_params, lookup = _get_partials_lookup(categories_profiles, criteria, thresholds,
+                                                   pref_directions, profiles_performance_table,
+                                                   cache_size)
+    veto_criteria = [(i, c) for i, c in enumerate(criteria) if criteria_params[c].veto]
+    rows = get_performance_rows(performances, alternatives, criteria)
+    for a, row in zip(alternatives, rows):
+        partials = [lookup(criterion, row[i]) for i, criterion in veto_criteria]
+        for j, p in enumerate(categories_profiles):
+            yield (a, p, [d_ap[j] for d_ap, _ in partials], [d_pa[j] for _, d_pa in partials])
+
+
+@timed_phase('input')
 def get_input_data(input_dir):
     file_names = (
         'alternatives.xml',
@@ -126,11 +233,16 @@ def get_input_data(input_dir):
     criteria = px.getCriteriaID(trees['criteria'])
     pref_directions = px.getCriteriaPreferenceDirections(trees['criteria'], criteria)
     thresholds = px.getConstantThresholds(trees['criteria'], criteria)
-    performances = px.getPerformanceTable(trees['performanceTable'], None, None)
-    profiles_performance_table = px.getPerformanceTable(trees['profilesPerformanceTable'], None, None)
+    performances, missing = get_performance_table(trees['performanceTable'], alternatives,
+                                                  criteria)
+    check_performance_table(missing, 'performanceTable.xml')
     cp_tree = trees['categoriesProfiles']
     # we need only categories profiles' names
     categories_profiles = [p for p in cp_tree.xpath('//categoriesProfiles//alternativeID/text()')]
+    profiles_performance_table, missing = get_performance_table(
+        trees['profilesPerformanceTable'], categories_profiles, criteria
+    )
+    check_performance_table(missing, 'profilesPerformanceTable.xml')
 
     ret = {
         'alternatives': alternatives,
@@ -144,10 +256,20 @@ def get_input_data(input_dir):
     return ret
 
 
+@profiled
 def main():
     try:
         args = docopt(__doc__, version=__version__)
         input_dir, output_dir = get_dirs(args)
+        start_timings(args.get('--timings'))
+        set_precision(args.get('--precision'))
+        set_output_format(args.get('--digits'), args.get('--layout'))
+        set_compression(args.get('--compression'), args.get('--compression-level'))
+        cache_dir = args.get('--cache')
+        if cache_dir:
+            cache_key = get_cache_key(args, __file__, __version__)
+            if restore_cached_results(cache_dir, cache_key, output_dir):
+                return 0
         input_data = get_input_data(input_dir)
 
         alternatives = input_data['alternatives']
@@ -158,14 +280,36 @@ def main():
         pref_directions = input_data['pref_directions']
         profiles_performance_table = input_data['profiles_performance_table']
 
-        discordances = get_discordances(alternatives, categories_profiles, criteria,
-                                        thresholds, performances, pref_directions,
-                                        profiles_performance_table)
+        previous_input_dir, previous_output_dir = get_previous_dirs(args)
+        shared_files = ('categoriesProfiles.xml', 'criteria.xml', 'profilesPerformanceTable.xml')
+        if previous_input_dir and inputs_unchanged(input_dir, previous_input_dir, shared_files):
+            previous_trees = get_trees(previous_input_dir, ('performanceTable.xml',))
+            previous_performances, _ = get_performance_table(
+                previous_trees['performanceTable'], alternatives, criteria
+            )
+            previous_trees = get_trees(previous_output_dir, ('discordances.xml',))
+            previous_discordances = getAlternativesComparisons(
+                previous_trees['discordances'], alternatives, categories_profiles, partials=True,
+                keep_integers=True
+            )
+            changed = get_changed_alternatives(alternatives, performances,
+                                               previous_performances, previous_discordances)
+            discordances = get_discordances(changed, categories_profiles, criteria,
+                                            thresholds, performances, pref_directions,
+                                            profiles_performance_table)
+            discordances = merge_comparisons(previous_discordances, discordances, alternatives,
+                                             categories_profiles)
+        else:
+            discordances = get_discordances(alternatives, categories_profiles, criteria,
+                                            thresholds, performances, pref_directions,
+                                            profiles_performance_table)
 
         xmcda = comparisons_to_xmcda(discordances, partials=True,
                                      mcdaConcept="alternativesProfilesComparisons")
         write_xmcda(xmcda, os.path.join(output_dir, 'discordances.xml'))
         create_messages_file(('Everything OK.',), None, output_dir)
+        if cache_dir:
+            store_results_in_cache(cache_dir, cache_key, output_dir)
         return 0
     except Exception, err:
         traceback.print_exc()
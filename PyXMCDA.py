@@ -89,13 +89,25 @@ def validateXMCDA (xmltree):
 	return ret
 
 
+# Schemas already loaded, so that each one is fetched only once per process
+_xmlschemas = {}
+
+
+def getSchema (xsdURL):
+	"Returns the (cached) xml schema found at xsdURL"
+	xmlschema = _xmlschemas.get(xsdURL)
+	if xmlschema is None :
+		# TODO (sbigaret) explain that!
+		xmlschema_doc = etree.parse(xsdURL,
+		                            etree.XMLParser(no_network=False))
+		xmlschema = etree.XMLSchema(xmlschema_doc)
+		_xmlschemas[xsdURL] = xmlschema
+	return xmlschema
+
+
 def validate (xmltree, xsdURL):
 	"Checks if xmltree is valid wrt the supplied xml schema"
-	# TODO (sbigaret) explain that!
-	xmlschema_doc = etree.parse(xsdURL,
-	                            etree.XMLParser(no_network=False))
-	xmlschema = etree.XMLSchema(xmlschema_doc)
-	return xmlschema.validate(xmltree)
+	return getSchema(xsdURL).validate(xmltree)
 
 
 ##########################################################################
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+batch - runs a module over many input directories in a single process (or
+rather in a pool of worker processes forked from it), so the start of the
+interpreter, the imports and the loading of XMCDA schemas are paid only once,
+and the input files shared by the problems (e.g. criteria or profiles) are
+parsed only once per worker (as long as they fit in its cache of parsed files,
+see: 'PARSED_TREES_CACHE_BYTES' in 'common.py').
+
+Every job is processed by module's regular 'main' (with the settings left by
+the previous job reset), so the results (including 'messages.xml' written to
+every output directory) are the same as when running the module directly.
+
+MANIFEST is a text file with one job per line: input and output directory
+separated by whitespace (output directories are created if necessary). Empty
+lines and lines starting with '#' are ignored. Additional ARGS (e.g.
+'--stability=json') are passed to the module in every job.
+
+Usage:
+    batch.py [--jobs=N] [--report=FILE] MODULE MANIFEST [ARGS...]
+
+Options:
+    --jobs=N       Number of worker processes [default: 1].
+    --report=FILE  Write a summary of all the jobs (their exit codes, errors
+                   and timings) to FILE, in JSON format.
+    --version      Show version.
+    -h --help      Show this screen.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from multiprocessing import Pool
+import json
+import os
+import sys
+import time
+
+from docopt import docopt
+
+from daemon import MODULES, load_modules, run_module
+
+__version__ = '0.1.0'
+
+# module being run, loaded before the pool of workers is created, so it's
+# imported only once and then inherited by the workers
+_module = None
+
+
+def get_jobs(manifest):
+    jobs = []
+    with open(manifest) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            dirs = line.split()
+            if len(dirs) != 2:
+                raise RuntimeError("Invalid line {} in manifest '{}'.".format(line_no, manifest))
+            jobs.append(tuple(dirs))
+    return jobs
+
+
+def run_job(job):
+    input_dir, output_dir, args = job
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    start = time.time()
+    result = run_module(_module, ['-i', input_dir, '-o', output_dir] + args, os.getcwd())
+    result.update({
+        'input_dir': input_dir,
+        'output_dir': output_dir,
+        'time': round(time.time() - start, 3),
+    })
+    return result
+
+
+def main():
+    global _module
+    args = docopt(__doc__, version=__version__, options_first=True)
+    module_name = args['MODULE']
+    if module_name not in MODULES:
+        print("Unknown module: '{}'.".format(module_name), file=sys.stderr)
+        return 1
+    jobs = [(i, o, args['ARGS']) for i, o in get_jobs(args['MANIFEST'])]
+    _module = load_modules((module_name,))[module_name]
+
+    start = time.time()
+    processes = int(args['--jobs'])
+    if processes > 1:
+        pool = Pool(processes)
+        results = pool.map(run_job, jobs, chunksize=max(1, len(jobs) // (processes * 4)))
+        pool.close()
+        pool.join()
+    else:
+        results = map(run_job, jobs)
+    failed = [r for r in results if r['exit_code'] != 0]
+
+    for r in failed:
+        print("Failed: '{}' (exit code {}).".format(r['input_dir'], r['exit_code']),
+              file=sys.stderr)
+    print("{} jobs, {} failed, {:.3f} s.".format(len(results), len(failed), time.time() - start))
+    if args['--report']:
+        report = {
+            'module': module_name,
+            'jobs': len(results),
+            'failed': len(failed),
+            'results': results,
+        }
+        with open(args['--report'], 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
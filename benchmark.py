@@ -0,0 +1,574 @@
+#!/usr/bin/env python
+
+"""
+benchmark - measures how much time the modules spend on parsing their inputs,
+computing the results and writing them, using synthetic problems of given
+size.
+
+'generate' writes a problem into DIR, with a sub-directory (containing all the
+input files) for every module. The problems are generated from a seed, so the
+same options always give the same problem. Please note that the inputs of the
+modules which normally take the results of other modules (e.g. credibility
+taking concordance and discordances) are generated directly, so every module
+can be measured on its own.
+
+'run' generates a problem in a temporary directory and runs given modules (all
+of them by default) on it, repeating every run a few times and taking the
+fastest one. Every run is done in a separate (forked) process, so a module
+exceeding the time limit (see: '--timeout') is simply reported as failed. The
+timings are printed and can be saved in JSON format, so they can be compared
+with the timings from some previous run (see: '--baseline').
+
+Usage:
+    benchmark.py generate [options] DIR
+    benchmark.py run [options] [--repeat=N] [--timeout=SECONDS] [--report=FILE]
+                     [--baseline=FILE] [MODULE...]
+
+Options:
+    --alternatives=N    Number of alternatives [default: 100].
+    --criteria=N        Number of criteria [default: 10].
+    --profiles=N        Number of profiles [default: 5].
+    --veto-density=D    Fraction of criteria with veto thresholds (and thus
+                        with non-zero discordances) [default: 0.5].
+    --cycle-density=D   Fraction of the outranking relations (used for
+                        finding the kernel) which go 'backwards', creating
+                        cycles in the outranking graph [default: 0.05].
+    --seed=N            Seed for the generator [default: 0].
+    --repeat=N          Number of runs of every module [default: 3].
+    --timeout=SECONDS   Time limit for a single run of a module (the module
+                        is reported as failed when exceeded) [default: 300].
+    --report=FILE       Write the timings to FILE, in JSON format.
+    --baseline=FILE     Compare the timings with the ones from FILE (written
+                        by '--report' in some previous run).
+    --version           Show version.
+    -h --help           Show this screen.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from multiprocessing import Pool, TimeoutError
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+from lxml import etree
+
+from common import comparisons_to_xmcda, write_xmcda
+from daemon import MODULES, load_modules, run_module
+
+__version__ = '0.1.0'
+
+PHASES = ('parse', 'compute', 'write')
+
+# modules being benchmarked, loaded before the runs, so they're imported only
+# once and then inherited by the (forked) processes doing the runs
+_modules = None
+
+# every module's input files, as (file name, kind of the data) - see:
+# 'ProblemGenerator'
+INPUTS = {
+    'ElectreCriteriaInteractionsConcordance': (
+        ('alternatives.xml', 'alternatives'),
+        ('criteria.xml', 'criteria'),
+        ('interactions.xml', 'interactions'),
+        ('method_parameters.xml', 'z_function'),
+        ('performance_table.xml', 'performance_table'),
+        ('weights.xml', 'weights'),
+    ),
+    'ElectreIVCredibility': (
+        ('alternatives.xml', 'alternatives'),
+        ('criteria.xml', 'criteria'),
+        ('performanceTable.xml', 'performance_table'),
+    ),
+    'ElectreIsDiscordanceBinary': (
+        ('alternatives.xml', 'alternatives'),
+        ('criteria.xml', 'criteria_vetoes'),
+        ('performanceTable.xml', 'performance_table'),
+    ),
+    'ElectreIsFindKernel': (
+        ('alternatives.xml', 'alternatives'),
+        ('method_parameters.xml', 'kernel_parameters'),
+        ('outranking.xml', 'outranking'),
+    ),
+    'ElectreIsOutrankingBinary': (
+        ('alternatives.xml', 'alternatives'),
+        ('concordance.xml', 'concordance'),
+        ('discordance_binary.xml', 'discordance_binary'),
+        ('method_parameters.xml', 'cut_threshold'),
+    ),
+    'ElectreTriCClassAssign': (
+        ('alternatives.xml', 'alternatives'),
+        ('categories.xml', 'categories_central'),
+        ('categoriesProfiles.xml', 'categories_profiles_central'),
+        ('credibility.xml', 'credibility'),
+        ('method_parameters.xml', 'cut_threshold'),
+    ),
+    'ElectreTriCConcordance': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_central'),
+        ('criteria.xml', 'criteria'),
+        ('performanceTable.xml', 'performance_table'),
+        ('profilesPerformanceTable.xml', 'profiles_performance_table'),
+        ('weights.xml', 'weights'),
+    ),
+    'ElectreTriCCredibility': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_central'),
+        ('concordance.xml', 'profiles_concordance'),
+        ('discordances.xml', 'profiles_discordances'),
+    ),
+    'ElectreTriCDiscordances': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_central'),
+        ('criteria.xml', 'criteria'),
+        ('performanceTable.xml', 'performance_table'),
+        ('profilesPerformanceTable.xml', 'profiles_performance_table'),
+    ),
+    'ElectreTriCSimplifiedClassAssign': (
+        ('alternatives.xml', 'alternatives'),
+        ('categories.xml', 'categories_central'),
+        ('categoriesProfiles.xml', 'categories_profiles_central'),
+        ('credibility.xml', 'credibility'),
+        ('method_parameters.xml', 'cut_threshold'),
+    ),
+    'ElectreTriClassAssign': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_limits'),
+        ('credibility.xml', 'credibility'),
+        ('method_parameters.xml', 'cut_threshold'),
+    ),
+    'ElectreTriConcordance': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_limits'),
+        ('criteria.xml', 'criteria'),
+        ('performanceTable.xml', 'performance_table'),
+        ('profilesPerformanceTable.xml', 'profiles_performance_table'),
+        ('weights.xml', 'weights'),
+    ),
+    'ElectreTriCredibility': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_limits'),
+        ('concordance.xml', 'profiles_concordance'),
+        ('discordances.xml', 'profiles_discordances'),
+    ),
+    'ElectreTriDiscordances': (
+        ('alternatives.xml', 'alternatives'),
+        ('categoriesProfiles.xml', 'categories_profiles_limits'),
+        ('criteria.xml', 'criteria'),
+        ('performanceTable.xml', 'performance_table'),
+        ('profilesPerformanceTable.xml', 'profiles_performance_table'),
+    ),
+}
+
+# average number of alternatives outranked by every alternative in the
+# outranking relation used for finding the kernel
+OUTRANKING_DEGREE = 3
+
+
+def _add_value(parent, value, tag='value'):
+    element = etree.SubElement(parent, tag)
+    if isinstance(value, basestring):
+        etree.SubElement(element, 'label').text = value
+    else:
+        etree.SubElement(element, 'real').text = str(value)
+    return element
+
+
+def _method_parameters(parameters):
+    xmcda = etree.Element('methodParameters')
+    for name, value in parameters:
+        parameter = etree.SubElement(xmcda, 'parameter', name=name)
+        _add_value(parameter, value)
+    return xmcda
+
+
+class ProblemGenerator(object):
+    """
+    Builds the XMCDA elements for every kind of the data listed in 'INPUTS'
+    (only when they are needed). Every kind of the data has its own random
+    generator (seeded with the seed of the problem and the name of the kind),
+    so it doesn't depend on the order in which the data is built.
+    """
+
+    def __init__(self, alternatives, criteria, profiles, veto_density, cycle_density, seed):
+        self.alternatives = ['a{}'.format(i) for i in range(1, alternatives + 1)]
+        self.criteria = ['g{}'.format(i) for i in range(1, criteria + 1)]
+        self.profiles = ['b{}'.format(i) for i in range(1, profiles + 1)]
+        self.veto_density = veto_density
+        self.cycle_density = cycle_density
+        self.seed = seed
+        self._built = {}
+        self._criteria_data = None
+
+    def get(self, kind):
+        if kind not in self._built:
+            self._built[kind] = getattr(self, '_' + kind)(self._random(kind))
+        return self._built[kind]
+
+    def write(self, output_dir, module_names):
+        for module_name in module_names:
+            module_dir = os.path.join(output_dir, module_name)
+            if not os.path.isdir(module_dir):
+                os.makedirs(module_dir)
+            for file_name, kind in INPUTS[module_name]:
+                write_xmcda(self.get(kind), os.path.join(module_dir, file_name))
+
+    def _random(self, kind):
+        return random.Random('{}-{}'.format(self.seed, kind))
+
+    def _get_criteria_data(self):
+        # directions and thresholds are needed for both criteria and the
+        # profiles' performances
+        if self._criteria_data is None:
+            rnd = self._random('criteria_data')
+            data = OrderedDict()
+            for c in self.criteria:
+                thresholds = OrderedDict([
+                    ('indifference', round(rnd.uniform(1, 5), 2)),
+                    ('preference', round(rnd.uniform(10, 20), 2)),
+                    ('veto', round(rnd.uniform(30, 60), 2)),
+                ])
+                vetoed = rnd.random() < self.veto_density
+                data[c] = (rnd.choice(('max', 'min')), thresholds, vetoed)
+            self._criteria_data = data
+        return self._criteria_data
+
+    def _alternatives(self, rnd):
+        xmcda = etree.Element('alternatives')
+        for a in self.alternatives:
+            alternative = etree.SubElement(xmcda, 'alternative', id=a)
+            etree.SubElement(alternative, 'active').text = 'true'
+        return xmcda
+
+    def _criteria(self, rnd, vetoes=False):
+        xmcda = etree.Element('criteria')
+        for c, (direction, thresholds, vetoed) in self._get_criteria_data().items():
+            criterion = etree.SubElement(xmcda, 'criterion', id=c)
+            scale = etree.SubElement(criterion, 'scale')
+            quantitative = etree.SubElement(scale, 'quantitative')
+            etree.SubElement(quantitative, 'preferenceDirection').text = direction
+            xml_thresholds = etree.SubElement(criterion, 'thresholds')
+            for name, value in thresholds.items():
+                if name == 'veto' and not (vetoed or vetoes):
+                    continue
+                threshold = etree.SubElement(xml_thresholds, 'threshold', mcdaConcept=name)
+                _add_value(threshold, value, tag='constant')
+        return xmcda
+
+    def _criteria_vetoes(self, rnd):
+        # Electre Is discordance needs veto thresholds for all the criteria
+        return self._criteria(rnd, vetoes=True)
+
+    def _weights(self, rnd):
+        xmcda = etree.Element('criteriaValues', mcdaConcept='Importance')
+        for c in self.criteria:
+            criterion_value = etree.SubElement(xmcda, 'criterionValue')
+            etree.SubElement(criterion_value, 'criterionID').text = c
+            _add_value(criterion_value, float(rnd.randint(1, 10)))
+        return xmcda
+
+    def _interactions(self, rnd):
+        # 'strengthening' ones only, so the weights don't have to be checked
+        # for the positive net balance condition
+        xmcda = etree.Element('criteriaValues', mcdaConcept='criteriaInteractions')
+        for c1, c2 in zip(self.criteria[::2], self.criteria[1::2]):
+            criterion_value = etree.SubElement(xmcda, 'criterionValue',
+                                               mcdaConcept='strengthening')
+            criteria_set = etree.SubElement(criterion_value, 'criteriaSet')
+            for c in (c1, c2):
+                element = etree.SubElement(criteria_set, 'element')
+                etree.SubElement(element, 'criterionID').text = c
+            _add_value(criterion_value, round(rnd.uniform(0.5, 2), 2))
+        return xmcda
+
+    def _get_performance_table(self, rows):
+        xmcda = etree.Element('performanceTable')
+        for x, row in rows.items():
+            alternative_performances = etree.SubElement(xmcda, 'alternativePerformances')
+            etree.SubElement(alternative_performances, 'alternativeID').text = x
+            for c in self.criteria:
+                performance = etree.SubElement(alternative_performances, 'performance')
+                etree.SubElement(performance, 'criterionID').text = c
+                _add_value(performance, row[c])
+        return xmcda
+
+    def _performance_table(self, rnd):
+        rows = OrderedDict()
+        for a in self.alternatives:
+            rows[a] = {c: round(rnd.uniform(0, 100), 2) for c in self.criteria}
+        return self._get_performance_table(rows)
+
+    def _profiles_performance_table(self, rnd):
+        # profiles spread evenly over the scale of every criterion (from the
+        # worst to the best one), so they don't overlap
+        step = 100 / (len(self.profiles) + 1)
+        rows = OrderedDict()
+        for i, p in enumerate(self.profiles, 1):
+            rows[p] = {}
+            for c, (direction, _, _) in self._get_criteria_data().items():
+                value = i * step + rnd.uniform(-step / 4, step / 4)
+                rows[p][c] = round(value if direction == 'max' else 100 - value, 2)
+        return self._get_performance_table(rows)
+
+    def _categories_central(self, rnd):
+        # one category per profile, the first one being the best
+        xmcda = etree.Element('categories')
+        for i in range(1, len(self.profiles) + 1):
+            category = etree.SubElement(xmcda, 'category', id='C{}'.format(i))
+            etree.SubElement(category, 'active').text = 'true'
+            rank = etree.SubElement(category, 'rank')
+            etree.SubElement(rank, 'integer').text = str(len(self.profiles) + 1 - i)
+        return xmcda
+
+    def _categories_profiles_central(self, rnd):
+        xmcda = etree.Element('categoriesProfiles')
+        for i, p in enumerate(self.profiles, 1):
+            category_profile = etree.SubElement(xmcda, 'categoryProfile')
+            etree.SubElement(category_profile, 'alternativeID').text = p
+            central = etree.SubElement(category_profile, 'central')
+            etree.SubElement(central, 'categoryID').text = 'C{}'.format(i)
+        return xmcda
+
+    def _categories_profiles_limits(self, rnd):
+        # profile 'bi' separates categories 'Ci' and 'Ci+1'
+        xmcda = etree.Element('categoriesProfiles')
+        for i, p in enumerate(self.profiles, 1):
+            category_profile = etree.SubElement(xmcda, 'categoryProfile')
+            etree.SubElement(category_profile, 'alternativeID').text = p
+            limits = etree.SubElement(category_profile, 'limits')
+            for bound, category in (('lowerCategory', i), ('upperCategory', i + 1)):
+                element = etree.SubElement(limits, bound)
+                etree.SubElement(element, 'categoryID').text = 'C{}'.format(category)
+        return xmcda
+
+    def _get_profiles_comparisons(self, value):
+        comparisons = OrderedDict()
+        for a in self.alternatives:
+            comparisons[a] = OrderedDict((p, value()) for p in self.profiles)
+        for p in self.profiles:
+            comparisons[p] = OrderedDict((a, value()) for a in self.alternatives)
+        return comparisons
+
+    def _get_partial_discordances(self, rnd):
+        vetoed = [c for c, (_, _, vetoed) in self._get_criteria_data().items() if vetoed]
+
+        def value():
+            return OrderedDict((c, rnd.choice((0.0, 0.0, round(rnd.random(), 2), 1.0))
+                                if c in vetoed else 0.0) for c in self.criteria)
+        return value
+
+    def _profiles_concordance(self, rnd):
+        # concordance has to be < 1 where any of the discordances is 1
+        comparisons = self._get_profiles_comparisons(lambda: round(rnd.uniform(0, 0.99), 2))
+        return comparisons_to_xmcda(comparisons, mcdaConcept='alternativesProfilesComparisons')
+
+    def _profiles_discordances(self, rnd):
+        comparisons = self._get_profiles_comparisons(self._get_partial_discordances(rnd))
+        return comparisons_to_xmcda(comparisons, partials=True,
+                                    mcdaConcept='alternativesProfilesComparisons')
+
+    def _credibility(self, rnd):
+        comparisons = self._get_profiles_comparisons(lambda: round(rnd.random(), 2))
+        return comparisons_to_xmcda(comparisons, mcdaConcept='alternativesProfilesComparisons')
+
+    def _concordance(self, rnd):
+        comparisons = OrderedDict()
+        for a in self.alternatives:
+            comparisons[a] = OrderedDict((b, 1.0 if a == b else round(rnd.random(), 2))
+                                         for b in self.alternatives)
+        return comparisons_to_xmcda(comparisons)
+
+    def _discordance_binary(self, rnd):
+        probability = self.veto_density / 4
+        comparisons = OrderedDict()
+        for a in self.alternatives:
+            comparisons[a] = OrderedDict(
+                (b, 1 if a != b and rnd.random() < probability else 0) for b in self.alternatives
+            )
+        return comparisons_to_xmcda(comparisons)
+
+    def _outranking(self, rnd):
+        # relations going 'forward' (from the alternatives with lower indices
+        # to the ones with higher indices) give an acyclic graph, so every
+        # relation going 'backwards' may close a cycle
+        n = len(self.alternatives)
+        probability = min(1, OUTRANKING_DEGREE / max(1, n - 1))
+        comparisons = OrderedDict((a, OrderedDict()) for a in self.alternatives)
+        for i, a in enumerate(self.alternatives):
+            for b in self.alternatives[i + 1:]:
+                if rnd.random() < probability:
+                    value = round(rnd.uniform(0.5, 1), 2)
+                    if rnd.random() < self.cycle_density:
+                        comparisons[b][a] = value
+                    else:
+                        comparisons[a][b] = value
+        return comparisons_to_xmcda(comparisons)
+
+    def _z_function(self, rnd):
+        return _method_parameters((('z_function', 'multiplication'),))
+
+    def _cut_threshold(self, rnd):
+        return _method_parameters((('cut_threshold', 0.7),))
+
+    def _kernel_parameters(self, rnd):
+        return _method_parameters((('cut_threshold', 0.5),
+                                   ('eliminate_cycles_method', 'aggregate')))
+
+
+def _timed(function, phase, timings):
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[phase] += time.time() - start
+    return wrapper
+
+
+def _is_writer(name):
+    return (name.endswith('_to_xmcda') or
+            name in ('create_messages_file', 'write_stability_intervals', 'write_xmcda'))
+
+
+def run_timed(module, input_dir, output_dir):
+    """
+    Runs the module (by its regular 'main') and returns the time spent on
+    every phase - the functions reading the inputs and the ones writing the
+    outputs are wrapped for the time of the run, and everything else counts
+    as computing.
+    """
+    timings = dict.fromkeys(PHASES, 0.0)
+    originals = {}
+    for name, obj in vars(module).items():
+        if name == 'get_input_data':
+            originals[name] = obj
+            setattr(module, name, _timed(obj, 'parse', timings))
+        elif _is_writer(name) and callable(obj):
+            originals[name] = obj
+            setattr(module, name, _timed(obj, 'write', timings))
+    start = time.time()
+    try:
+        result = run_module(module, ['-i', input_dir, '-o', output_dir], os.getcwd())
+    finally:
+        for name, obj in originals.items():
+            setattr(module, name, obj)
+    if result['exit_code'] != 0:
+        raise RuntimeError(result['stderr'].strip().splitlines()[-1])
+    timings['total'] = time.time() - start
+    timings['compute'] = timings['total'] - timings['parse'] - timings['write']
+    return timings
+
+
+def _run_job(module_name, input_dir, output_dir):
+    return run_timed(_modules[module_name], input_dir, output_dir)
+
+
+def run_in_process(module_name, input_dir, timeout):
+    # every run gets a fresh (forked) process, so it starts with no trees
+    # cached by 'get_trees', and a run which takes too long (or too much
+    # memory) doesn't take the whole benchmark down with it
+    output_dir = tempfile.mkdtemp()
+    pool = Pool(1)
+    try:
+        result = pool.apply_async(_run_job, (module_name, input_dir, output_dir))
+        return result.get(timeout)
+    finally:
+        pool.terminate()
+        shutil.rmtree(output_dir)
+
+
+def benchmark(module_names, problem_dir, repeat, timeout):
+    global _modules
+    _modules = load_modules(module_names)
+    results = OrderedDict()
+    for module_name in module_names:
+        input_dir = os.path.join(problem_dir, module_name)
+        try:
+            runs = [run_in_process(module_name, input_dir, timeout) for _ in range(repeat)]
+        except TimeoutError:
+            results[module_name] = {'error': 'Timeout ({} s).'.format(timeout)}
+            continue
+        except Exception as e:
+            results[module_name] = {'error': str(e)}
+            continue
+        fastest = min(runs, key=lambda r: r['total'])
+        results[module_name] = OrderedDict(
+            (phase, round(fastest[phase], 4)) for phase in PHASES + ('total',)
+        )
+    return results
+
+
+def print_results(results, baseline=None):
+    header = '{:<40}' + '{:>10}' * 4
+    print(header.format('module', *(PHASES + ('total',))) +
+          ('{:>10}'.format('baseline') if baseline else ''))
+    for module_name, timings in results.items():
+        line = '{:<40}'.format(module_name)
+        if 'error' in timings:
+            print(line + timings['error'])
+            continue
+        line += ''.join('{:>10.4f}'.format(timings[p]) for p in PHASES + ('total',))
+        previous = (baseline or {}).get(module_name, {})
+        if previous.get('total'):
+            line += '{:>9.2f}x'.format(timings['total'] / previous['total'])
+        print(line)
+
+
+def main():
+    args = docopt(__doc__, version=__version__)
+    module_names = args['MODULE'] or list(MODULES)
+    for module_name in module_names:
+        if module_name not in MODULES:
+            print("Unknown module: '{}'.".format(module_name), file=sys.stderr)
+            return 1
+    problem = OrderedDict([
+        ('alternatives', int(args['--alternatives'])),
+        ('criteria', int(args['--criteria'])),
+        ('profiles', int(args['--profiles'])),
+        ('veto_density', float(args['--veto-density'])),
+        ('cycle_density', float(args['--cycle-density'])),
+        ('seed', int(args['--seed'])),
+    ])
+    generator = ProblemGenerator(**problem)
+    if args['generate']:
+        generator.write(args['DIR'], module_names)
+        return 0
+
+    problem_dir = tempfile.mkdtemp()
+    try:
+        generator.write(problem_dir, module_names)
+        results = benchmark(module_names, problem_dir, int(args['--repeat']),
+                            int(args['--timeout']))
+    finally:
+        shutil.rmtree(problem_dir)
+    baseline = None
+    if args['--baseline']:
+        with open(args['--baseline']) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if args['--report']:
+        report = OrderedDict([
+            ('version', __version__),
+            ('python', platform.python_version()),
+            ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('problem', problem),
+            ('repeat', int(args['--repeat'])),
+            ('results', results),
+        ])
+        with open(args['--report'], 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if any('error' in r for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
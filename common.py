@@ -1,13 +1,45 @@
 # -*- coding: utf-8 -*-
 
-from collections import OrderedDict
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Mapping, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from heapq import heappop, heappush
+from io import BytesIO
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+import cProfile
+import filecmp
+import gzip
+import hashlib
+import json
+import math
 import os
 import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
 
 import PyXMCDA as px
 
+from docopt import docopt
 from lxml import etree
 
+try:
+    import tracemalloc
+except ImportError:  # it's in the standard library since Python 3.4
+    tracemalloc = None
+
+try:
+    import zstandard
+except ImportError:  # optional, needed only for the files compressed with zstd
+    zstandard = None
+
 
 HEADER = ("<?xml version='1.0' encoding='UTF-8'?>\n"
           "<xmcda:XMCDA xmlns:xmcda='http://www.decision-deck.org/2012/XMCDA-2.2.0'\n"
@@ -20,6 +52,114 @@ def DivizError(Error):  # XXX not used anywhere
     pass
 
 
+# Instrumentation (see: '--timings' option of the modules). Wall time, CPU
+# time and the increase of the peak memory usage (RSS, as reported by the OS)
+# are recorded for every phase of the run: parsing and validation of the input
+# files, reading the input data from the parsed files, building XMCDA and
+# writing it - everything else counts as computing. The OS reports only the
+# peak of the whole process so far, so for a phase it's how much that peak
+# has grown during the phase (0 if the phase didn't need more memory than
+# some earlier one); the peak itself is given for the whole run ('total').
+# Phases can be nested (e.g. parsing is done while reading the input data),
+# in which case the time spent (and memory needed) in the inner phase is not
+# counted for the outer one. Only the thread which started the timings is
+# measured (e.g. files loaded with 'get_trees_async' are not).
+TIMINGS_PHASES = ('parse', 'validate', 'input', 'compute', 'build', 'write')
+_timings = None
+
+
+class Timings(object):
+
+    def __init__(self, output_format):
+        if output_format not in ('xmcda', 'json'):
+            raise RuntimeError("Invalid output format: '{}'.".format(output_format))
+        self.output_format = output_format
+        self.thread = threading.current_thread()
+        self.phases = {}  # phase -> [wall time, CPU time, increase of peak RSS]
+        self._start = self._now()
+        self._stack = []  # [phase, start, the same totals of the inner phases]
+
+    @staticmethod
+    def _now():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return time.time(), usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+    def enter(self, phase):
+        self._stack.append((phase, self._now(), [0.0, 0.0, 0]))
+
+    def exit(self):
+        phase, start, inner = self._stack.pop()
+        spent = [t - t0 for t, t0 in zip(self._now(), start)]
+        totals = self.phases.setdefault(phase, [0.0, 0.0, 0])
+        for i, value in enumerate(spent):
+            totals[i] += value - inner[i]
+            if self._stack:
+                self._stack[-1][2][i] += value
+
+    def get_results(self):
+        # 'compute' is whatever is left from the total
+        spent = [t - t0 for t, t0 in zip(self._now(), self._start)]
+        phases = dict(self.phases)
+        phases['compute'] = [total - sum(p[i] for p in phases.values())
+                             for i, total in enumerate(spent)]
+        phases['total'] = spent
+        results = OrderedDict()
+        for phase in TIMINGS_PHASES + ('total',):
+            values = phases.get(phase)
+            if values is not None:
+                results[phase] = OrderedDict([
+                    ('wall_time', round(values[0], 6)),
+                    ('cpu_time', round(values[1], 6)),
+                    ('peak_rss_increase_kb', values[2]),
+                ])
+        results['total']['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return results
+
+
+def start_timings(output_format):
+    # 'output_format' of None turns the timings off (e.g. left from some
+    # previous run in the same process, see: 'batch.py')
+    global _timings
+    _timings = Timings(output_format) if output_format else None
+
+
+def get_timings():
+    # timings of the run so far (or None, if they're off)
+    return _timings.get_results() if _timings is not None else None
+
+
+@contextmanager
+def timed(phase):
+    if _timings is None or threading.current_thread() is not _timings.thread:
+        yield
+        return
+    _timings.enter(phase)
+    try:
+        yield
+    finally:
+        _timings.exit()
+
+
+def timed_phase(phase):
+    """Decorator - the whole call of the function is timed as 'phase'."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timings_to_messages(timings):
+    # one log message per phase, in 'key=value' format, e.g.:
+    # 'timing phase=parse wall_time=0.012345 cpu_time=0.012000 peak_rss_increase_kb=2048'
+    return tuple('timing phase={} '.format(phase) +
+                 ' '.join(('{}={:.6f}' if isinstance(v, float) else '{}={}').format(k, v)
+                          for k, v in values.items())
+                 for phase, values in timings.items())
+
+
 def get_dirs(args):
     input_dir = args.get('-i')
     output_dir = args.get('-o')
@@ -29,6 +169,102 @@ def get_dirs(args):
     return input_dir, output_dir
 
 
+def get_previous_dirs(args):
+    # for the incremental mode, i.e. '--previous-input' and '--previous-output'
+    previous_input_dir = args.get('--previous-input')
+    previous_output_dir = args.get('--previous-output')
+    if not previous_input_dir and not previous_output_dir:
+        return None, None
+    if not previous_input_dir or not previous_output_dir:
+        raise RuntimeError("Both previous input and previous output directories "
+                           "are required for incremental mode.")
+    for d in (previous_input_dir, previous_output_dir):
+        if not os.path.isdir(d):
+            raise RuntimeError("Directory '{}' doesn't exist. Aborting.".format(d))
+    return previous_input_dir, previous_output_dir
+
+
+def inputs_unchanged(input_dir, previous_input_dir, file_names):
+    """Checks if given input files are identical to the previous ones."""
+    for f in file_names:
+        file_name = find_input_file(input_dir, f)
+        previous_file_name = find_input_file(previous_input_dir, f)
+        if file_name is None or previous_file_name is None:
+            return False
+        if not filecmp.cmp(file_name, previous_file_name, shallow=False):
+            return False
+    return True
+
+
+# options which don't affect the results (apart from the directories, the
+# incremental mode gives exactly the same output files as the full
+# recomputation - see: 'keep_integers' in 'getNumericValue' - so they can be
+# shared through the cache)
+NON_CACHED_OPTIONS = ('-i', '-o', '--cache', '--previous-input', '--previous-output')
+
+
+def get_cache_key(args, module_file, version):
+    """
+    Returns a key for the results cache, based on module's name and version,
+    the options given and the contents of all the files from input directory.
+    """
+    module_name = os.path.splitext(os.path.basename(module_file))[0]
+    options = sorted((k, v) for k, v in args.items() if k not in NON_CACHED_OPTIONS)
+    key = hashlib.sha1(json.dumps([module_name, version, options]))
+    input_dir = args.get('-i')
+    for f in sorted(os.listdir(input_dir)):
+        file_name = os.path.join(input_dir, f)
+        if os.path.isfile(file_name):
+            with open(file_name, 'rb') as fp:
+                key.update(json.dumps([f, hashlib.sha1(fp.read()).hexdigest()]))
+    return key.hexdigest()
+
+
+def restore_cached_results(cache_dir, key, output_dir):
+    """
+    Puts the cached results (including 'messages.xml') into 'output_dir'.
+    Returns False if there are no results cached under given key.
+    """
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        return False
+    for f in os.listdir(entry):
+        # copies, not hard links - otherwise the next run writing to the same
+        # output directory could change the cached results as well
+        target = os.path.join(output_dir, f)
+        if os.path.exists(target):
+            os.remove(target)
+        shutil.copy2(os.path.join(entry, f), target)
+    return True
+
+
+def store_results_in_cache(cache_dir, key, output_dir):
+    # only the files written by the current run are stored (not the ones left
+    # in 'output_dir' by some previous runs) - the cache is only an
+    # optimization, so a failure here (e.g. lack of disk space) shouldn't make
+    # the whole run fail
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # entry is populated under a temporary name first, so concurrent runs
+        # never see it incomplete
+        temp_entry = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+        for f in os.listdir(output_dir):
+            file_name = os.path.join(output_dir, f)
+            if os.path.abspath(file_name) in _written_files and os.path.isfile(file_name):
+                shutil.copyfile(file_name, os.path.join(temp_entry, f))
+        try:
+            os.rename(temp_entry, entry)
+        except OSError:  # stored by some other run in the meantime
+            shutil.rmtree(temp_entry)
+    except (IOError, OSError):
+        pass
+
+
+@timed_phase('build')
 def comparisons_to_xmcda(comparisons, partials=False, mcdaConcept=None):
     if not mcdaConcept:
         xmcda = etree.Element('alternativesComparisons')
@@ -47,18 +283,22 @@ def comparisons_to_xmcda(comparisons, partials=False, mcdaConcept=None):
             if not partials:
                 value = etree.SubElement(pair, 'value')
                 v = etree.SubElement(value, 'real')
-                v.text = str(comparisons[alt1][alt2])
+                v.text = format_value(comparisons[alt1][alt2])
             else:
                 values = etree.SubElement(pair, 'values')
                 for i in comparisons[alt1][alt2].iteritems():
                     value = etree.SubElement(values, 'value', id=i[0])
                     v = etree.SubElement(value, 'real')
-                    v.text = str(i[1])
+                    v.text = format_value(i[1])
     return xmcda
 
 
-def affectations_to_xmcda(affectations):
-    xmcda = etree.Element('alternativesAffectations')
+@timed_phase('build')
+def affectations_to_xmcda(affectations, name=None):
+    if not name:
+        xmcda = etree.Element('alternativesAffectations')
+    else:
+        xmcda = etree.Element('alternativesAffectations', name=name)
     for affectation in affectations.items():
         alternativeAffectation = etree.SubElement(xmcda, 'alternativeAffectation')
         alternativeID = etree.SubElement(alternativeAffectation, 'alternativeID')
@@ -73,20 +313,178 @@ def affectations_to_xmcda(affectations):
     return xmcda
 
 
-def get_trees(input_dir, file_names):
-    trees = {}
-    for f in file_names:
-        file_name = os.path.join(input_dir, f)
-        if not os.path.isfile(file_name):
+def get_affectations(xmltree):
+    # reverse of 'affectations_to_xmcda'
+    affectations = OrderedDict()
+    for xmlaffectation in xmltree.findall(".//alternativesAffectations/alternativeAffectation"):
+        alternative = xmlaffectation.find("alternativeID").text
+        lower = xmlaffectation.find("categoriesInterval/lowerBound/categoryID").text
+        upper = xmlaffectation.find("categoriesInterval/upperBound/categoryID").text
+        affectations[alternative] = (lower, upper)
+    return affectations
+
+
+# Parsed (and validated) files, keyed by the hash of their contents. Within a
+# single run it doesn't matter much, but when many problems are solved in one
+# process (see: 'batch.py'), the files shared by them (e.g. criteria or
+# profiles) are parsed only once. The cache is bounded by the total size of
+# the (decompressed) contents of the files in it - the least recently used
+# ones are dropped first, and larger files aren't kept at all - so a
+# long-running process doesn't hold on to the trees of many (or big)
+# problems. Please note that the trees returned by 'get_trees' may be shared
+# this way, so they shouldn't be modified.
+PARSED_TREES_CACHE_BYTES = 8 * 1024 * 1024
+_parsed_trees = OrderedDict()  # hash -> (tree, size)
+_parsed_trees_bytes = 0
+_parsed_trees_lock = threading.Lock()
+
+# Number of threads used for loading the input files - lxml releases the GIL
+# while parsing and validating, so reading of the files can overlap (which
+# matters e.g. on network-mounted volumes).
+LOADER_THREADS = 4
+_loader_pool = None
+_loader_pool_lock = threading.Lock()
+
+
+# Compressed XMCDA files are recognized by their first bytes, so they can be
+# read regardless of their names - although the written ones get the
+# extension of the compression used (see: 'set_compression'), and such
+# names are looked for as well when a given input file doesn't exist.
+COMPRESSIONS = OrderedDict([
+    # compression -> (file name extension, magic bytes, levels, default level)
+    ('gzip', ('.gz', b'\x1f\x8b', range(1, 10), 6)),
+    ('zstd', ('.zst', b'\x28\xb5\x2f\xfd', range(1, 23), 3)),
+])
+_compression = None
+_compression_level = None
+
+
+def set_compression(compression, level=None):
+    # compression of the XMCDA files written from now on (None for no
+    # compression at all)
+    global _compression, _compression_level
+    if compression is None:
+        if level is not None:
+            raise RuntimeError("Compression level given without compression.")
+        _compression = _compression_level = None
+        return
+    if compression not in COMPRESSIONS:
+        raise RuntimeError("Invalid compression: '{}'.".format(compression))
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("Compression 'zstd' requires 'zstandard' module.")
+    levels, default_level = COMPRESSIONS[compression][2:]
+    if level is None:
+        level = default_level
+    elif not unicode(level).isdigit() or int(level) not in levels:
+        raise RuntimeError("Invalid compression level for '{}': '{}' (should be between "
+                           "{} and {}).".format(compression, level, levels[0], levels[-1]))
+    _compression, _compression_level = compression, int(level)
+
+
+def find_input_file(directory, file_name):
+    # the file itself or, if it doesn't exist, its compressed version (e.g.
+    # 'concordance.xml.gz'); None if there's neither of them
+    for extension in [''] + [c[0] for c in COMPRESSIONS.itervalues()]:
+        path = os.path.join(directory, file_name + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def decompress(data):
+    # contents of the file, which may be compressed
+    if data.startswith(COMPRESSIONS['gzip'][1]):
+        return gzip.GzipFile(fileobj=BytesIO(data)).read()
+    if data.startswith(COMPRESSIONS['zstd'][1]):
+        if zstandard is None:
+            raise RuntimeError("Reading files compressed with zstd requires 'zstandard' "
+                               "module.")
+        # (unlike 'decompress', it doesn't need the size of the contents to be
+        # given in the file)
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def _get_tree(file_name):
+    # returns None if the file is not valid
+    global _parsed_trees_bytes
+    with open(file_name, 'rb') as fp:
+        data = fp.read()
+    key = hashlib.sha1(data).hexdigest()
+    with _parsed_trees_lock:
+        cached = _parsed_trees.get(key)
+    if cached is None:
+        cached = _parse_validate(data)
+        if cached[0] is None:
+            return None
+    with _parsed_trees_lock:
+        if key in _parsed_trees:
+            _parsed_trees_bytes -= _parsed_trees.pop(key)[1]
+        if cached[1] <= PARSED_TREES_CACHE_BYTES:
+            _parsed_trees[key] = cached
+            _parsed_trees_bytes += cached[1]
+            while _parsed_trees_bytes > PARSED_TREES_CACHE_BYTES:
+                _parsed_trees_bytes -= _parsed_trees.popitem(last=False)[1][1]
+    return cached[0]
+
+
+def _parse_validate(data):
+    # the same as 'px.parseValidate', but with parsing (including
+    # decompression) and validation timed separately; returns the tree (None
+    # if the file is not valid) and the size of the decompressed contents
+    try:
+        with timed('parse'):
+            contents = decompress(data)
+            xmltree = etree.parse(BytesIO(contents))
+        with timed('validate'):
+            if px.validateXMCDA(xmltree):
+                return xmltree.getroot(), len(contents)
+    except RuntimeError:  # i.e. no 'zstandard' module
+        raise
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+    return None, 0
+
+
+def get_trees(input_dir, file_names, threads=LOADER_THREADS):
+    file_names = list(file_names)
+    paths = [find_input_file(input_dir, f) for f in file_names]
+    for f, path in zip(file_names, paths):
+        if path is None:
             raise RuntimeError("Problem with input file: '{}'.".format(f))
-        tree = None
-        tree = px.parseValidate(file_name)
+    threads = min(threads, len(file_names))
+    if _timings is not None:  # only the current thread is timed
+        threads = 1
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            loaded = pool.map(_get_tree, paths)
+        finally:
+            pool.close()
+    else:
+        loaded = [_get_tree(path) for path in paths]
+    trees = {}
+    for f, tree in zip(file_names, loaded):
         if tree is None:
             raise RuntimeError("Validation error with file: '{}'.".format(f))
         trees.update({os.path.splitext(f)[0]: tree})
     return trees
 
 
+def get_trees_async(input_dir, file_names):
+    """
+    Starts loading the files in the background and returns immediately with
+    an AsyncResult (see: multiprocessing.pool), whose 'get' method waits for
+    the loading to finish and returns the same as 'get_trees' (or raises the
+    same exception).
+    """
+    global _loader_pool
+    with _loader_pool_lock:
+        if _loader_pool is None:
+            _loader_pool = ThreadPool(LOADER_THREADS)
+    return _loader_pool.apply_async(get_trees, (input_dir, file_names))
+
+
 def get_categories_profiles_central(categories_profiles_tree):
     categoriesProfiles = OrderedDict()
     for xmlprofile in categories_profiles_tree.findall(".//categoryProfile"):
@@ -100,8 +498,9 @@ def get_categories_profiles_central(categories_profiles_tree):
 
 
 def getAlternativesComparisons(xmltree, alternatives, categoriesProfiles,
-                               partials=False, mcdaConcept=None) :
+                               partials=False, mcdaConcept=None, keep_integers=False) :
     # XXX explain what 'partials' is
+    # 'keep_integers' - see: 'getNumericValue'
     if mcdaConcept == None :
         strSearch = ".//alternativesComparisons"
     else :
@@ -110,36 +509,70 @@ def getAlternativesComparisons(xmltree, alternatives, categoriesProfiles,
     if comparisons == None:
         return {}
     else:
-        ret = OrderedDict()
+        labels = set(alternatives) | set(categoriesProfiles)
+        pairs = []
         for pair in comparisons.findall ("pairs/pair"):
             init = pair.find("initial/alternativeID").text
             term = pair.find("terminal/alternativeID").text
             if not partials:
-                val = getNumericValue(pair.find("value"))
+                val = getNumericValue(pair.find("value"), keep_integers)
             else:
                 val = OrderedDict()
                 for value in pair.find("values"):
                     valueID = value.get("id")
-                    numVal = getNumericValue(value)
+                    numVal = getNumericValue(value, keep_integers)
                     val[valueID] = numVal
-            if init in alternatives or init in categoriesProfiles:
-                if term in alternatives or term in categoriesProfiles:
-                    if init not in ret:
-                        ret[init] = OrderedDict()
-                    ret[init][term] = val
+            if init in labels and term in labels:
+                pairs.append((init, term, val))
+        if categoriesProfiles:
+            # alternatives with profiles (see: 'ProfilesComparisons' below)
+            return _get_profiles_comparisons(pairs, alternatives, categoriesProfiles, partials)
+        ret = OrderedDict()
+        for init, term, val in pairs:
+            if init not in ret:
+                ret[init] = OrderedDict()
+            ret[init][term] = val
         return ret
 
 
-def getNumericValue(xmltree) :
+def _get_profiles_comparisons(pairs, alternatives, categoriesProfiles, partials):
+    layers = None
+    if partials:
+        layers = OrderedDict()
+        for _, _, val in pairs:
+            layers.update((k, None) for k in val)
+    comparisons_ap = ComparisonsMatrix(alternatives, categoriesProfiles, layers)
+    comparisons_pa = ComparisonsMatrix(alternatives, categoriesProfiles, layers)
+    comparisons_pa_reversed = comparisons_pa.transposed()
+    alternatives = set(alternatives)
+    for init, term, val in pairs:
+        if init in alternatives:
+            if term not in alternatives:
+                comparisons_ap[init][term] = val
+        elif term in alternatives:
+            comparisons_pa_reversed[init][term] = val
+    return ProfilesComparisons(comparisons_ap, comparisons_pa)
+
+
+def getNumericValue(xmltree, keep_integers=False) :
     # changed from PyXMCDA's original in order to handle both concordance
     # and discordances
 
+    # With 'keep_integers', reals written as integers (e.g. '0', which is how
+    # the ints computed by the modules are written - see: 'format_value') are
+    # read as ints, so the values read back from the outputs of a previous run
+    # (incremental mode) are written again exactly as they were.
+
     # Only returns value if it is numeric
     try :
         if xmltree.find("integer") != None :
             val = int(xmltree.find("integer").text)
         elif xmltree.find("real") != None :
-            val = float(xmltree.find("real").text)
+            text = xmltree.find("real").text
+            if keep_integers and text.strip().lstrip('+-').isdigit():
+                val = int(text)
+            else:
+                val = float(text)
         elif xmltree.find("rational") != None :
             val = float(xmltree.find("rational/numerator").text) / float(xmltree.find("rational/denominator").text)
         elif xmltree.find("NA") != None :
@@ -151,6 +584,432 @@ def getNumericValue(xmltree) :
     return val
 
 
+def get_performance_table(xmltree, alternatives=None, criteria=None):
+    """
+    Reads the performance table into a 'ComparisonsMatrix' of alternatives x
+    criteria (in given order, or in the order of the table if not given), with
+    all the values as floats.
+
+    Returns it along with the list of (alternative, criterion) pairs which have
+    no numeric performance in the table - they are set to NaN (see:
+    'check_performance_table').
+    """
+    rows = OrderedDict()
+    table = xmltree.find(".//performanceTable")
+    if table is not None:
+        for alternative_performances in table.iterchildren("alternativePerformances"):
+            alternative = alternative_performances.findtext("alternativeID")
+            row = rows.setdefault(alternative, {})
+            for performance in alternative_performances.iterchildren("performance"):
+                row[performance.findtext("criterionID")] = _get_performance(performance)
+    if alternatives is None:
+        alternatives = rows.keys()
+    if criteria is None:
+        criteria = OrderedDict((c, None) for row in rows.itervalues() for c in row).keys()
+    performances = ComparisonsMatrix(alternatives, criteria, precision='float64')
+    missing = []
+    for alternative in alternatives:
+        row = rows.get(alternative, {})
+        matrix_row = performances[alternative]
+        for criterion in criteria:
+            value = row.get(criterion)
+            if value is None:
+                missing.append((alternative, criterion))
+                value = float('nan')
+            matrix_row[criterion] = value
+    return performances, missing
+
+
+def _get_performance(performance):
+    # numeric value of a single performance, or None
+    value = performance.find("value")
+    if value is None:
+        return None
+    try:
+        for v in value:
+            if v.tag == "real" or v.tag == "integer":
+                return float(v.text)
+            if v.tag == "rational":
+                return float(v.findtext("numerator")) / float(v.findtext("denominator"))
+            if isinstance(v.tag, basestring):  # i.e. not a comment etc.
+                break
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass
+    return None
+
+
+def check_performance_table(missing, file_name):
+    if missing:
+        cells = ', '.join("({}, {})".format(a, c) for a, c in missing[:10])
+        if len(missing) > 10:
+            cells += ', ...'
+        raise RuntimeError("Missing or non-numeric performances in '{}': {}."
+                           .format(file_name, cells))
+
+
+def get_performance_rows(performances, alternatives, criteria):
+    # performances as lists (one per alternative, with the values for the
+    # criteria in given order), so they can be addressed by the positions of
+    # the criteria in the innermost loops
+    if isinstance(performances, ComparisonsMatrix):
+        return performances.get_rows(alternatives, criteria)
+    return [[performances[a][c] for c in criteria] for a in alternatives]
+
+
+# Comparisons matrices. Keeping comparisons as nested dicts costs well over
+# a hundred bytes per value (and even more for the partial ones, where each
+# pair has its own dict of values for every criterion), which adds up quickly
+# for thousands of alternatives. 'ComparisonsMatrix' keeps the values in a
+# single flat array of doubles instead (plus one byte per value for its type),
+# while still behaving like nested dicts, so it can be passed wherever such
+# dicts are expected, e.g.:
+#
+#   concordance_ap['a01']['p01'] is for c(a01, p01)
+#   discordances_ap['a01']['p01']['g1'] is for d_g1(a01, p01)
+#
+# Labels (of rows, columns and - for the partial values - layers, i.e.
+# criteria) are interned only once per matrix, and all the rows and cells are
+# just views into its storage, as well as the transposed matrix (see:
+# 'ComparisonsMatrix.transposed').
+
+# Comparisons (concordance, discordances, credibility) lie in [0, 1], so for
+# large matrices they can be kept (and written) with reduced precision, at the
+# cost of the following rounding errors (see: '--precision' option of the
+# modules):
+#
+#   'float64' - none, it's the default
+#   'float32' - relative error up to 2^-24 (absolute one up to 6e-8)
+#   'uint16'  - fixed-point, in steps of 2^-15 (which keeps 0, 1 and
+#               e.g. 0.5 or 0.75 exact), so absolute error up to 2^-16 (1.5e-5)
+#
+# Rounding is monotonic, so an assignment computed from rounded credibility
+# can differ from the exact one only when some credibility value of the
+# alternative lies within that error from the cut threshold (or from the
+# other value it's compared with).
+PRECISIONS = OrderedDict([
+    # precision -> (typecode of the array, scale of the fixed-point values)
+    ('float64', ('d', None)),
+    ('float32', ('f', None)),
+    ('uint16', ('H', 2 ** 15)),
+])
+# significant digits written for the values kept with reduced precision
+# (enough for them to be read back as the same values)
+PRECISIONS_DIGITS = {'float32': 9, 'uint16': 5}
+_precision = 'float64'
+
+
+def set_precision(precision):
+    # precision of the comparisons matrices created from now on (None sets
+    # it back to the default one)
+    global _precision
+    precision = precision or 'float64'
+    if precision not in PRECISIONS:
+        raise RuntimeError("Invalid precision: '{}'.".format(precision))
+    _precision = precision
+
+
+def format_value(value):
+    # given number of significant digits (see: 'set_output_format'), or the
+    # shortest form of the value which is read back with the same precision
+    if type(value) is not float:
+        return str(value)
+    if _real_format is not None:
+        return _real_format % value
+    if _precision == 'float64':
+        return str(value)
+    typecode, scale = PRECISIONS[_precision]
+    for digits in range(1, PRECISIONS_DIGITS[_precision]):
+        text = '{:.{}g}'.format(value, digits)
+        if array(typecode, [_to_stored(float(text), scale)])[0] == _to_stored(value, scale):
+            return text
+    return '{:.{}g}'.format(value, PRECISIONS_DIGITS[_precision])
+
+
+def _to_stored(value, scale):
+    if scale is None:
+        return value
+    if not 0 <= value <= 1:
+        raise RuntimeError("Value {!r} can't be kept with 'uint16' precision (it's not "
+                           "in [0, 1]).".format(value))
+    return int(round(value * scale))
+
+
+# types of the values kept in the matrix ('_MISSING' for the ones not set yet,
+# so the matrices can be filled in gradually, just like dicts)
+_MISSING, _FLOAT, _INT, _NONE, _NA = range(5)
+_MISSING_TYPE, _FLOAT_TYPE = chr(_MISSING), chr(_FLOAT)
+_VALUE_TYPES = {float: _FLOAT, int: _INT}
+
+
+class ComparisonsMatrix(Mapping):
+
+    def __init__(self, rows, columns, layers=None, precision=None):
+        # 'precision' defaults to the one set with 'set_precision'
+        self.precision = precision or _precision
+        typecode, self._scale = PRECISIONS[self.precision]
+        self._step = 1.0 / self._scale if self._scale is not None else None
+        self.rows = list(rows)
+        self.columns = list(columns)
+        self.layers = list(layers) if layers is not None else None
+        self._row_index = {r: i for i, r in enumerate(self.rows)}
+        self._column_index = {c: i for i, c in enumerate(self.columns)}
+        self._layer_index = ({l: i for i, l in enumerate(self.layers)}
+                             if self.layers is not None else None)
+        width = len(self.layers) if self.layers is not None else 1
+        size = len(self.rows) * len(self.columns) * width
+        self._values = array(typecode, [0]) * size
+        self._types = bytearray(size)
+        self._column_stride = width
+        self._row_stride = len(self.columns) * width
+
+    def transposed(self):
+        # returns a view sharing the storage with this matrix, i.e. the changes
+        # made through any of them are visible in both
+        t = ComparisonsMatrix.__new__(ComparisonsMatrix)
+        t.precision, t._scale, t._step = self.precision, self._scale, self._step
+        t.rows, t.columns, t.layers = self.columns, self.rows, self.layers
+        t._row_index, t._column_index = self._column_index, self._row_index
+        t._layer_index = self._layer_index
+        t._values, t._types = self._values, self._types
+        t._row_stride, t._column_stride = self._column_stride, self._row_stride
+        return t
+
+    def _get_value(self, offset):
+        value_type = self._types[offset]
+        if value_type == _FLOAT:
+            if self._step is not None:
+                return self._values[offset] * self._step
+            return self._values[offset]
+        if value_type == _INT:
+            if self._step is not None:
+                return int(self._values[offset] * self._step)
+            return int(self._values[offset])
+        if value_type == _NONE:
+            return None
+        if value_type == _NA:
+            return 'NA'
+        raise KeyError(offset)
+
+    def _set_value(self, offset, value):
+        if type(value) is float and self._scale is None:  # the usual case
+            self._values[offset] = value
+            self._types[offset] = _FLOAT
+        elif value is None:
+            self._types[offset] = _NONE
+        elif value == 'NA':
+            self._types[offset] = _NA
+        elif isinstance(value, float):
+            self._values[offset] = _to_stored(value, self._scale)
+            self._types[offset] = _FLOAT
+        elif isinstance(value, (int, long)):
+            self._values[offset] = _to_stored(value, self._scale)
+            self._types[offset] = _INT
+        else:
+            raise TypeError("Unsupported value in comparisons matrix: {!r}.".format(value))
+
+    def fill_layer(self, layer, value):
+        # sets all the cells of given layer to the same value at once (e.g.
+        # partial discordances for a criterion without veto, which are all 0)
+        cell = ComparisonsMatrix([None], [None], [None], self.precision)
+        cell._set_value(0, value)
+        width = len(self.layers)
+        offset = self._layer_index[layer]
+        count = len(self._types) // width
+        self._values[offset::width] = cell._values * count
+        self._types[offset::width] = cell._types * count
+
+    def set_layer(self, layer, rows_values):
+        # values of given layer for all the cells, as lists (one per row, in
+        # the order of the columns), e.g. partial discordances for a criterion
+        width = len(self.layers)
+        if self._column_stride != width:
+            raise ValueError("Layers of transposed matrices can't be set at once.")
+        values = list(chain.from_iterable(rows_values))
+        if len(values) != len(self.rows) * len(self.columns):
+            raise ValueError("Wrong number of values for the layer: {}.".format(len(values)))
+        offset = self._layer_index[layer]
+        try:  # the usual case, when all of them can be set at once
+            if self._scale is not None:
+                raise KeyError
+            types = bytearray(map(_VALUE_TYPES.__getitem__, map(type, values)))
+            self._values[offset::width] = array(self._values.typecode, values)
+            self._types[offset::width] = types
+        except KeyError:
+            for i, value in enumerate(values):
+                self._set_value(offset + i * width, value)
+
+    def get_rows(self, rows, columns):
+        # values for given rows and columns, as lists (one per row)
+        positions = [self._column_index[c] for c in columns]
+        count = len(self.columns)
+        step = self._column_stride
+        ret = []
+        for r in rows:
+            start = self._row_index[r] * self._row_stride
+            stop = start + count * step
+            if self.layers is None and self._types[start:stop:step].count(_FLOAT_TYPE) == count:
+                values = self._values[start:stop:step]
+                if self._step is not None:
+                    values = [v * self._step for v in values]
+                ret.append([values[i] for i in positions])
+            else:
+                row = self[r]
+                ret.append([row[c] for c in columns])
+        return ret
+
+    def _get_values(self, start, count, step):
+        # values of 'count' cells from 'start' on (every 'step'-th one), as
+        # (position, value) pairs, skipping the ones not set
+        stop = start + count * step
+        types = self._types[start:stop:step]
+        if types.count(_FLOAT_TYPE) == count:  # the usual case
+            if self._step is not None:
+                return [(i, v * self._step) for i, v in enumerate(self._values[start:stop:step])]
+            return list(enumerate(self._values[start:stop:step]))
+        return [(i, self._get_value(start + i * step))
+                for i, value_type in enumerate(types) if value_type != _MISSING]
+
+    def _is_set(self, offset):
+        if self.layers is None:
+            return self._types[offset] != _MISSING
+        return any(self._types[offset:offset + len(self.layers)])
+
+    def _is_row_set(self, offset):
+        width = len(self.layers) if self.layers is not None else 1
+        count = len(self.columns)
+        if self._column_stride == width:  # cells of the row are next to each other
+            types = self._types[offset:offset + count * width]
+        elif width == 1:
+            types = self._types[offset:offset + count * self._column_stride:self._column_stride]
+        else:
+            return any(self._is_set(offset + i * self._column_stride) for i in xrange(count))
+        return types.count(_MISSING_TYPE) != len(types)
+
+    def __getitem__(self, row):
+        return _MatrixRow(self, self._row_index[row] * self._row_stride)
+
+    def __setitem__(self, row, values):
+        matrix_row = self[row]
+        for column, value in values.iteritems():
+            matrix_row[column] = value
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return 'ComparisonsMatrix({!r})'.format(OrderedDict(self.iteritems()))
+
+
+class _MatrixRow(Mapping):
+
+    def __init__(self, matrix, offset):
+        self._matrix = matrix
+        self._offset = offset
+
+    def _get_offset(self, column):
+        return self._offset + self._matrix._column_index[column] * self._matrix._column_stride
+
+    def __getitem__(self, column):
+        matrix = self._matrix
+        offset = self._get_offset(column)
+        if matrix.layers is None:
+            if matrix._types[offset] == _FLOAT and matrix._step is None:  # the usual case
+                return matrix._values[offset]
+            try:
+                return matrix._get_value(offset)
+            except KeyError:
+                raise KeyError(column)
+        if not matrix._is_set(offset):
+            raise KeyError(column)
+        return _MatrixCell(matrix, offset)
+
+    def __setitem__(self, column, value):
+        matrix = self._matrix
+        offset = self._get_offset(column)
+        if matrix.layers is None:
+            matrix._set_value(offset, value)
+        else:
+            for layer, v in value.iteritems():
+                matrix._set_value(offset + matrix._layer_index[layer], v)
+
+    def __iter__(self):
+        matrix = self._matrix
+        for i, column in enumerate(matrix.columns):
+            if matrix._is_set(self._offset + i * matrix._column_stride):
+                yield column
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __nonzero__(self):
+        return self._matrix._is_row_set(self._offset)
+
+    def items(self):
+        matrix = self._matrix
+        if matrix.layers is not None:
+            return Mapping.items(self)
+        columns = matrix.columns
+        return [(columns[i], v) for i, v in
+                matrix._get_values(self._offset, len(columns), matrix._column_stride)]
+
+    def values(self):
+        return [v for _, v in self.items()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def __repr__(self):
+        return repr(OrderedDict(self.iteritems()))
+
+
+class _MatrixCell(Mapping):
+    # partial values for a given pair, one per layer (i.e. per criterion)
+
+    def __init__(self, matrix, offset):
+        self._matrix = matrix
+        self._offset = offset
+
+    def __getitem__(self, layer):
+        try:
+            return self._matrix._get_value(self._offset + self._matrix._layer_index[layer])
+        except KeyError:
+            raise KeyError(layer)
+
+    def __setitem__(self, layer, value):
+        self._matrix._set_value(self._offset + self._matrix._layer_index[layer], value)
+
+    def __iter__(self):
+        types = self._matrix._types
+        for i, layer in enumerate(self._matrix.layers):
+            if types[self._offset + i] != _MISSING:
+                yield layer
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        layers = self._matrix.layers
+        return [(layers[i], v) for i, v in self._matrix._get_values(self._offset, len(layers), 1)]
+
+    def values(self):
+        return [v for _, v in self._matrix._get_values(self._offset, len(self._matrix.layers), 1)]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def __repr__(self):
+        return repr(OrderedDict(self.iteritems()))
+
+
 # Basically, this reversing/unreversing below applies only to the methods from
 # Electre TRI family, i.e. where you compare alternatives with profiles, not
 # alternatives with alternatives. In the former scenario you get comparisons
@@ -174,8 +1033,44 @@ def getNumericValue(xmltree) :
 #
 #   concordance['a01']['a02'] is for c(a01, a02)
 #   concordance['a02']['a01'] is for c(a02, a01)
+#
+# When both '_ap' and '_pa' comparisons are kept in 'ComparisonsMatrix'es, the
+# reversed form doesn't have to be built at all - 'ProfilesComparisons' is just
+# a view of them in that form, and they are given back as they are when it's
+# unreversed, so flipping between the two doesn't copy anything.
+
+class ProfilesComparisons(Mapping):
+
+    def __init__(self, comparisons_ap, comparisons_pa):
+        # both are alternatives x profiles matrices
+        self.ap = comparisons_ap
+        self.pa = comparisons_pa
+        self._pa_reversed = comparisons_pa.transposed()
+
+    def __getitem__(self, key):
+        if key in self.ap._row_index:
+            row = self.ap[key]
+        else:
+            row = self._pa_reversed[key]
+        # just like in the reversed dicts, there are no empty rows
+        if not row:
+            raise KeyError(key)
+        return row
+
+    def __iter__(self):
+        return (k for k in chain(self.ap.rows, self.pa.columns) if k in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'ProfilesComparisons({!r})'.format(OrderedDict(self.iteritems()))
+
 
 def reverseAltComparisons(comparisons_ap, comparisons_pa, alternatives, categoriesProfiles):
+    if (isinstance(comparisons_ap, ComparisonsMatrix) and
+            isinstance(comparisons_pa, ComparisonsMatrix)):
+        return ProfilesComparisons(comparisons_ap, comparisons_pa)
     comparisons_pa_reversed = OrderedDict()
     for p in categoriesProfiles:
         comparisons_pa_reversed.update({p: OrderedDict([(a, None) for a in alternatives])})
@@ -189,6 +1084,10 @@ def reverseAltComparisons(comparisons_ap, comparisons_pa, alternatives, categori
 
 
 def unreverseAltComparisons(comparisons, alternatives, categoriesProfiles):
+    if (isinstance(comparisons, ProfilesComparisons) and
+            comparisons.ap.rows == list(alternatives) and
+            comparisons.ap.columns == list(categoriesProfiles)):
+        return comparisons.ap, comparisons.pa
     comparisons_ap = OrderedDict()
     comparisons_pa = OrderedDict()
     comparisons_pa_reversed = OrderedDict()
@@ -204,12 +1103,219 @@ def unreverseAltComparisons(comparisons, alternatives, categoriesProfiles):
     return comparisons_ap, comparisons_pa
 
 
+def get_comparisons_rows(comparisons, alternatives, profiles):
+    # Similar to 'unreverseAltComparisons', but returns lists of rows (one row
+    # per alternative, one column per profile, both in the order given) instead
+    # of nested dicts, so the assignment procedures can address profiles by
+    # their position, e.g.:
+    #
+    #   rows_ap[0][1] is for c(alternatives[0], profiles[1])
+    #   rows_pa[0][1] is for c(profiles[1], alternatives[0])
+    if isinstance(comparisons, ProfilesComparisons):
+        return (comparisons.ap.get_rows(alternatives, profiles),
+                comparisons.pa.get_rows(alternatives, profiles))
+    rows_ap = []
+    rows_pa = []
+    profiles_rows = [comparisons[p] for p in profiles]
+    for a in alternatives:
+        row_ap = comparisons[a]
+        rows_ap.append([row_ap[p] for p in profiles])
+        rows_pa.append([row[a] for row in profiles_rows])
+    return rows_ap, rows_pa
+
+
+# Incremental mode helpers. In methods from Electre TRI family, the results for
+# any alternative depend only on its own data (i.e. its performances, or its
+# rows of concordance, discordances or credibility) and on the data shared by
+# all the alternatives (criteria, profiles, parameters etc.). So if the latter
+# didn't change since the previous run, we need to recompute the results only
+# for the alternatives which are new or whose data has changed, and then merge
+# them with the previous ones.
+
+def get_changed_alternatives(alternatives, data, previous_data, previous_results,
+                             categoriesProfiles=None):
+    # 'data' is either keyed by alternatives only (e.g. performance table), or
+    # - if 'categoriesProfiles' is given - it's a comparisons dict, where the
+    # profile-alternative comparisons belong to the alternative as well;
+    # alternatives missing from 'previous_results' are always recomputed
+    changed = []
+    for a in alternatives:
+        if a not in previous_results:
+            changed.append(a)
+            continue
+        try:
+            same = data[a] == previous_data[a]
+            if same and categoriesProfiles is not None:
+                same = all(data[p][a] == previous_data[p][a] for p in categoriesProfiles)
+        except KeyError:
+            same = False
+        if not same:
+            changed.append(a)
+    return changed
+
+
+def merge_comparisons(previous, recomputed, alternatives, categoriesProfiles):
+    # both 'previous' and 'recomputed' are 'reversed' comparisons (i.e. like
+    # the ones returned by 'getAlternativesComparisons')
+    merged = OrderedDict()
+    for a in alternatives:
+        merged[a] = recomputed[a] if a in recomputed else previous[a]
+    for p in categoriesProfiles:
+        recomputed_p = recomputed.get(p, {})
+        merged[p] = OrderedDict(
+            (a, recomputed_p[a] if a in recomputed_p else previous[p][a]) for a in alternatives
+        )
+    return merged
+
+
+def merge_affectations(previous, recomputed, alternatives):
+    return OrderedDict(
+        (a, recomputed[a] if a in recomputed else previous[a]) for a in alternatives
+    )
+
+
+# In methods comparing alternatives with each other (Electre IV, Electre Is),
+# the result for a pair (a, b) depends only on the data of 'a' and 'b', so
+# when some alternatives change, only their rows and columns of the resulting
+# matrices need to be recomputed.
+
+def get_changed_alternatives_pairwise(alternatives, comparisons, previous_comparisons,
+                                      previous_results):
+    # like 'get_changed_alternatives', but for the input given as a matrix of
+    # pairwise comparisons - when comparison for (a, b) has changed, both 'a'
+    # and 'b' are considered changed
+    changed = set(a for a in alternatives if a not in previous_results)
+    for a in alternatives:
+        if a in changed:
+            continue
+        for b in alternatives:
+            if b not in previous_results:  # new ones are changed anyway
+                continue
+            try:
+                same = comparisons[a][b] == previous_comparisons[a][b]
+            except KeyError:
+                same = False
+            if not same:
+                changed.update((a, b))
+    return [a for a in alternatives if a in changed]
+
+
+def merge_pairwise(previous, recomputed, alternatives):
+    # 'recomputed' has to contain all the pairs with at least one changed
+    # alternative, the rest is taken from 'previous'
+    merged = {}
+    for a in alternatives:
+        recomputed_a = recomputed.get(a, {})
+        merged[a] = {b: recomputed_a[b] if b in recomputed_a else previous[a][b]
+                     for b in alternatives}
+    return merged
+
+
+# layouts of the written XMCDA files:
+#   'indented' - one element per line, indented according to its depth (default)
+#   'compact'  - one element per line, without indentation
+#   'none'     - no whitespace between the elements at all
+LAYOUTS = ('indented', 'compact', 'none')
+_layout = 'indented'
+# format of the real values written (None for the default one - see:
+# 'format_value')
+_real_format = None
+
+
+def set_output_format(digits=None, layout=None):
+    # number of significant digits of the real values and the layout of the
+    # XMCDA files written from now on (None sets them back to the defaults)
+    global _layout, _real_format
+    if digits is not None:
+        if not unicode(digits).isdigit() or not 1 <= int(digits) <= 17:
+            raise RuntimeError("Invalid number of digits: '{}' (should be between 1 "
+                               "and 17).".format(digits))
+        _real_format = '%.{}g'.format(int(digits))
+    else:
+        _real_format = None
+    layout = layout or 'indented'
+    if layout not in LAYOUTS:
+        raise RuntimeError("Invalid layout: '{}'.".format(layout))
+    _layout = layout
+
+
+def _set_compact_layout(element):
+    # puts every element in its own line (the text of the elements with
+    # children, if any, is left as it is)
+    for e in element.iter():
+        if len(e) and not e.text:
+            e.text = '\n'
+        e.tail = '\n'
+
+
+# output files written by the current run (see: 'store_results_in_cache')
+_written_files = set()
+
+
+def _open_output(file_name, mode):
+    # the file is replaced rather than truncated, so the old one isn't changed
+    # if it's shared with something else (e.g. hard linked to some cache)
+    if os.path.isfile(file_name):
+        os.remove(file_name)
+    f = open(file_name, mode)
+    _written_files.add(os.path.abspath(file_name))
+    return f
+
+
+def reset_state():
+    # brings the settings of the run (timings, precision, output format and
+    # compression) back to the defaults and forgets the files it has written,
+    # for many runs in a single process (see: 'batch.py') - the parsed files
+    # are kept (within the limit of their cache), since they're looked up by
+    # their contents anyway
+    start_timings(None)
+    set_precision(None)
+    set_output_format()
+    set_compression(None)
+    _written_files.clear()
+
+
+@contextmanager
+def _output_file(filename):
+    # file opened for writing, with the compression set with 'set_compression'
+    # (if any) - the other versions of the file are removed, so they can't be
+    # read instead of it by 'get_trees'
+    extension = COMPRESSIONS[_compression][0] if _compression else ''
+    for e in [''] + [c[0] for c in COMPRESSIONS.itervalues()]:
+        if e != extension and os.path.isfile(filename + e):
+            os.remove(filename + e)
+    if _compression is None:
+        with _open_output(filename, 'w') as f:
+            yield f
+    elif _compression == 'gzip':
+        # (with no timestamp, so the same contents give the same file)
+        with _open_output(filename + extension, 'wb') as fp:
+            f = gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=_compression_level,
+                              mtime=0)
+            yield f
+            f.close()
+    else:
+        f = BytesIO()
+        yield f
+        compressor = zstandard.ZstdCompressor(level=_compression_level)
+        with _open_output(filename + extension, 'wb') as fp:
+            fp.write(compressor.compress(f.getvalue()))
+
+
+@timed_phase('write')
 def write_xmcda(xmcda, filename):
-    et = etree.ElementTree(xmcda)
+    # 'xmcda' can be either a single etree.Element or a list of them (e.g. one
+    # block of affectations per cut threshold)
+    if not isinstance(xmcda, (list, tuple)):
+        xmcda = [xmcda]
     try:
-        with open(filename, 'w') as f:
+        with _output_file(filename) as f:
             f.write(HEADER)
-            et.write(f, pretty_print=True, encoding='UTF-8')
+            for element in xmcda:
+                if _layout == 'compact':
+                    _set_compact_layout(element)
+                etree.ElementTree(element).write(f, pretty_print=(_layout == 'indented'),
+                                                 encoding='UTF-8')
             f.write(FOOTER)
     except IOError as e:
         raise IOError("{}: '{}'".format(e.strerror, e.filename))  # XXX IOError..?
@@ -221,7 +1327,16 @@ def print_xmcda(xmcda):
 
 
 def create_messages_file(log_msg, err_msg, out_dir):
-    with open(os.path.join(out_dir, 'messages.xml'), 'w') as f:
+    if _timings is not None and log_msg and not err_msg:
+        timings = get_timings()
+        log_msg = tuple(log_msg) + timings_to_messages(timings)
+        if _timings.output_format == 'json':
+            try:
+                with _open_output(os.path.join(out_dir, 'timings.json'), 'w') as f:
+                    json.dump(timings, f, indent=2)
+            except IOError as e:
+                raise IOError("{}: '{}'".format(e.strerror, e.filename))
+    with _open_output(os.path.join(out_dir, 'messages.xml'), 'w') as f:
         px.writeHeader(f)
         if err_msg:
             px.writeErrorMessages(f, err_msg)
@@ -243,81 +1358,164 @@ def get_intersection_distillation(xmltree, altId):
         return
     else :
         comparisons = comparisons[0]
+        altId = set(altId)
         datas = {}
         for pair in comparisons.findall ("pairs/pair") :
             init = pair.find("initial/alternativeID").text
             term = pair.find("terminal/alternativeID").text
-            if altId.count(init) > 0 :
-                if altId.count(term) > 0 :
-                    if not(datas.has_key(init)) :
-                        datas[init] = {}
-                    datas[init][term] = 1.0
+            if init in altId and term in altId:
+                if not(datas.has_key(init)) :
+                    datas[init] = {}
+                datas[init][term] = 1.0
         return datas
 
 
+def get_pairwise_comparisons(xmltree, alternatives, mcdaConcept=None):
+    """
+    The same as PyXMCDA's 'getAlternativesComparisons', but the alternatives
+    are looked up in a set - 'list.count' used there made it quadratic in the
+    number of alternatives (i.e. cubic in the size of the problem).
+    """
+    if mcdaConcept == None:
+        strSearch = ".//alternativesComparisons"
+    else:
+        strSearch = ".//alternativesComparisons[@mcdaConcept=\'" + mcdaConcept + "\']"
+    comparisons = xmltree.xpath(strSearch)[0]
+    alternatives = set(alternatives)
+    datas = {}
+    for pair in comparisons.findall("pairs/pair"):
+        init = pair.find("initial/alternativeID").text
+        term = pair.find("terminal/alternativeID").text
+        if init in alternatives and term in alternatives:
+            datas.setdefault(init, {})[term] = px.getNumericValue(pair)
+    return datas
+
+
+class CriterionParams(object):
+    # parameters of a single criterion, looked up in the innermost loops of
+    # the methods - 'direction' is 1 for 'max' (gain) and -1 for 'min' (cost)
+    # criteria, so e.g. the advantage of 'x' over 'y' is direction * (x - y)
+    __slots__ = ('direction', 'indifference', 'preference', 'veto', 'weight')
+
+    def __init__(self, direction, indifference=None, preference=None, veto=None,
+                 weight=None):
+        self.direction = direction
+        self.indifference = indifference
+        self.preference = preference
+        self.veto = veto
+        self.weight = weight
+
+
+def get_criteria_params(criteria, pref_directions, thresholds, weights=None):
+    # 'pref_directions', 'thresholds' and 'weights' are the dicts returned by
+    # PyXMCDA (thresholds which are not given are None)
+    criteria_params = OrderedDict()
+    for criterion in criteria:
+        if pref_directions[criterion] == 'max':
+            direction = 1
+        elif pref_directions[criterion] == 'min':
+            direction = -1
+        else:
+            raise RuntimeError("No valid preference direction specified for criterion "
+                               "'{}'.".format(criterion))
+        criterion_thresholds = thresholds.get(criterion) or {}
+        criteria_params[criterion] = CriterionParams(
+            direction,
+            indifference=criterion_thresholds.get('indifference'),
+            preference=criterion_thresholds.get('preference'),
+            veto=criterion_thresholds.get('veto'),
+            weight=weights[criterion] if weights is not None else None,
+        )
+    return criteria_params
+
+
+# maximal number of (criterion, performance) pairs for which partial
+# concordances / discordances are kept in memory (see: 'get_partial_lookup')
+PARTIALS_CACHE_SIZE = 100000
+
+
+def get_partial_lookup(compute, cache_size=PARTIALS_CACHE_SIZE):
+    """
+    Memoizes 'compute(criterion, performance)', keeping at most 'cache_size'
+    most recently used results.
+
+    Performances often repeat (e.g. on discrete scales), so this allows to
+    compute partial concordances or discordances of a given performance with
+    all the profiles only once, and then just to look them up.
+    """
+    cache = OrderedDict()
+
+    def lookup(criterion, performance):
+        key = (criterion, performance)
+        try:
+            result = cache.pop(key)
+        except KeyError:
+            result = compute(criterion, performance)
+            if len(cache) >= cache_size:
+                cache.popitem(last=False)
+        cache[key] = result
+        return result
+
+    return lookup
+
+
 def get_concordance(alternatives, categories_profiles, performances,
                     profiles_performance_table, criteria, thresholds,
-                    pref_directions, weights):
+                    pref_directions, weights, cache_size=PARTIALS_CACHE_SIZE):
+
+    criteria_params = get_criteria_params(criteria, pref_directions, thresholds, weights)
+    criteria_items = criteria_params.items()
+    profiles_rows = get_performance_rows(profiles_performance_table, categories_profiles,
+                                         criteria)
+    profiles_columns = {c: [row[i] for row in profiles_rows] for i, c in enumerate(criteria)}
 
-    def _omega(x, y):
+    def _get_partial_concordance(x, y, params):
         # 'x' and 'y' to keep it as general as possible
-        if pref_directions[criterion] == 'max':
-            return x - y
-        if pref_directions[criterion] == 'min':
-            return y - x
-
-    def _get_partial_concordance(x, y, criterion):
-        p = thresholds[criterion].get('preference')
-        q = thresholds[criterion].get('indifference')
-        if _omega(x, y) < -p:
+        omega = params.direction * (x - y)
+        p = params.preference
+        q = params.indifference
+        if omega < -p:
             return 0
-        elif _omega(x, y) >= -q:
+        elif omega >= -q:
             return 1
         else:
-            return (_omega(x, y) + p) / (p - q)
+            return (omega + p) / (p - q)
 
-    # compute partial concordances
-    partial_concordances_ap = {}
-    partial_concordances_pa = {}
-    for a in alternatives:
-        p_dict_ap = {}
-        p_dict_pa = {}
-        for p in categories_profiles:
-            c_dict_ap = {}
-            c_dict_pa = {}
-            for criterion in criteria:
-                # compare alternatives with profiles
-                x = performances[a][criterion]
-                y = profiles_performance_table[p][criterion]
-                c_ap = _get_partial_concordance(x, y, criterion)
-                # compare profiles with alternatives
-                x = profiles_performance_table[p][criterion]
-                y = performances[a][criterion]
-                c_pa = _get_partial_concordance(x, y, criterion)
-                c_dict_ap.update({criterion: c_ap})
-                c_dict_pa.update({criterion: c_pa})
-            p_dict_ap.update({p: c_dict_ap})
-            p_dict_pa.update({p: c_dict_pa})
-        partial_concordances_ap.update({a: p_dict_ap})
-        partial_concordances_pa.update({a: p_dict_pa})
-
-    # aggregate partial concordances
-    aggregated_concordances_ap = OrderedDict()
-    aggregated_concordances_pa = OrderedDict()
-    sum_of_weights = sum([weights[criterion] for criterion in criteria])
-    for a in alternatives:
-        p_dict_ap = OrderedDict()
-        p_dict_pa = OrderedDict()
+    def _get_partial_concordances(criterion, performance):
+        # partial concordances of given performance with all the profiles
+        params = criteria_params[criterion]
+        c_ap = {}
+        c_pa = {}
+        for p, profile_performance in zip(categories_profiles, profiles_columns[criterion]):
+            # compare alternatives with profiles
+            x = performance
+            y = profile_performance
+            c_ap[p] = _get_partial_concordance(x, y, params)
+            # compare profiles with alternatives
+            x = profile_performance
+            y = performance
+            c_pa[p] = _get_partial_concordance(x, y, params)
+        return c_ap, c_pa
+
+    # compute partial concordances and aggregate them
+    lookup = get_partial_lookup(_get_partial_concordances, cache_size)
+    aggregated_concordances_ap = ComparisonsMatrix(alternatives, categories_profiles)
+    aggregated_concordances_pa = ComparisonsMatrix(alternatives, categories_profiles)
+    sum_of_weights = sum([params.weight for _, params in criteria_items])
+    rows = get_performance_rows(performances, alternatives, criteria)
+    for a, row in zip(alternatives, rows):
+        # partial concordances are aggregated right away, so they don't have
+        # to be kept for all the alternatives
+        partials = [(params.weight, lookup(criterion, performance))
+                    for (criterion, params), performance in zip(criteria_items, row)]
+        p_dict_ap = aggregated_concordances_ap[a]
+        p_dict_pa = aggregated_concordances_pa[a]
         for p in categories_profiles:
             # 'C' - aggregated, 'c' - partial
-            C_ap = sum([weights[criterion] * partial_concordances_ap[a][p][criterion]
-                        for criterion in criteria]) / sum_of_weights
-            C_pa = sum([weights[criterion] * partial_concordances_pa[a][p][criterion]
-                        for criterion in criteria]) / sum_of_weights
-            p_dict_ap.update({p: C_ap})
-            p_dict_pa.update({p: C_pa})
-        aggregated_concordances_ap.update({a: p_dict_ap})
-        aggregated_concordances_pa.update({a: p_dict_pa})
+            C_ap = sum([weight * c_ap[p] for weight, (c_ap, _) in partials]) / sum_of_weights
+            C_pa = sum([weight * c_pa[p] for weight, (_, c_pa) in partials]) / sum_of_weights
+            p_dict_ap[p] = C_ap
+            p_dict_pa[p] = C_pa
 
     ret = reverseAltComparisons(
         aggregated_concordances_ap,
@@ -333,7 +1531,229 @@ def check_cut_threshold(threshold):
         raise RuntimeError("Cut threshold should be in range <0.0, 1.0>.")
 
 
+def get_cut_thresholds(xmltree):
+    """
+    Gets the list of cut thresholds for the 'sweep' mode of class assignment,
+    given either explicitly (as 'cut_thresholds' parameters) or as a range
+    ('cut_threshold_min', 'cut_threshold_max' and 'cut_threshold_step'
+    parameters). Returns None if none of them is present.
+    """
+    cut_thresholds = px.getParametersByName(xmltree, 'cut_thresholds')
+    if not cut_thresholds:
+        start = px.getParameterByName(xmltree, 'cut_threshold_min')
+        if start is None:
+            return None
+        stop = px.getParameterByName(xmltree, 'cut_threshold_max')
+        step = px.getParameterByName(xmltree, 'cut_threshold_step')
+        if stop is None or stop < start or not step > 0:
+            raise RuntimeError("Invalid range of cut thresholds.")
+        # the last threshold may fall short of 'stop' (but never exceeds it) if
+        # the range isn't a whole number of steps; epsilon is for cases like
+        # (0.9 - 0.3) / 0.2 == 2.9999999999999996
+        count = int(math.floor((stop - start) / step + 1e-9))
+        # rounding is here only to avoid values like 0.30000000000000004
+        cut_thresholds = [round(start + i * step, 10) for i in range(count + 1)]
+    cut_thresholds = [float(threshold) for threshold in cut_thresholds]
+    for threshold in cut_thresholds:
+        check_cut_threshold(threshold)
+    # thresholds are used as keys of the results, so duplicates would be lost
+    if len(set(cut_thresholds)) != len(cut_thresholds):
+        raise RuntimeError("Cut thresholds should be distinct.")
+    return cut_thresholds
+
+
+def sweep_cut_thresholds(alternatives, rows_ap, rows_pa, cut_thresholds, assign):
+    """
+    Computes affectations for every cut threshold from 'cut_thresholds', using
+    'assign(row_ap, row_pa, cut_threshold)' for single alternative (rows are
+    the ones returned by 'get_comparisons_rows').
+
+    Since the outcome of the assignment depends on the cut threshold only
+    through comparisons 'credibility >= cut_threshold', it can't change as
+    long as the threshold stays between the same two (sorted) credibility
+    values of the alternative - hence 'assign' is called once for each such
+    band only, no matter how many thresholds fall into it.
+    """
+    affectations = OrderedDict((t, OrderedDict()) for t in cut_thresholds)
+    for a, row_ap, row_pa in zip(alternatives, rows_ap, rows_pa):
+        values = sorted(set(chain(row_ap, row_pa)))
+        per_band = {}
+        for t in cut_thresholds:
+            band = bisect_left(values, t)
+            if band not in per_band:
+                per_band[band] = assign(row_ap, row_pa, t)
+            affectations[t][a] = per_band[band]
+    return affectations
+
+
+def get_stability_intervals(alternatives, rows_ap, rows_pa, get_scans):
+    """
+    For every alternative, finds the intervals of cut threshold within which
+    its assignment doesn't change (rows are the same as in
+    'sweep_cut_thresholds').
+
+    The assignment rules are given by 'get_scans(row_ap, row_pa)', as a list
+    of scans - one for every part of the affectation (e.g. the descending and
+    the ascending procedure of Electre Tri-C). Each scan is a pair of
+    (candidates, default), where candidates are (lower, upper, result) in the
+    order they're checked, and the first one for which
+    lower < cut_threshold <= upper gives the result of the scan ('default' if
+    there's none).
+
+    Every distinct credibility value of the alternative is a breakpoint, i.e.
+    for any threshold from (lower, upper] - where 'lower' and 'upper' are two
+    neighbouring breakpoints - the outcome is the same as for 'upper'. Since
+    the bounds of the candidates are credibility values as well, every one of
+    them holds for a contiguous range of such bands, which is found by
+    bisection. The bands are then swept in order, keeping the candidates which
+    hold on a heap (by the order they're checked in), so for 'k' profiles it
+    takes O(k log k) per alternative. The bands with equal outcomes are merged.
+
+    Each interval is returned as (lower, upper, affectation) and means
+    lower < cut_threshold <= upper, except for the first one, which includes
+    its lower bound (0.0) as well.
+    """
+    intervals = OrderedDict()
+    for a, row_ap, row_pa in zip(alternatives, rows_ap, rows_pa):
+        # 1.0 (the highest possible threshold) closes the last band
+        breakpoints = sorted(set(v for v in chain(row_ap, row_pa) if 0.0 <= v < 1.0))
+        breakpoints.append(1.0)
+        scans = get_scans(row_ap, row_pa)
+        # band -> [(scan, position of the candidate, its last band + 1, result)]
+        starts = {}
+        for scan, (candidates, _) in enumerate(scans):
+            for position, (lower, upper, result) in enumerate(candidates):
+                start = bisect_right(breakpoints, lower)
+                end = bisect_right(breakpoints, upper)
+                if start < end:
+                    starts.setdefault(start, []).append((scan, position, end, result))
+        heaps = [[] for _ in scans]
+        a_intervals = []
+        lower = 0.0
+        for band, upper in enumerate(breakpoints):
+            for scan, position, end, result in starts.get(band, ()):
+                heappush(heaps[scan], (position, end, result))
+            affectation = []
+            for heap, (_, default) in zip(heaps, scans):
+                while heap and heap[0][1] <= band:  # not holding anymore
+                    heappop(heap)
+                affectation.append(heap[0][2] if heap else default)
+            affectation = tuple(affectation)
+            if a_intervals and a_intervals[-1][2] == affectation:
+                a_intervals[-1] = (a_intervals[-1][0], upper, affectation)
+            else:
+                a_intervals.append((lower, upper, affectation))
+            lower = upper
+        intervals[a] = a_intervals
+    return intervals
+
+
+@timed_phase('build')
+def stability_intervals_to_xmcda(intervals):
+    xmcda = etree.Element('alternativesAffectations', mcdaConcept='stabilityIntervals')
+    for alternative, a_intervals in intervals.items():
+        for i, (lower, upper, affectation) in enumerate(a_intervals):
+            # the first interval includes its lower bound (see 'get_stability_intervals')
+            name = '{}{}, {}]'.format('[' if i == 0 else '(', lower, upper)
+            alternativeAffectation = etree.SubElement(xmcda, 'alternativeAffectation',
+                                                      name=name)
+            alternativeID = etree.SubElement(alternativeAffectation, 'alternativeID')
+            alternativeID.text = alternative
+            categoriesInterval = etree.SubElement(alternativeAffectation, 'categoriesInterval')
+            lowerBound = etree.SubElement(categoriesInterval, 'lowerBound')
+            categoryID = etree.SubElement(lowerBound, 'categoryID')
+            categoryID.text = affectation[0]
+            upperBound = etree.SubElement(categoriesInterval, 'upperBound')
+            categoryID = etree.SubElement(upperBound, 'categoryID')
+            categoryID.text = affectation[1]
+    return xmcda
+
+
+def stability_intervals_to_json(intervals):
+    # compact form: {alternative: [[lower, upper, lower_category, upper_category], ...]}
+    data = OrderedDict()
+    for alternative, a_intervals in intervals.items():
+        data[alternative] = [[lower, upper] + list(affectation)
+                             for lower, upper, affectation in a_intervals]
+    return json.dumps(data, separators=(',', ':'))
+
+
+@timed_phase('write')
+def write_stability_intervals(intervals, output_dir, output_format):
+    if output_format == 'xmcda':
+        xmcda = stability_intervals_to_xmcda(intervals)
+        write_xmcda(xmcda, os.path.join(output_dir, 'stability.xml'))
+    elif output_format == 'json':
+        try:
+            with _open_output(os.path.join(output_dir, 'stability.json'), 'w') as f:
+                f.write(stability_intervals_to_json(intervals))
+        except IOError as e:
+            raise IOError("{}: '{}'".format(e.strerror, e.filename))
+    else:
+        raise RuntimeError("Invalid output format: '{}'.".format(output_format))
+
+
 def get_error_message(err):
     exception = re.findall("\.([a-zA-Z]+)'", str(type(err)))[0]
     err_msg = ': '.join((exception, str(err)))
     return err_msg
+
+
+# Profiling of the modules (e.g. in production), turned on by setting the
+# environment variable to one of the profilers (see: 'profiled').
+PROFILE_ENV_VAR = 'ELECTRE_PROFILE'
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+def profiled(main):
+    """
+    Decorator for modules' 'main'. If ELECTRE_PROFILE environment variable is
+    set to 'cprofile' or 'tracemalloc', the run is profiled and the results
+    are written to the output directory (next to 'messages.xml'), as
+    '<module>.prof' (see: 'pstats') or '<module>.snapshot' (see:
+    'tracemalloc.Snapshot.load') respectively. Otherwise 'main' is simply
+    called.
+    """
+    @wraps(main)
+    def wrapper():
+        profiler = os.environ.get(PROFILE_ENV_VAR)
+        if not profiler:
+            return main()
+        if profiler not in PROFILERS or (profiler == 'tracemalloc' and tracemalloc is None):
+            # profiling shouldn't break the run
+            sys.stderr.write("Profiler '{}' is not available, running without "
+                             "profiling.\n".format(profiler))
+            return main()
+        module = sys.modules[main.__module__]
+        if profiler == 'cprofile':
+            profile = cProfile.Profile()
+            exit_code = profile.runcall(main)
+            dump, extension = profile.dump_stats, '.prof'
+        else:
+            tracemalloc.start()
+            try:
+                exit_code = main()
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+            dump, extension = snapshot.dump, '.snapshot'
+        output_dir = _get_output_dir(module)
+        if output_dir:
+            module_name = os.path.splitext(os.path.basename(module.__file__))[0]
+            try:
+                dump(os.path.join(output_dir, module_name + extension))
+            except (IOError, OSError) as e:
+                sys.stderr.write("Profile not written: {}\n".format(e))
+        return exit_code
+    return wrapper
+
+
+def _get_output_dir(module):
+    # the arguments are parsed once again (the same way as by module's 'main'),
+    # since 'main' doesn't return them
+    try:
+        args = docopt(module.__doc__, help=False)
+    except SystemExit:
+        return None
+    output_dir = args.get('-o')
+    return output_dir if output_dir and os.path.isdir(output_dir) else None
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+daemon - serves all the modules from a single, long-lived process, so the
+start of the interpreter, the imports (lxml, networkx etc.) and the loading of
+XMCDA schemas are paid only once, and not on every module's invocation.
+
+The server listens on a UNIX socket and handles every request in a separate
+(forked) process, so the results are exactly the same as when running the
+modules directly. The socket is accessible only to the user running the
+server (mode 0600), since the modules are run with the server's permissions
+on any input and output directories given. 'call' is a thin client which passes module's arguments to
+the server, prints module's output and exits with module's exit code, e.g.:
+
+    daemon.py serve /tmp/electre.sock &
+    daemon.py call /tmp/electre.sock ElectreTriConcordance -i ./in -o ./out
+
+Usage:
+    daemon.py serve SOCKET
+    daemon.py call SOCKET MODULE [ARGS...]
+
+Options:
+    --version  Show version.
+    -h --help  Show this screen.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from StringIO import StringIO
+import errno
+import importlib
+import json
+import os
+import socket
+import SocketServer
+import sys
+
+from docopt import docopt
+
+from common import reset_state
+
+__version__ = '0.1.0'
+
+MODULES = (
+    'ElectreCriteriaInteractionsConcordance',
+    'ElectreIVCredibility',
+    'ElectreIsDiscordanceBinary',
+    'ElectreIsFindKernel',
+    'ElectreIsOutrankingBinary',
+    'ElectreTriCClassAssign',
+    'ElectreTriCConcordance',
+    'ElectreTriCCredibility',
+    'ElectreTriCDiscordances',
+    'ElectreTriCSimplifiedClassAssign',
+    'ElectreTriClassAssign',
+    'ElectreTriConcordance',
+    'ElectreTriCredibility',
+    'ElectreTriDiscordances',
+)
+
+
+def load_modules(module_names=MODULES):
+    import PyXMCDA as px
+    for xsd_url in (px.XMCDA_2_0, px.XMCDA_2_1, px.XMCDA_2_2):
+        try:
+            px.getSchema(xsd_url)
+        except Exception:  # e.g. no network access - it will be retried later
+            pass
+    return {m: importlib.import_module('{0}.{0}'.format(m)) for m in module_names}
+
+
+def run_module(module, args, cwd):
+    # the server calls it in a separate (forked) process for every request, but
+    # 'batch.py' runs many jobs one after another in the same process - hence
+    # the settings left by the previous run (e.g. precision or compression) are
+    # reset first, and the current directory, 'sys.argv' and standard streams
+    # are simply replaced
+    reset_state()
+    stdout, stderr = StringIO(), StringIO()
+    streams = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        os.chdir(cwd)
+        sys.argv = [os.path.basename(module.__file__)] + args
+        exit_code = module.main()
+    except SystemExit as e:  # raised by docopt (e.g. '--help', wrong arguments)
+        if e.code is None or isinstance(e.code, int):
+            exit_code = e.code or 0
+        else:
+            print(e.code, file=stderr)
+            exit_code = 1
+    finally:
+        sys.stdout, sys.stderr = streams
+    return {'exit_code': exit_code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # e.g. checking if the server is running (see: 'serve')
+            return
+        request = json.loads(line)
+        module = self.server.modules.get(request['module'])
+        if module is None:
+            response = {
+                'exit_code': 1,
+                'stdout': '',
+                'stderr': "Unknown module: '{}'.\n".format(request['module']),
+            }
+        else:
+            response = run_module(module, request['args'], request['cwd'])
+        self.wfile.write(json.dumps(response) + '\n')
+
+
+class Server(SocketServer.ForkingMixIn, SocketServer.UnixStreamServer):
+    pass
+
+
+def serve(socket_path):
+    if os.path.exists(socket_path):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_path)
+        except socket.error as e:
+            if e.errno != errno.ECONNREFUSED:
+                raise
+            os.remove(socket_path)  # left by a server which is not running anymore
+        else:
+            raise RuntimeError("Socket '{}' is already in use.".format(socket_path))
+        finally:
+            client.close()
+    # the socket is created (on binding) with no permissions for the others
+    umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, RequestHandler)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o600)
+    server.modules = load_modules()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def call(socket_path, module_name, args):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    try:
+        f = client.makefile('rwb')
+        request = {'module': module_name, 'args': args, 'cwd': os.getcwd()}
+        f.write(json.dumps(request) + '\n')
+        f.flush()
+        response = json.loads(f.readline())
+    finally:
+        client.close()
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['exit_code']
+
+
+def main():
+    args = docopt(__doc__, version=__version__, options_first=True)
+    if args['serve']:
+        serve(args['SOCKET'])
+        return 0
+    return call(args['SOCKET'], args['MODULE'], args['ARGS'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,618 @@
+#!/usr/bin/env python
+
+"""
+Differential tests - the implementations used by the modules are run side by
+side with the reference ones on seeded random problems, and their results
+have to be the same (exactly, or within given number of ULPs for the real
+numbers). The references below are plain, dict-based implementations of the
+methods (the way they were originally written in the modules), so any faster
+engine (e.g. array-based, parallel or streaming one) can be checked against
+them just by adding it to the engines of the respective test.
+
+The problems are small, but the corner cases are made likely: ties at the
+thresholds (performances are integers, thresholds - halves), missing veto
+thresholds, both 'min' and 'max' preference directions, credibilities equal to
+the cut threshold, cycles and self-loops in the outranking relation etc.
+
+When the results differ, the problem is shrunk (by removing alternatives,
+criteria, profiles or relations one at a time, as long as the results still
+differ) and printed as a minimal reproducer.
+"""
+
+from collections import Mapping, OrderedDict
+from copy import deepcopy
+from functools import partial
+import json
+import random
+import signal
+import struct
+import unittest
+
+from networkx import DiGraph, is_directed_acyclic_graph, strongly_connected_components
+from networkx import topological_sort
+
+from common import (
+    ComparisonsMatrix,
+    get_concordance,
+    reverseAltComparisons,
+    unreverseAltComparisons,
+)
+from ElectreIsFindKernel.ElectreIsFindKernel import build_graph, find_kernel
+from ElectreIVCredibility.ElectreIVCredibility import get_credibility as get_credibility_iv
+from ElectreTriCClassAssign.ElectreTriCClassAssign import assign_class as assign_class_tri_c
+from ElectreTriCClassAssign.ElectreTriCClassAssign import assign_class_sweep as assign_class_sweep_tri_c
+from ElectreTriCClassAssign.ElectreTriCClassAssign import get_stability as get_stability_tri_c
+
+# number of random problems per test, and the seed of the first one
+PROBLEMS = 300
+SEED = 0
+# time limit (in seconds) for a single run on a single problem
+TIMEOUT = 5
+# credibilities and cut thresholds are drawn from these, so they're equal quite often
+VALUES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+# Running and comparing.
+
+class Error(object):
+    # outcome of a run which raised an exception - the engines have to fail
+    # whenever the reference does (and vice versa)
+
+    def __init__(self, exception):
+        self.name = type(exception).__name__
+        self.message = str(exception)
+
+    def __eq__(self, other):
+        return isinstance(other, Error) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.name, self.message)
+
+
+class Timeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise Timeout('No result in {} s.'.format(TIMEOUT))
+
+
+def run(function, problem):
+    # every run gets its own copy of the problem, so it can't affect the others
+    handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(TIMEOUT)
+    try:
+        return function(**deepcopy(problem))
+    except Exception as e:
+        return Error(e)
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, handler)
+
+
+def ulp_distance(x, y):
+    """Number of representable doubles between 'x' and 'y'."""
+    def _ordinal(v):
+        i = struct.unpack(b'<q', struct.pack(b'<d', float(v)))[0]
+        # negative doubles are ordered the other way round
+        return i if i >= 0 else -(i + 2 ** 63)
+    return abs(_ordinal(x) - _ordinal(y))
+
+
+def compare(expected, result, ulps=0, path=''):
+    """
+    Returns the description of the first difference between 'expected' and
+    'result' (nested mappings and sequences are compared element by element,
+    in order), or None if there isn't any.
+    """
+    def _differ(what, e, r):
+        return '{} {}: expected {!r}, got {!r}'.format(path or 'result', what, e, r)
+
+    if isinstance(expected, Error) or isinstance(result, Error):
+        return None if expected == result else _differ('outcome', expected, result)
+    if isinstance(expected, Mapping) and isinstance(result, Mapping):
+        if list(expected) != list(result):
+            return _differ('keys', list(expected), list(result))
+        for key in expected:
+            difference = compare(expected[key], result[key], ulps,
+                                 '{}[{!r}]'.format(path, key))
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, (list, tuple)) and isinstance(result, (list, tuple)):
+        if len(expected) != len(result):
+            return _differ('length', len(expected), len(result))
+        for i, (e, r) in enumerate(zip(expected, result)):
+            difference = compare(e, r, ulps, '{}[{}]'.format(path, i))
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, float) and isinstance(result, (int, long, float)):
+        if expected == result or ulp_distance(expected, result) <= ulps:
+            return None
+        return _differ('value', expected, result)
+    return None if expected == result else _differ('value', expected, result)
+
+
+def get_difference(reference, engines, problem, ulps=0):
+    expected = run(reference, problem)
+    for name, engine in engines:
+        difference = compare(expected, run(engine, problem), ulps)
+        if difference:
+            return '{}: {}'.format(name, difference)
+    return None
+
+
+def shrink(problem, smaller, get_difference):
+    # greedy - keeps the first smaller problem on which the results still
+    # differ, until there isn't any
+    while True:
+        for candidate in smaller(problem):
+            if get_difference(candidate):
+                problem = candidate
+                break
+        else:
+            return problem
+
+
+# Random problems. Every problem is a dict of keyword arguments for the
+# reference and the engines (the same structures as the ones returned by
+# PyXMCDA), and every label in it (alternative, criterion, profile or
+# category) is unique, so it can be removed from the problem altogether (see:
+# 'without').
+
+def get_labels(prefix, count):
+    return ['{}{}'.format(prefix, i) for i in range(1, count + 1)]
+
+
+def get_criteria(rnd, vetoes=True):
+    criteria = get_labels('g', rnd.randint(1, 4))
+    pref_directions = {c: rnd.choice(('min', 'max')) for c in criteria}
+    thresholds = {}
+    for c in criteria:
+        # multiples of 0.5, while performances are integers
+        q = rnd.randint(0, 4) * 0.5
+        p = q + rnd.randint(0, 6) * 0.5
+        thresholds[c] = {'indifference': q, 'preference': p}
+        if vetoes and rnd.random() < 0.7:  # otherwise there's no veto
+            thresholds[c]['veto'] = p + rnd.randint(0, 6) * 0.5
+    return criteria, pref_directions, thresholds
+
+
+def get_performances(rnd, rows, criteria):
+    return OrderedDict((r, OrderedDict((c, rnd.randint(0, 8)) for c in criteria)) for r in rows)
+
+
+def without(value, labels):
+    # copy of the problem (or any part of it) with given labels removed
+    if isinstance(value, Mapping):
+        return type(value)((k, without(v, labels)) for k, v in value.items() if k not in labels)
+    if isinstance(value, list):
+        return [without(v, labels) for v in value if v not in labels]
+    return value
+
+
+def without_each(problem, key, minimum=1, labels=lambda label: (label,)):
+    # smaller problems, each one without one of the labels from problem[key]
+    if len(problem[key]) > minimum:
+        for label in list(problem[key]):
+            yield without(problem, labels(label))
+
+
+def to_matrix(comparisons, rows, columns):
+    matrix = ComparisonsMatrix(rows, columns)
+    for r in rows:
+        for c in columns:
+            matrix[r][c] = comparisons[r][c]
+    return matrix
+
+
+# Concordance (common to Electre TRI and TRI-C).
+
+def reference_concordance(alternatives, categories_profiles, performances,
+                          profiles_performance_table, criteria, thresholds,
+                          pref_directions, weights):
+
+    def _omega(x, y):
+        if pref_directions[criterion] == 'max':
+            return x - y
+        if pref_directions[criterion] == 'min':
+            return y - x
+
+    def _get_partial_concordance(x, y, criterion):
+        p = thresholds[criterion].get('preference')
+        q = thresholds[criterion].get('indifference')
+        if _omega(x, y) < -p:
+            return 0
+        elif _omega(x, y) >= -q:
+            return 1
+        else:
+            return (_omega(x, y) + p) / (p - q)
+
+    concordance_ap = OrderedDict()
+    concordance_pa = OrderedDict()
+    sum_of_weights = sum([weights[criterion] for criterion in criteria])
+    for a in alternatives:
+        concordance_ap[a] = OrderedDict()
+        concordance_pa[a] = OrderedDict()
+        for p in categories_profiles:
+            c_ap = []
+            c_pa = []
+            for criterion in criteria:
+                x = performances[a][criterion]
+                y = profiles_performance_table[p][criterion]
+                c_ap.append(weights[criterion] * _get_partial_concordance(x, y, criterion))
+                c_pa.append(weights[criterion] * _get_partial_concordance(y, x, criterion))
+            concordance_ap[a][p] = sum(c_ap) / sum_of_weights
+            concordance_pa[a][p] = sum(c_pa) / sum_of_weights
+    return reverseAltComparisons(concordance_ap, concordance_pa, alternatives,
+                                 categories_profiles)
+
+
+def get_concordance_problem(rnd):
+    alternatives = get_labels('a', rnd.randint(1, 6))
+    profiles = get_labels('b', rnd.randint(1, 4))
+    criteria, pref_directions, thresholds = get_criteria(rnd, vetoes=False)
+    return OrderedDict([
+        ('alternatives', alternatives),
+        ('categories_profiles', profiles),
+        ('performances', get_performances(rnd, alternatives, criteria)),
+        ('profiles_performance_table', get_performances(rnd, profiles, criteria)),
+        ('criteria', criteria),
+        ('thresholds', thresholds),
+        ('pref_directions', pref_directions),
+        ('weights', {c: rnd.randint(1, 10) * 0.5 for c in criteria}),
+    ])
+
+
+def smaller_concordance_problems(problem):
+    for key in ('alternatives', 'categories_profiles', 'criteria'):
+        for smaller in without_each(problem, key):
+            yield smaller
+
+
+def get_concordance_matrix_input(**problem):
+    problem['performances'] = to_matrix(problem['performances'], problem['alternatives'],
+                                        problem['criteria'])
+    return get_concordance(**problem)
+
+
+CONCORDANCE_ENGINES = (
+    ('get_concordance', get_concordance),
+    ('get_concordance (matrix input)', get_concordance_matrix_input),
+    # evicting partial concordances from the cache all the time
+    ('get_concordance (cache of 1)', partial(get_concordance, cache_size=1)),
+)
+
+
+# Credibility (Electre IV).
+
+def reference_credibility_iv(performances, criteria, thresholds, pref_directions):
+    alternatives = performances.keys()
+    counts = {}
+    for a in alternatives:
+        for b in alternatives:
+            if a == b:
+                continue
+            # numbers of criteria on which 'a' is strictly preferred (np),
+            # weakly preferred (nq), indifferent but better (ni) and equal
+            # (no) to 'b'
+            np = nq = ni = no = 0
+            for c in criteria:
+                diff = performances[a][c] - performances[b][c]
+                if pref_directions[c] == 'min':
+                    diff = -diff
+                if diff > 0:
+                    if diff >= thresholds[c]['preference']:
+                        np += 1
+                    elif diff > thresholds[c]['indifference']:
+                        nq += 1
+                    else:
+                        ni += 1
+                elif diff == 0:
+                    no += 1
+            counts[a, b] = {'np': np, 'nq': nq, 'ni': ni, 'no': no}
+
+    def _get_credibility(a, b):
+        aSb = counts[a, b]
+        bSa = counts[b, a]
+        if bSa['np'] + bSa['nq'] == 0 and bSa['ni'] < aSb['np'] + aSb['ni']:
+            return 1.0
+        if bSa['np'] == 0:
+            if bSa['nq'] <= aSb['np'] and bSa['nq'] + bSa['ni'] < sum(aSb.values()):
+                return 0.8
+            if bSa['nq'] <= aSb['np'] + aSb['nq']:
+                return 0.6
+            return 0.4
+        if bSa['np'] <= 1 and aSb['np'] >= len(criteria) // 2:  # "at least half"
+            for c in criteria:
+                diff = performances[b][c] - performances[a][c]
+                if pref_directions[c] == 'min':
+                    diff = -diff
+                # (just like in the original implementation) when there's
+                # no veto threshold, any advantage of 'b' counts as a veto
+                veto = thresholds[c].get('veto')
+                if diff > 0 and (veto is None or diff > veto):
+                    return 0.0
+            return 0.2
+        return 0.0
+
+    return {a: {b: 1.0 if a == b else _get_credibility(a, b) for b in alternatives}
+            for a in alternatives}
+
+
+def get_credibility_iv_problem(rnd):
+    alternatives = get_labels('a', rnd.randint(1, 6))
+    criteria, pref_directions, thresholds = get_criteria(rnd)
+    return OrderedDict([
+        ('performances', get_performances(rnd, alternatives, criteria)),
+        ('criteria', criteria),
+        ('thresholds', thresholds),
+        ('pref_directions', pref_directions),
+    ])
+
+
+def smaller_credibility_iv_problems(problem):
+    for key in ('performances', 'criteria'):
+        for smaller in without_each(problem, key):
+            yield smaller
+
+
+def get_credibility_iv_matrix_input(**problem):
+    performances = problem['performances']
+    problem['performances'] = to_matrix(performances, performances.keys(), problem['criteria'])
+    return get_credibility_iv(**problem)
+
+
+def get_credibility_iv_incremental(**problem):
+    # every alternative 'changed', so the whole matrix is recomputed
+    return get_credibility_iv(changed=problem['performances'].keys(), **problem)
+
+
+CREDIBILITY_IV_ENGINES = (
+    ('get_credibility', get_credibility_iv),
+    ('get_credibility (matrix input)', get_credibility_iv_matrix_input),
+    ('get_credibility (incremental)', get_credibility_iv_incremental),
+)
+
+
+# Class assignment (Electre TRI-C).
+
+def reference_assign_class_tri_c(alternatives, categories_profiles, categories_rank,
+                                 credibility, cut_threshold):
+    credibility_ap, credibility_pa = unreverseAltComparisons(credibility, alternatives,
+                                                             categories_profiles)
+    # rank == 1 is the preferred category, so profiles go from the worst to
+    # the best one
+    categories = [c for c, _ in sorted(categories_rank.items(), key=lambda t: t[1],
+                                       reverse=True)]
+    profiles_categories = {v: k for k, v in categories_profiles.items()}
+    profiles = [profiles_categories[c] for c in categories]
+
+    def _outranks(a, p):
+        return credibility_ap[a][p] >= cut_threshold
+
+    def _outranked(a, p):
+        return credibility_pa[a][p] >= cut_threshold
+
+    affectations = OrderedDict()
+    for a in alternatives:
+        # from the most preferred profile to the least preferred one
+        descending = categories[0]
+        for i in range(len(profiles) - 2, -1, -1):
+            p, p_next = profiles[i], profiles[i + 1]
+            if (_outranks(a, p) and not _outranked(a, p) and
+                    (credibility_ap[a][p_next] > credibility_pa[a][p] or
+                     (credibility_ap[a][p_next] >= credibility_pa[a][p] and
+                      not _outranks(a, p_next) and not _outranked(a, p_next)))):
+                descending = categories_profiles[p_next]
+                break
+        # from the least preferred profile to the most preferred one
+        ascending = categories[-1]
+        for i in range(1, len(profiles)):
+            p, p_prev = profiles[i], profiles[i - 1]
+            if (_outranked(a, p) and not _outranks(a, p) and
+                    (credibility_pa[a][p_prev] > credibility_ap[a][p] or
+                     (credibility_pa[a][p_prev] >= credibility_ap[a][p] and
+                      not _outranks(a, p_prev) and not _outranked(a, p_prev)))):
+                ascending = categories_profiles[p_prev]
+                break
+        affectations[a] = (descending, ascending)
+    return affectations
+
+
+def get_assign_class_tri_c_problem(rnd):
+    alternatives = get_labels('a', rnd.randint(1, 6))
+    profiles = get_labels('b', rnd.randint(1, 4))
+    categories = get_labels('C', len(profiles))
+    ranks = range(1, len(categories) + 1)
+    rnd.shuffle(ranks)
+    credibility_ap = OrderedDict(
+        (a, OrderedDict((p, rnd.choice(VALUES)) for p in profiles)) for a in alternatives
+    )
+    credibility_pa = OrderedDict(
+        (a, OrderedDict((p, rnd.choice(VALUES)) for p in profiles)) for a in alternatives
+    )
+    return OrderedDict([
+        ('alternatives', alternatives),
+        ('categories_profiles', OrderedDict(zip(profiles, categories))),
+        ('categories_rank', dict(zip(categories, ranks))),
+        ('credibility', reverseAltComparisons(credibility_ap, credibility_pa, alternatives,
+                                              profiles)),
+        ('cut_threshold', rnd.choice(VALUES)),
+    ])
+
+
+def smaller_assign_class_tri_c_problems(problem):
+    for smaller in without_each(problem, 'alternatives'):
+        yield smaller
+    # profile goes together with its category
+    labels = lambda p: (p, problem['categories_profiles'][p])
+    for smaller in without_each(problem, 'categories_profiles', labels=labels):
+        yield smaller
+
+
+def assign_class_tri_c_matrix_input(**problem):
+    alternatives = problem['alternatives']
+    profiles = problem['categories_profiles'].keys()
+    credibility_ap, credibility_pa = unreverseAltComparisons(problem['credibility'],
+                                                             alternatives, profiles)
+    problem['credibility'] = reverseAltComparisons(
+        to_matrix(credibility_ap, alternatives, profiles),
+        to_matrix(credibility_pa, alternatives, profiles),
+        alternatives,
+        profiles,
+    )
+    return assign_class_tri_c(**problem)
+
+
+def assign_class_tri_c_sweep(**problem):
+    cut_threshold = problem.pop('cut_threshold')
+    return assign_class_sweep_tri_c(cut_thresholds=VALUES, **problem)[cut_threshold]
+
+
+def assign_class_tri_c_stability(**problem):
+    # assignments read from the stability intervals, i.e. from the ones
+    # containing the cut threshold
+    cut_threshold = problem.pop('cut_threshold')
+    affectations = OrderedDict()
+    for a, intervals in get_stability_tri_c(**problem).items():
+        for lower, upper, affectation in intervals:
+            if cut_threshold <= upper:
+                affectations[a] = affectation
+                break
+    return affectations
+
+
+ASSIGN_CLASS_TRI_C_ENGINES = (
+    ('assign_class', assign_class_tri_c),
+    ('assign_class (matrix input)', assign_class_tri_c_matrix_input),
+    ('assign_class_sweep', assign_class_tri_c_sweep),
+    ('get_stability', assign_class_tri_c_stability),
+)
+
+
+# Kernel (Electre Is). With cycles eliminated by aggregating their nodes, the
+# graph ends up as the condensation of the outranking relation (every strongly
+# connected component becomes a single node), and the kernel of an acyclic
+# graph is unique - so the kernel doesn't depend on the order in which the
+# cycles are found. That's not the case for cutting the weakest edges, though,
+# so there the reference only checks if the resulting graph is acyclic and if
+# the kernel is the kernel of that graph.
+
+def get_dag_kernel(graph):
+    # nodes which aren't outranked by any other node of the kernel
+    kernel = set()
+    for node in topological_sort(graph):
+        if not any(pred in kernel for pred in graph.predecessors(node)):
+            kernel.add(node)
+    return kernel
+
+
+def get_kernel_labels(kernel, graph, labels):
+    # kernel as sorted lists of labels of the alternatives (single ones, or
+    # the aggregated ones)
+    nodes = [[n] + (graph.node[n].get('aggr') or []) for n in kernel]
+    return sorted(sorted(labels[i] for i in node if i < len(labels)) for node in nodes)
+
+
+def reference_kernel_aggregate(alternatives, outranking, cut_threshold):
+    graph = DiGraph()
+    graph.add_nodes_from(alternatives)
+    for a, relations in outranking.items():
+        for b, value in relations.items():
+            if a != b and value >= cut_threshold:
+                graph.add_edge(a, b)
+    components = strongly_connected_components(graph)
+    component_of = {a: i for i, component in enumerate(components) for a in component}
+    condensation = DiGraph()
+    condensation.add_nodes_from(range(len(components)))
+    condensation.add_edges_from((component_of[a], component_of[b]) for a, b in graph.edges()
+                                if component_of[a] != component_of[b])
+    return sorted(sorted(components[i]) for i in get_dag_kernel(condensation))
+
+
+def find_kernel_aggregate(alternatives, outranking, cut_threshold):
+    graph = build_graph(alternatives, outranking, cut_threshold)
+    kernel, graph = find_kernel(graph, 'aggregate')
+    return get_kernel_labels(kernel, graph, alternatives)
+
+
+def reference_kernel_cut_weakest(alternatives, outranking, cut_threshold):
+    return 'acyclic graph and its kernel'
+
+
+def find_kernel_cut_weakest(alternatives, outranking, cut_threshold):
+    original = build_graph(alternatives, outranking, cut_threshold)
+    kernel, graph = find_kernel(original, 'cut_weakest')
+    if not set(graph.edges()) <= set(original.edges()):
+        return 'edges added: {}'.format(sorted(set(graph.edges()) - set(original.edges())))
+    if not is_directed_acyclic_graph(graph):
+        return 'cyclic graph'
+    if set(kernel) != get_dag_kernel(graph):
+        return 'kernel {} of graph {}'.format(sorted(kernel), sorted(graph.edges()))
+    return 'acyclic graph and its kernel'
+
+
+def get_kernel_problem(rnd):
+    alternatives = get_labels('a', rnd.randint(1, 7))
+    density = rnd.random()
+    outranking = OrderedDict()
+    for a in alternatives:
+        outranking[a] = OrderedDict(
+            (b, rnd.choice(VALUES[1:])) for b in alternatives if rnd.random() < density
+        )
+    return OrderedDict([
+        ('alternatives', alternatives),
+        ('outranking', outranking),
+        ('cut_threshold', rnd.choice(VALUES[1:])),
+    ])
+
+
+def smaller_kernel_problems(problem):
+    for smaller in without_each(problem, 'alternatives'):
+        yield smaller
+    for a, relations in problem['outranking'].items():
+        for b in relations:
+            smaller = deepcopy(problem)
+            del smaller['outranking'][a][b]
+            yield smaller
+
+
+class TestDifferential(unittest.TestCase):
+
+    def check(self, get_problem, smaller, reference, engines, ulps=0):
+        get_diff = lambda problem: get_difference(reference, engines, problem, ulps)
+        for seed in range(SEED, SEED + PROBLEMS):
+            problem = get_problem(random.Random(seed))
+            if get_diff(problem):
+                problem = shrink(problem, smaller, get_diff)
+                self.fail('{}\nProblem (seed {}, shrunk):\n{}'.format(
+                    get_diff(problem), seed, json.dumps(problem, indent=2)))
+
+    def test_concordance(self):
+        self.check(get_concordance_problem, smaller_concordance_problems,
+                   reference_concordance, CONCORDANCE_ENGINES)
+
+    def test_credibility_iv(self):
+        self.check(get_credibility_iv_problem, smaller_credibility_iv_problems,
+                   reference_credibility_iv, CREDIBILITY_IV_ENGINES)
+
+    def test_assign_class_tri_c(self):
+        self.check(get_assign_class_tri_c_problem, smaller_assign_class_tri_c_problems,
+                   reference_assign_class_tri_c, ASSIGN_CLASS_TRI_C_ENGINES)
+
+    def test_kernel_aggregate(self):
+        self.check(get_kernel_problem, smaller_kernel_problems, reference_kernel_aggregate,
+                   (('find_kernel', find_kernel_aggregate),))
+
+    def test_kernel_cut_weakest(self):
+        self.check(get_kernel_problem, smaller_kernel_problems, reference_kernel_cut_weakest,
+                   (('find_kernel', find_kernel_cut_weakest),))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""
+Scaling tests - every module is run on synthetic problems (see:
+'benchmark.py') of a few doubling sizes, and the growth of its running time is
+checked against module's complexity class documented in 'COMPLEXITY' below.
+This way the hot spots which were fixed (e.g. looking up alternatives in lists
+instead of sets, or enumerating all the cycles of the outranking graph) can't
+come back unnoticed.
+
+Since these tests take a few minutes, they are kept apart from 'unit_tests.py'.
+"""
+
+from __future__ import division
+
+from collections import OrderedDict
+import math
+import shutil
+import tempfile
+import unittest
+
+from benchmark import ProblemGenerator, benchmark
+
+# module's complexity class, i.e. the exponent of the number of alternatives
+# (with the number of criteria and profiles being constant), and the smallest
+# size of the problem it's run on - it has to be big enough for the running
+# time not to be dominated by the constant costs (e.g. reading the criteria)
+COMPLEXITY = OrderedDict([
+    # n alternatives compared with every profile
+    ('ElectreTriCClassAssign', (1, 200)),
+    ('ElectreTriCConcordance', (1, 200)),
+    ('ElectreTriCCredibility', (1, 200)),
+    ('ElectreTriCDiscordances', (1, 200)),
+    ('ElectreTriCSimplifiedClassAssign', (1, 200)),
+    ('ElectreTriClassAssign', (1, 200)),
+    ('ElectreTriConcordance', (1, 200)),
+    ('ElectreTriCredibility', (1, 200)),
+    ('ElectreTriDiscordances', (1, 200)),
+    # n alternatives compared with each other
+    ('ElectreCriteriaInteractionsConcordance', (2, 50)),
+    ('ElectreIVCredibility', (2, 50)),
+    ('ElectreIsDiscordanceBinary', (2, 50)),
+    ('ElectreIsOutrankingBinary', (2, 50)),
+    # every cycle of the outranking graph (and there are O(n) of them) is
+    # found in linear time
+    ('ElectreIsFindKernel', (2, 400)),
+])
+
+# how many times every problem size is doubled
+DOUBLINGS = 2
+# measured exponent may exceed the documented one by that much (the
+# measurements are noisy, especially for the small problems)
+TOLERANCE = 0.5
+REPEAT = 2
+# exceeding it usually means an exponential blow-up
+TIMEOUT = 120
+
+
+def measure(module_name, size):
+    generator = ProblemGenerator(alternatives=size, criteria=10, profiles=5,
+                                 veto_density=0.5, cycle_density=0.05, seed=0)
+    problem_dir = tempfile.mkdtemp()
+    try:
+        generator.write(problem_dir, (module_name,))
+        return benchmark((module_name,), problem_dir, REPEAT, TIMEOUT)[module_name]
+    finally:
+        shutil.rmtree(problem_dir)
+
+
+class TestScaling(unittest.TestCase):
+
+    def test_growth(self):
+        failures = []
+        for module_name, (exponent, size) in COMPLEXITY.items():
+            sizes = [size * 2 ** i for i in range(DOUBLINGS + 1)]
+            times = []
+            for s in sizes:
+                result = measure(module_name, s)
+                if 'error' in result:
+                    failures.append("{} ({} alternatives): {}".format(module_name, s,
+                                                                      result['error']))
+                    break
+                times.append(result['total'])
+            else:
+                for s, t_prev, t in zip(sizes[1:], times, times[1:]):
+                    measured = math.log(t / t_prev, 2)
+                    if measured > exponent + TOLERANCE:
+                        failures.append("{} ({} alternatives): O(n^{:.2f}), expected O(n^{})."
+                                        .format(module_name, s, measured, exponent))
+        self.assertEqual(failures, [], '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
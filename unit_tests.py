@@ -1,16 +1,76 @@
 #!/usr/bin/env python
 
 from collections import OrderedDict
+from multiprocessing import Process
+import importlib
+import json
+import os
+import pstats
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 
+from lxml import etree
 from networkx import DiGraph
+import PyXMCDA as px
 
+from common import (
+    check_performance_table,
+    comparisons_to_xmcda,
+    ComparisonsMatrix,
+    create_messages_file,
+    decompress,
+    find_input_file,
+    format_value,
+    get_cache_key,
+    get_changed_alternatives,
+    get_changed_alternatives_pairwise,
+    get_comparisons_rows,
+    get_concordance,
+    get_criteria_params,
+    get_cut_thresholds,
+    get_partial_lookup,
+    get_performance_table,
+    get_timings,
+    get_trees,
+    HEADER,
+    merge_comparisons,
+    merge_pairwise,
+    reset_state,
+    restore_cached_results,
+    reverseAltComparisons,
+    set_compression,
+    set_output_format,
+    set_precision,
+    start_timings,
+    store_results_in_cache,
+    timed,
+    timings_to_messages,
+    unreverseAltComparisons,
+    write_xmcda,
+)
+import batch
+import common
+import daemon
 from ElectreIsFindKernel.ElectreIsFindKernel import build_graph, find_kernel
+from ElectreIsFindKernel.ElectreIsFindKernel import main as main_find_kernel
 from ElectreIVCredibility.ElectreIVCredibility import get_credibility as get_credibility_iv
+from ElectreTriCCredibility.ElectreTriCCredibility import get_credibility as get_credibility_tri_c
 from ElectreTriCClassAssign.ElectreTriCClassAssign import assign_class as assign_class_tri_c
+from ElectreTriCClassAssign.ElectreTriCClassAssign import assign_class_sweep as assign_class_sweep_tri_c
+from ElectreTriCClassAssign.ElectreTriCClassAssign import get_stability as get_stability_tri_c
 from ElectreIsDiscordanceBinary.ElectreIsDiscordanceBinary import get_discordances, aggregate_discordances
 from ElectreTriClassAssign.ElectreTriClassAssign import assign_class as assign_class_tri
+from ElectreTriClassAssign.ElectreTriClassAssign import assign_class_sweep as assign_class_sweep_tri
+from ElectreTriClassAssign.ElectreTriClassAssign import get_stability as get_stability_tri
 from ElectreTriCredibility.ElectreTriCredibility import get_credibility as get_credibility_tri
+from ElectreTriDiscordances.ElectreTriDiscordances import get_discordances as get_discordances_tri
+from ElectreTriDiscordances.ElectreTriDiscordances import iter_discordances as iter_discordances_tri
 
 
 class TestElectreIsFindKernel(unittest.TestCase):
@@ -220,6 +280,40 @@ class TestElectreIsFindKernel(unittest.TestCase):
         found, _ = find_kernel(self.sample_graphs['uni3'], eliminate_cycles_method='aggregate')
         self.assertEqual(expected, found)
 
+    def test_find_kernel_row_emptied_by_removal(self):
+        # removing 0 empties the row of 1 as well, which used to be the first
+        # one to take an element from next
+        graph = DiGraph()
+        graph.add_weighted_edges_from([(0, 1, 0.8), (1, 0, 0.7), (2, 3, 0.9), (3, 4, 0.6),
+                                       (4, 2, 0.8)])
+        found, aggregated = find_kernel(graph.copy(), eliminate_cycles_method='aggregate')
+        self.assertEqual(found, [5, 6])
+        self.assertEqual(aggregated.node[5]['aggr'], [0, 1])
+        self.assertEqual(aggregated.node[6]['aggr'], [2, 3, 4])
+        found, _ = find_kernel(graph, eliminate_cycles_method='cut_weakest')
+        self.assertEqual(sorted(found), [0, 3, 4])
+
+    def test_find_kernel_cycle_closed_by_last_node(self):
+        # used to hang
+        graph = DiGraph([(0, 1), (1, 0), (1, 2)])
+        found, graph = find_kernel(graph, eliminate_cycles_method='aggregate')
+        self.assertEqual(found, [3])
+        self.assertEqual(graph.node[3]['aggr'], [0, 1])
+
+    def test_find_kernel_many_aggregated_nodes(self):
+        # the cycle (0, 1) -> (2, 3) -> (0, 1) is found only after both of
+        # its parts are aggregated
+        graph = DiGraph([(0, 1), (1, 0), (2, 3), (3, 2), (1, 2), (3, 0), (3, 4)])
+        found, graph = find_kernel(graph, eliminate_cycles_method='aggregate')
+        self.assertEqual(found, [7])
+        self.assertEqual(graph.node[7]['aggr'], [0, 1, 2, 3])
+
+    def test_find_kernel_cut_weakest_without_edges(self):
+        graph = DiGraph()
+        graph.add_nodes_from([0, 1, 2])
+        found, _ = find_kernel(graph, eliminate_cycles_method='cut_weakest')
+        self.assertEqual(found, [0, 1, 2])
+
 
 class TestElectreIvCredibility(unittest.TestCase):
 
@@ -251,6 +345,22 @@ class TestElectreIvCredibility(unittest.TestCase):
                                     self.pref_directions)
         self.assertEqual(result, self.expected_result)
 
+    def test_incremental(self):
+        performances = {k: dict(v) for k, v in self.performances.items()}
+        performances['bel']['safety'] = 7.0
+        performances['swe'] = {'safety': 9.0, 'cost': 700.0, 'power': 80.0}
+        alternatives = sorted(performances.keys())
+        changed = get_changed_alternatives(alternatives, performances, self.performances,
+                                           self.expected_result)
+        self.assertEqual(changed, ['bel', 'swe'])
+        result = get_credibility_iv(performances, self.criteria, self.thresholds,
+                                    self.pref_directions, changed=changed)
+        self.assertEqual(len(result['aut']), 2)
+        result = merge_pairwise(self.expected_result, result, alternatives)
+        expected = get_credibility_iv(performances, self.criteria, self.thresholds,
+                                      self.pref_directions)
+        self.assertEqual(result, expected)
+
 
 class TestElectreTriCClassAssign(unittest.TestCase):
 
@@ -389,6 +499,36 @@ class TestElectreTriCClassAssign(unittest.TestCase):
                                     self.categories_rank, self.credibility, self.cut_threshold)
         self.assertEqual(result, self.expected_result)
 
+    def test_sweep(self):
+        cut_thresholds = [0.5, 0.6, 0.7, 0.75, 1.0]
+        result = assign_class_sweep_tri_c(self.alternatives, self.categories_profiles,
+                                          self.categories_rank, self.credibility, cut_thresholds)
+        self.assertEqual(result.keys(), cut_thresholds)
+        for cut_threshold in cut_thresholds:
+            expected = assign_class_tri_c(self.alternatives, self.categories_profiles,
+                                          self.categories_rank, self.credibility, cut_threshold)
+            self.assertEqual(result[cut_threshold], expected)
+
+    def test_stability(self):
+        result = get_stability_tri_c(self.alternatives, self.categories_profiles,
+                                     self.categories_rank, self.credibility)
+        self.assertEqual(result['a5'], [
+            (0.0, 0.0, ('C1', 'C4')),
+            (0.0, 0.692307692308, ('C1', 'C2')),
+            (0.692307692308, 1.0, ('C1', 'C3')),
+        ])
+        # every interval should give the same assignment as its upper bound
+        # (and any other threshold within it)
+        for alternative, intervals in result.items():
+            self.assertEqual(intervals[0][0], 0.0)
+            self.assertEqual(intervals[-1][1], 1.0)
+            for lower, upper, affectation in intervals:
+                for cut_threshold in (upper, (lower + upper) / 2):
+                    expected = assign_class_tri_c(self.alternatives, self.categories_profiles,
+                                                  self.categories_rank, self.credibility,
+                                                  cut_threshold)
+                    self.assertEqual(affectation, expected[alternative])
+
 
 class TestElectreIsDiscordanceBinary(unittest.TestCase):
 
@@ -454,6 +594,26 @@ class TestElectreIsDiscordanceBinary(unittest.TestCase):
         result = aggregate_discordances(self.discordances)
         self.assertEqual(result, self.aggregated_discordances)
 
+    def test_incremental(self):
+        aggregated_discordances = {k: dict(v) for k, v in self.aggregated_discordances.items()}
+        aggregated_discordances['ita']['bel'] = 1
+        changed = get_changed_alternatives_pairwise(self.alternatives, aggregated_discordances,
+                                                    self.aggregated_discordances,
+                                                    self.aggregated_discordances)
+        self.assertEqual(changed, ['ita', 'bel'])
+        performances = {k: dict(v) for k, v in self.performances.items()}
+        performances['ger']['cost'] = 900.0
+        discordances = get_discordances(self.alternatives, self.criteria,
+                                        self.pref_directions, self.thresholds,
+                                        performances, changed=['ger'])
+        result = merge_pairwise(self.aggregated_discordances,
+                                aggregate_discordances(discordances), self.alternatives)
+        expected = aggregate_discordances(get_discordances(self.alternatives, self.criteria,
+                                                           self.pref_directions,
+                                                           self.thresholds, performances))
+        self.assertEqual(result, expected)
+        self.assertNotEqual(result, self.aggregated_discordances)
+
 
 class TestElectreTriClassAssign(unittest.TestCase):
 
@@ -489,6 +649,31 @@ class TestElectreTriClassAssign(unittest.TestCase):
                                   self.credibility, self.cut_threshold)
         self.assertEqual(result, self.expected_result)
 
+    def test_sweep(self):
+        cut_thresholds = [0.5, 0.6, 0.7, 0.75, 1.0]
+        result = assign_class_sweep_tri(self.alternatives, self.categories_profiles,
+                                        self.credibility, cut_thresholds)
+        self.assertEqual(result.keys(), cut_thresholds)
+        for cut_threshold in cut_thresholds:
+            expected = assign_class_tri(self.alternatives, self.categories_profiles,
+                                        self.credibility, cut_threshold)
+            self.assertEqual(result[cut_threshold], expected)
+
+    def test_stability(self):
+        result = get_stability_tri(self.alternatives, self.categories_profiles, self.credibility)
+        self.assertEqual(result['a01'], [
+            (0.0, 0.7, ('Medium', 'Good')),
+            (0.7, 0.7219, ('Medium', 'Medium')),
+            (0.7219, 0.976, ('Medium', 'Good')),
+            (0.976, 1.0, ('Bad', 'Good')),
+        ])
+        for alternative, intervals in result.items():
+            for lower, upper, affectation in intervals:
+                for cut_threshold in (upper, (lower + upper) / 2):
+                    expected = assign_class_tri(self.alternatives, self.categories_profiles,
+                                                self.credibility, cut_threshold)
+                    self.assertEqual(affectation, expected[alternative])
+
 
 class TestElectreTriCredibility(unittest.TestCase):
 
@@ -564,6 +749,640 @@ class TestElectreTriCredibility(unittest.TestCase):
                                      self.alternatives, self.categories_profiles)
         self.assertEqual(result, self.expected_result)
 
+    def test_incremental(self):
+        previous_result = get_credibility_tri(self.concordance, self.discordances,
+                                              self.alternatives, self.categories_profiles)
+        concordance = OrderedDict((k, OrderedDict(v)) for k, v in self.concordance.items())
+        concordance['a03']['pMG'] = 0.5
+        concordance['pBM']['a05'] = 0.9
+        changed = get_changed_alternatives(self.alternatives, concordance, self.concordance,
+                                           previous_result, self.categories_profiles)
+        self.assertEqual(changed, ['a03', 'a05'])
+        result = get_credibility_tri(concordance, self.discordances, changed,
+                                     self.categories_profiles)
+        result = merge_comparisons(previous_result, result, self.alternatives,
+                                   self.categories_profiles)
+        expected = get_credibility_tri(concordance, self.discordances,
+                                       self.alternatives, self.categories_profiles)
+        self.assertEqual(result, expected)
+
+    def test_discordances_not_above_concordance(self):
+        # partial discordances which don't exceed the concordance don't weaken
+        # the credibility, even if none of them does (i.e. the product is empty)
+        discordances = OrderedDict((k, OrderedDict((k2, OrderedDict(v2)) for k2, v2 in v.items()))
+                                   for k, v in self.discordances.items())
+        discordances['a01']['pMG']['c02'] = 0.3
+        discordances['pMG']['a03']['c01'] = 0.7891
+        discordances['a05']['pBM'].update([('c01', 0.5), ('c02', 0.9883)])
+        for get_credibility in (get_credibility_tri, get_credibility_tri_c):
+            result = get_credibility(self.concordance, discordances,
+                                     self.alternatives, self.categories_profiles)
+            self.assertEqual(result['a01']['pMG'], 0.7)
+            self.assertEqual(result['pMG']['a03'], 0.7891)
+            self.assertAlmostEqual(result['a05']['pBM'], 0.9766 * (1 - 0.9883) / (1 - 0.9766))
+            self.assertEqual(result['a02'], self.expected_result['a02'])
+
+    def test_lazy_discordances(self):
+        alternatives, profiles, criteria = ['a01', 'a02', 'a03'], ['p01', 'p02'], ['g1', 'g2', 'g3']
+        performances = {'a01': {'g1': 1, 'g2': 9, 'g3': 5}, 'a02': {'g1': 7, 'g2': 2, 'g3': 4},
+                        'a03': {'g1': 4, 'g2': 4, 'g3': 6}}
+        profiles_performances = {'p01': {'g1': 3, 'g2': 3, 'g3': 3},
+                                 'p02': {'g1': 6, 'g2': 6, 'g3': 6}}
+        thresholds = {'g1': {'indifference': 0.5, 'preference': 1.0, 'veto': 4.0},
+                      'g2': {'indifference': 0.5, 'preference': 1.5, 'veto': 3.0},
+                      'g3': {'indifference': 0.5, 'preference': 1.0}}
+        directions = {'g1': 'max', 'g2': 'max', 'g3': 'min'}
+        weights = {'g1': 0.5, 'g2': 0.25, 'g3': 0.25}
+        args = (alternatives, profiles, criteria, thresholds, performances, directions,
+                profiles_performances)
+        concordance = get_concordance(alternatives, profiles, performances,
+                                      profiles_performances, criteria, thresholds,
+                                      directions, weights)
+        partials = list(iter_discordances_tri(*args))
+        # the ones for 'g3' (without veto) are left out
+        self.assertEqual(partials[:2], [('a01', 'p01', [1.0 / 3, 0], [0, 1]),
+                                        ('a01', 'p02', [1, 0], [0, 1.0])])
+        expected = get_credibility_tri(concordance, get_discordances_tri(*args),
+                                       alternatives, profiles)
+        result = get_credibility_tri(concordance, iter(partials), alternatives, profiles)
+        self.assertEqual(result, expected)
+
+
+class TestResultsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirs = {}
+        for d in ('in', 'out', 'out2', 'cache'):
+            self.dirs[d] = os.path.join(self.tmp_dir, d)
+            os.mkdir(self.dirs[d])
+        with open(os.path.join(self.dirs['in'], 'alternatives.xml'), 'w') as f:
+            f.write('<alternatives/>')
+        with open(os.path.join(self.dirs['out'], 'messages.xml'), 'w') as f:
+            f.write('<methodMessages/>')
+        self.args = {'-i': self.dirs['in'], '-o': self.dirs['out'], '--cache': self.dirs['cache']}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key(self):
+        key = get_cache_key(self.args, 'Module.py', '0.1.0')
+        self.assertEqual(key, get_cache_key(dict(self.args, **{'-o': 'x'}), 'Module.py', '0.1.0'))
+        # the incremental mode gives the same outputs (see: 'TestIncrementalMode')
+        incremental = {'--previous-input': 'x', '--previous-output': 'y'}
+        self.assertEqual(key, get_cache_key(dict(self.args, **incremental), 'Module.py', '0.1.0'))
+        self.assertNotEqual(key, get_cache_key(self.args, 'Module.py', '0.2.0'))
+        self.assertNotEqual(key, get_cache_key(self.args, 'Other.py', '0.1.0'))
+        with open(os.path.join(self.dirs['in'], 'alternatives.xml'), 'w') as f:
+            f.write('<alternatives></alternatives>')
+        self.assertNotEqual(key, get_cache_key(self.args, 'Module.py', '0.1.0'))
+
+    def test_store_and_restore(self):
+        key = get_cache_key(self.args, 'Module.py', '0.1.0')
+        self.assertFalse(restore_cached_results(self.dirs['cache'], key, self.dirs['out2']))
+        create_messages_file(('Everything OK.',), None, self.dirs['out'])
+        store_results_in_cache(self.dirs['cache'], key, self.dirs['out'])
+        self.assertTrue(restore_cached_results(self.dirs['cache'], key, self.dirs['out2']))
+        with open(os.path.join(self.dirs['out'], 'messages.xml')) as f:
+            messages = f.read()
+        with open(os.path.join(self.dirs['out2'], 'messages.xml')) as f:
+            self.assertEqual(f.read(), messages)
+
+    def run_module(self, name, use_cache):
+        # the same as a module run, with the results depending on the input
+        input_dir = os.path.join(self.tmp_dir, name)
+        if not os.path.isdir(input_dir):
+            os.mkdir(input_dir)
+            with open(os.path.join(input_dir, 'alternatives.xml'), 'w') as f:
+                f.write('<alternatives name="{}"/>'.format(name))
+        args = dict(self.args, **{'-i': input_dir, '-o': self.dirs['out2']})
+        key = get_cache_key(args, 'Module.py', '0.1.0')
+        if use_cache and restore_cached_results(self.dirs['cache'], key, self.dirs['out2']):
+            return
+        write_xmcda(etree.Element('alternativesAffectations', name=name),
+                    os.path.join(self.dirs['out2'], 'affectations.xml'))
+        create_messages_file(('Everything OK.',), None, self.dirs['out2'])
+        if use_cache:
+            store_results_in_cache(self.dirs['cache'], key, self.dirs['out2'])
+
+    def get_result(self):
+        with open(os.path.join(self.dirs['out2'], 'affectations.xml')) as f:
+            return etree.fromstring(f.read()).find('alternativesAffectations').get('name')
+
+    def test_restored_results_not_shared_with_cache(self):
+        self.run_module('x', use_cache=True)
+        self.run_module('x', use_cache=True)
+        self.run_module('y', use_cache=False)
+        self.assertEqual(self.get_result(), 'y')
+        self.run_module('x', use_cache=True)
+        self.assertEqual(self.get_result(), 'x')
+
+    def test_stale_files_not_stored(self):
+        with open(os.path.join(self.dirs['out2'], 'stability.json'), 'w') as f:
+            f.write('{}')  # left by some previous run
+        self.run_module('x', use_cache=True)
+        os.remove(os.path.join(self.dirs['out2'], 'stability.json'))
+        self.run_module('x', use_cache=True)
+        self.assertEqual(sorted(os.listdir(self.dirs['out2'])),
+                         ['affectations.xml', 'messages.xml'])
+
+
+class TestComparisonsMatrix(unittest.TestCase):
+
+    def test_dict_like(self):
+        m = ComparisonsMatrix(['a01', 'a02'], ['p01', 'p02'])
+        m['a01']['p02'] = 0.5
+        m['a02'] = OrderedDict([('p01', 1), ('p02', None)])
+        self.assertEqual(m['a01'].keys(), ['p02'])
+        self.assertRaises(KeyError, lambda: m['a01']['p01'])
+        # types of the values are kept, so they are serialized the same way
+        self.assertEqual([(type(v), v) for v in m['a02'].values()],
+                         [(int, 1), (type(None), None)])
+        self.assertEqual(m, {'a01': {'p02': 0.5}, 'a02': {'p01': 1, 'p02': None}})
+
+    def test_partials_and_transposed(self):
+        m = ComparisonsMatrix(['a01', 'a02'], ['p01'], ['g1', 'g2'])
+        m['a01']['p01'] = {'g1': 0.0, 'g2': 1.0}
+        t = m.transposed()
+        self.assertEqual(t.keys(), ['p01'])
+        self.assertEqual(t['p01'].keys(), ['a01'])
+        t['p01']['a02'] = {'g2': 0.25}
+        self.assertEqual(m['a02']['p01'].items(), [('g2', 0.25)])
+        self.assertEqual(m['a01']['p01'], t['p01']['a01'])
+
+    def test_layers(self):
+        m = ComparisonsMatrix(['a01', 'a02'], ['p01', 'p02'], ['g1', 'g2', 'g3'])
+        m.fill_layer('g1', 0)
+        m.set_layer('g2', [[0.5, 1], [None, 0.0]])
+        self.assertEqual(m['a01']['p02'], {'g1': 0, 'g2': 1})
+        self.assertEqual(m['a02']['p01'].items(), [('g1', 0), ('g2', None)])
+        self.assertEqual([type(v) for v in m['a01']['p01'].values()], [int, float])
+        self.assertRaises(ValueError, m.set_layer, 'g3', [[0.0]])
+        self.assertRaises(ValueError, m.transposed().set_layer, 'g3', [[0.0, 0.0]] * 2)
+
+    def test_profiles_comparisons(self):
+        alternatives, profiles = ['a01', 'a02'], ['p01', 'p02']
+        ap = ComparisonsMatrix(alternatives, profiles)
+        pa = ComparisonsMatrix(alternatives, profiles)
+        for i, a in enumerate(alternatives):
+            for j, p in enumerate(profiles):
+                ap[a][p] = float(i + j)
+                pa[a][p] = float(i - j)
+        comparisons = reverseAltComparisons(ap, pa, alternatives, profiles)
+        self.assertEqual(comparisons.keys(), alternatives + profiles)
+        self.assertEqual(comparisons['p02'], {'a01': -1.0, 'a02': 0.0})
+        # no copies in either direction
+        ap2, pa2 = unreverseAltComparisons(comparisons, alternatives, profiles)
+        self.assertIs(ap2, ap)
+        self.assertIs(pa2, pa)
+        self.assertEqual(get_comparisons_rows(comparisons, alternatives, ['p02']),
+                         ([[1.0], [2.0]], [[-1.0], [0.0]]))
+
+    def test_reduced_precision(self):
+        self.addCleanup(set_precision, None)
+        for precision, error in (('float32', 6e-8), ('uint16', 2 ** -16)):
+            set_precision(precision)
+            m = ComparisonsMatrix(['a01'], ['p01', 'p02', 'p03'])
+            m['a01'] = OrderedDict([('p01', 0.1), ('p02', 0.75), ('p03', 1)])
+            self.assertEqual(m.precision, precision)
+            self.assertAlmostEqual(m['a01']['p01'], 0.1, delta=error)
+            self.assertEqual(m['a01'].values()[1:], [0.75, 1])
+            self.assertEqual(m.get_rows(['a01'], ['p02']), [[0.75]])
+            # written values are read back the same (and as short as possible)
+            m2 = ComparisonsMatrix(['a01'], ['p01'])
+            m2['a01']['p01'] = float(format_value(m['a01']['p01']))
+            self.assertEqual(m2['a01']['p01'], m['a01']['p01'])
+            self.assertEqual(format_value(m['a01']['p02']), '0.75')
+        self.assertRaises(RuntimeError, m['a01'].__setitem__, 'p01', 1.5)
+        self.assertRaises(RuntimeError, set_precision, 'float16')
+
+
+class TestCriteriaParams(unittest.TestCase):
+
+    def test_get_criteria_params(self):
+        params = get_criteria_params(
+            ['g1', 'g2'],
+            {'g1': 'max', 'g2': 'min'},
+            {'g1': {'indifference': 1.0, 'preference': 2.0}, 'g2': {'veto': 5.0}},
+            {'g1': 0.25, 'g2': 0.75},
+        )
+        self.assertEqual(params.keys(), ['g1', 'g2'])
+        self.assertEqual((params['g1'].direction, params['g1'].preference, params['g1'].veto),
+                         (1, 2.0, None))
+        self.assertEqual((params['g2'].direction, params['g2'].veto, params['g2'].weight),
+                         (-1, 5.0, 0.75))
+        self.assertRaises(RuntimeError, get_criteria_params, ['g1'], {'g1': 'up'}, {'g1': {}})
+
+
+class TestPerformanceTable(unittest.TestCase):
+
+    def test_get_performance_table(self):
+        xmltree = etree.fromstring(
+            '<xmcda><performanceTable>'
+            '<alternativePerformances><alternativeID>a2</alternativeID>'
+            '<performance><criterionID>g1</criterionID><value><real>1.5</real></value></performance>'
+            '<performance><criterionID>g2</criterionID><value><label>x</label></value></performance>'
+            '</alternativePerformances>'
+            '<alternativePerformances><alternativeID>a1</alternativeID>'
+            '<performance><criterionID>g1</criterionID><value><integer>3</integer></value></performance>'
+            '</alternativePerformances>'
+            '</performanceTable></xmcda>'
+        )
+        performances, missing = get_performance_table(xmltree, ['a1', 'a2'], ['g1', 'g2'])
+        self.assertEqual(performances['a1']['g1'], 3.0)
+        self.assertEqual(performances['a2']['g1'], 1.5)
+        self.assertNotEqual(performances['a1']['g2'], performances['a1']['g2'])  # NaN
+        self.assertEqual(sorted(missing), [('a1', 'g2'), ('a2', 'g2')])
+        self.assertRaises(RuntimeError, check_performance_table, missing, 'performanceTable.xml')
+        performances, missing = get_performance_table(xmltree, criteria=['g1'])
+        self.assertEqual((list(performances), missing), (['a2', 'a1'], []))
+
+
+class TestCutThresholds(unittest.TestCase):
+
+    def get_tree(self, parameters):
+        return etree.fromstring('<xmcda><methodParameters>%s</methodParameters></xmcda>' % ''.join(
+            '<parameter name="%s"><value><real>%s</real></value></parameter>' % p
+            for p in parameters
+        ))
+
+    def get_range(self, start, stop, step):
+        return get_cut_thresholds(self.get_tree([
+            ('cut_threshold_min', start), ('cut_threshold_max', stop), ('cut_threshold_step', step),
+        ]))
+
+    def test_range(self):
+        self.assertEqual(self.get_range(0.5, 1.0, 0.25), [0.5, 0.75, 1.0])
+        self.assertEqual(self.get_range(0.3, 0.9, 0.2), [0.3, 0.5, 0.7, 0.9])
+        self.assertEqual(self.get_range(0.7, 0.7, 0.1), [0.7])
+
+    def test_range_not_whole_number_of_steps(self):
+        self.assertEqual(self.get_range(0.6, 0.9, 0.2), [0.6, 0.8])
+        self.assertEqual(self.get_range(0.5, 1.0, 0.3), [0.5, 0.8])
+        self.assertEqual(self.get_range(0.0, 1.0, 0.7), [0.0, 0.7])
+
+    def test_invalid(self):
+        self.assertRaises(RuntimeError, self.get_range, 0.9, 0.5, 0.1)
+        self.assertRaises(RuntimeError, self.get_range, 0.5, 0.9, 0.0)
+        self.assertRaises(RuntimeError, self.get_range, 0.5, 1.5, 0.5)
+        # thresholds rounded to the same value
+        self.assertRaises(RuntimeError, self.get_range, 0.5, 0.5 + 1e-11, 1e-12)
+
+    def test_list(self):
+        xml = (
+            '<xmcda><methodParameters><parameters name="cut_thresholds">'
+            '<parameter><value><real>0.6</real></value></parameter>'
+            '<parameter><value><real>%s</real></value></parameter>'
+            '</parameters></methodParameters></xmcda>'
+        )
+        self.assertEqual(get_cut_thresholds(etree.fromstring(xml % 0.8)), [0.6, 0.8])
+        self.assertRaises(RuntimeError, get_cut_thresholds, etree.fromstring(xml % 0.6))
+        self.assertEqual(get_cut_thresholds(self.get_tree([('cut_threshold', 0.6)])), None)
+
+
+class TestTimings(unittest.TestCase):
+
+    def tearDown(self):
+        start_timings(None)
+
+    def test_nested_phases(self):
+        start_timings('xmcda')
+        with timed('input'):
+            with timed('parse'):
+                sum(range(100000))
+        with timed('write'):
+            pass
+        timings = get_timings()
+        self.assertEqual(timings.keys(), ['parse', 'input', 'compute', 'write', 'total'])
+        # time spent on parsing is not counted for reading the input data
+        self.assertLess(sum(t['wall_time'] for p, t in timings.items() if p != 'total'),
+                        timings['total']['wall_time'] + 1e-6)
+        self.assertTrue(timings_to_messages(timings)[0].startswith('timing phase=parse '))
+        self.assertRaises(RuntimeError, start_timings, 'csv')
+        start_timings(None)
+        self.assertIsNone(get_timings())
+
+    def test_peak_memory(self):
+        start_timings('json')
+        with timed('input'):
+            # surely more than the peak so far (in KB), so the peak grows
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            data = bytearray((peak + 10 * 1024) * 1024)
+            with timed('parse'):
+                pass
+        del data
+        with timed('write'):
+            pass
+        timings = get_timings()
+        increases = dict((p, t['peak_rss_increase_kb']) for p, t in timings.items())
+        self.assertGreater(increases['input'], 10 * 1024)
+        # nothing more was needed later, so the other phases didn't raise the peak
+        self.assertEqual((increases['parse'], increases['write']), (0, 0))
+        self.assertEqual(sum(v for p, v in increases.items() if p != 'total'),
+                         increases['total'])
+        self.assertGreaterEqual(timings['total']['peak_rss_kb'], peak + increases['total'])
+
+
+class TestOutputFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.output_dir, 'concordance.xml')
+        self.comparisons = OrderedDict([('a01', OrderedDict([('p01', 2.0 / 3), ('p02', 1)]))])
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        set_output_format(None, None)
+        set_compression(None)
+
+    def write(self, digits, layout):
+        set_output_format(digits, layout)
+        write_xmcda(comparisons_to_xmcda(self.comparisons), self.file_name)
+        with open(self.file_name) as f:
+            return f.read()[len(HEADER):]
+
+    def test_digits_and_layouts(self):
+        self.assertIn('  <pairs>\n    <pair>', self.write(None, None))
+        self.assertIn('<real>0.666666666667</real>', self.write(None, None))
+        body = self.write('3', 'compact')
+        self.assertIn('<value>\n<real>0.667</real>\n</value>\n</pair>\n<pair>\n', body)
+        self.assertIn('<real>1</real>', body)
+        self.assertNotIn('\n', self.write(3, 'none'))
+        self.assertRaises(RuntimeError, set_output_format, '0', None)
+        self.assertRaises(RuntimeError, set_output_format, 'x', None)
+        self.assertRaises(RuntimeError, set_output_format, None, 'pretty')
+
+    def test_compression(self):
+        plain = self.write(None, None)
+        set_compression('gzip', '9')
+        write_xmcda(comparisons_to_xmcda(self.comparisons), self.file_name)
+        compressed = self.file_name + '.gz'
+        # the uncompressed file is replaced with the compressed one
+        self.assertEqual(os.listdir(self.output_dir), ['concordance.xml.gz'])
+        self.assertEqual(find_input_file(self.output_dir, 'concordance.xml'), compressed)
+        with open(compressed, 'rb') as f:
+            data = f.read()
+        self.assertEqual(decompress(data), HEADER + plain)
+        self.assertEqual(decompress(HEADER), HEADER)
+        self.assertRaises(RuntimeError, set_compression, 'gzip', '10')
+        self.assertRaises(RuntimeError, set_compression, 'bzip2')
+        self.assertRaises(RuntimeError, set_compression, None, '1')
+
+    def test_reset_state(self):
+        plain = self.write(None, None)
+        set_output_format('3', 'none')
+        set_compression('gzip')
+        reset_state()
+        write_xmcda(comparisons_to_xmcda(self.comparisons), self.file_name)
+        with open(self.file_name) as f:
+            self.assertEqual(f.read(), HEADER + plain)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.argv = sys.argv
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        sys.argv = self.argv
+        os.environ.pop('ELECTRE_PROFILE', None)
+
+    def test_cprofile(self):
+        input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'ElectreIsFindKernel', 'tests', 'in')
+        sys.argv = ['ElectreIsFindKernel.py', '-i', input_dir, '-o', self.output_dir]
+        main_find_kernel()
+        self.assertEqual(os.listdir(self.output_dir), ['messages.xml'])
+        os.environ['ELECTRE_PROFILE'] = 'cprofile'
+        main_find_kernel()
+        profile = os.path.join(self.output_dir, 'ElectreIsFindKernel.prof')
+        self.assertTrue(pstats.Stats(profile).total_calls > 0)
+
+
+class TestPartialLookup(unittest.TestCase):
+
+    def test_lru(self):
+        calls = []
+
+        def compute(criterion, performance):
+            calls.append((criterion, performance))
+            return performance * 2
+
+        lookup = get_partial_lookup(compute, cache_size=2)
+        results = [lookup('g1', x) for x in (1, 2, 1, 3, 1, 2)]
+        self.assertEqual(results, [2, 4, 2, 6, 2, 4])
+        # '2' was the least recently used one when '3' came in
+        self.assertEqual(calls, [('g1', 1), ('g1', 2), ('g1', 3), ('g1', 2)])
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_script(script, *args):
+    # returns the exit code (the output, e.g. errors expected by a test, is
+    # discarded)
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call([sys.executable, script] + list(args), stdout=devnull,
+                               stderr=devnull)
+
+
+def read_files(directory):
+    files = {}
+    for file_name in os.listdir(directory):
+        with open(os.path.join(directory, file_name), 'rb') as f:
+            files[file_name] = f.read()
+    return files
+
+
+class ModuleRunTestCase(unittest.TestCase):
+    # for the tests running whole modules on their test inputs - the XMCDA
+    # schemas may not be available (e.g. without network access), so the
+    # validation is stubbed (which is inherited by the forked processes too)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.validate = px.validateXMCDA
+        px.validateXMCDA = lambda xmltree: True
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        px.validateXMCDA = self.validate
+        reset_state()
+
+
+class TestParsedTreesCache(ModuleRunTestCase):
+
+    def setUp(self):
+        super(TestParsedTreesCache, self).setUp()
+        self.cache_bytes = common.PARSED_TREES_CACHE_BYTES
+        common.PARSED_TREES_CACHE_BYTES = 2500
+
+    def tearDown(self):
+        common.PARSED_TREES_CACHE_BYTES = self.cache_bytes
+        super(TestParsedTreesCache, self).tearDown()
+
+    def write_file(self, name, size):
+        contents = '<{0}>{1}</{0}>'.format(name, 'x' * (size - 2 * len(name) - 5))
+        with open(os.path.join(self.tmp_dir, name + '.xml'), 'w') as f:
+            f.write(contents)
+
+    def get_tree(self, name):
+        return get_trees(self.tmp_dir, [name + '.xml'])[name]
+
+    def test_bounded_by_size(self):
+        for name, size in (('a', 1000), ('b', 1000), ('c', 1000), ('big', 3000)):
+            self.write_file(name, size)
+        a, b = self.get_tree('a'), self.get_tree('b')
+        self.assertIs(self.get_tree('a'), a)  # also the most recently used now
+        self.get_tree('c')  # doesn't fit along with the other two
+        self.assertIs(self.get_tree('a'), a)
+        self.assertIsNot(self.get_tree('b'), b)
+        # bigger than the whole cache, so not kept at all (nor evicting others)
+        self.get_tree('a')
+        big = self.get_tree('big')
+        self.assertIsNot(self.get_tree('big'), big)
+        self.assertIs(self.get_tree('a'), a)
+
+
+class TestDaemon(ModuleRunTestCase):
+
+    def setUp(self):
+        super(TestDaemon, self).setUp()
+        self.socket = os.path.join(self.tmp_dir, 'electre.sock')
+        self.server = Process(target=daemon.serve, args=(self.socket,))
+        self.server.start()
+        for _ in range(300):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.1)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.join()
+        super(TestDaemon, self).tearDown()
+
+    def call(self, *args):
+        return run_script(os.path.join(ROOT_DIR, 'daemon.py'), 'call', self.socket, *args)
+
+    def test_run(self):
+        module_name = 'ElectreTriConcordance'
+        input_dir = os.path.join(ROOT_DIR, module_name, 'tests', 'in')
+        output_dir = os.path.join(self.tmp_dir, 'out')
+        os.mkdir(output_dir)
+        self.assertEqual(self.call(module_name, '-i', input_dir, '-o', output_dir), 0)
+        self.assertEqual(read_files(output_dir),
+                         read_files(os.path.join(ROOT_DIR, module_name, 'tests', 'out')))
+        self.assertEqual(self.call('ElectreUnknown', '-i', input_dir, '-o', output_dir), 1)
+        # only the user running the server can connect
+        self.assertEqual(os.stat(self.socket).st_mode & 0o777, 0o600)
+
+
+class TestBatch(ModuleRunTestCase):
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.argv, self.stdout = sys.argv, sys.stdout
+
+    def tearDown(self):
+        sys.argv, sys.stdout = self.argv, self.stdout
+        super(TestBatch, self).tearDown()
+
+    def test_run(self):
+        module_name = 'ElectreTriConcordance'
+        input_dir = os.path.join(ROOT_DIR, module_name, 'tests', 'in')
+        expected = read_files(os.path.join(ROOT_DIR, module_name, 'tests', 'out'))
+        for jobs in ('1', '2'):
+            # the same problem twice, so the second job (in the same process, at
+            # least with a single worker) runs after the first one
+            output_dirs = [os.path.join(self.tmp_dir, jobs, d) for d in ('out1', 'out2')]
+            manifest = os.path.join(self.tmp_dir, 'manifest')
+            with open(manifest, 'w') as f:
+                f.write('# input, output\n\n')
+                for output_dir in output_dirs:
+                    f.write('{} {}\n'.format(input_dir, output_dir))
+            report = os.path.join(self.tmp_dir, 'report.json')
+            sys.argv = ['batch.py', '--jobs=' + jobs, '--report=' + report, module_name, manifest]
+            with open(os.devnull, 'w') as devnull:
+                sys.stdout = devnull  # the summary
+                exit_code = batch.main()
+                sys.stdout = self.stdout
+            self.assertEqual(exit_code, 0)
+            with open(report) as f:
+                results = json.load(f)['results']
+            self.assertEqual([(r['output_dir'], r['exit_code']) for r in results],
+                             [(output_dir, 0) for output_dir in output_dirs])
+            for output_dir in output_dirs:
+                self.assertEqual(read_files(output_dir), expected)
+
+
+class TestIncrementalMode(ModuleRunTestCase):
+    # module -> the input file changed between the previous and the current run
+    MODULES = OrderedDict([
+        ('ElectreIVCredibility', 'performanceTable.xml'),
+        ('ElectreIsDiscordanceBinary', 'performanceTable.xml'),
+        ('ElectreIsFindKernel', 'outranking.xml'),
+        ('ElectreIsOutrankingBinary', 'concordance.xml'),
+        ('ElectreTriCClassAssign', 'credibility.xml'),
+        ('ElectreTriCConcordance', 'performanceTable.xml'),
+        ('ElectreTriCCredibility', 'concordance.xml'),
+        ('ElectreTriCDiscordances', 'performanceTable.xml'),
+        ('ElectreTriCSimplifiedClassAssign', 'credibility.xml'),
+        ('ElectreTriClassAssign', 'credibility.xml'),
+        ('ElectreTriConcordance', 'performanceTable.xml'),
+        ('ElectreTriCredibility', 'concordance.xml'),
+        ('ElectreTriDiscordances', 'performanceTable.xml'),
+    ])
+
+    def setUp(self):
+        super(TestIncrementalMode, self).setUp()
+        self.argv = sys.argv
+
+    def tearDown(self):
+        sys.argv = self.argv
+        super(TestIncrementalMode, self).tearDown()
+
+    def change_input(self, input_dir, file_name):
+        # changes the first value following the second alternative's id (i.e. its
+        # performance, or a comparison involving it)
+        with open(os.path.join(input_dir, 'alternatives.xml')) as f:
+            alternative = re.findall(r'<alternative id="([^"]+)"', f.read())[1]
+        path = os.path.join(input_dir, file_name)
+        with open(path) as f:
+            data = f.read()
+        start = data.index('<real>', data.index('>{}<'.format(alternative))) + len('<real>')
+        end = data.index('</real>', start)
+        value = float(data[start:end])
+        value = value + 3 if file_name == 'performanceTable.xml' else 1 - value
+        with open(path, 'w') as f:
+            f.write(data[:start] + str(value) + data[end:])
+
+    def run_module(self, module_name, input_dir, output_dir, *args):
+        module = importlib.import_module('{0}.{0}'.format(module_name))
+        sys.argv = [module_name + '.py', '-i', input_dir, '-o', output_dir] + list(args)
+        os.mkdir(output_dir)
+        self.assertEqual(module.main(), 0, read_files(output_dir).get('messages.xml'))
+        return read_files(output_dir)
+
+    def test_same_as_full_run(self):
+        for module_name, file_name in self.MODULES.items():
+            tmp_dir = os.path.join(self.tmp_dir, module_name)
+            previous_input, current_input = [os.path.join(tmp_dir, d) for d in ('in1', 'in2')]
+            shutil.copytree(os.path.join(ROOT_DIR, module_name, 'tests', 'in'), previous_input)
+            shutil.copytree(previous_input, current_input)
+            self.change_input(current_input, file_name)
+            previous_output, full_output, output = [os.path.join(tmp_dir, d)
+                                                    for d in ('out1', 'out2', 'out3')]
+            self.run_module(module_name, previous_input, previous_output)
+            expected = self.run_module(module_name, current_input, full_output)
+            result = self.run_module(module_name, current_input, output,
+                                     '--previous-input=' + previous_input,
+                                     '--previous-output=' + previous_output)
+            for name in expected:
+                self.assertEqual(result[name], expected[name], (module_name, name))
+            self.assertEqual(sorted(result), sorted(expected))
+
 
 if __name__ == '__main__':
     unittest.main()